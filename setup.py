@@ -144,6 +144,7 @@ class ResourceFiles(Command):
     def run(self) -> None:
         check_call([sys.executable, "util/create_vm_sizes.py"])
         shutil.move("new_vm_sizes.json", "src/hpc/autoscale/node/vm_sizes.json")
+        shutil.move("new_vm_sizes.catalog", "src/hpc/autoscale/node/vm_sizes.catalog")
 
 
 class AutoDoc(Command):
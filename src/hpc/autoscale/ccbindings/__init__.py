@@ -6,6 +6,10 @@ def new_cluster_bindings(config: dict,) -> ClusterBindingInterface:
     if config.get("_mock_bindings"):
         return config["_mock_bindings"]
     from hpc.autoscale.ccbindings import legacy
+    from hpc.autoscale.ccbindings.httpsession import (
+        HTTPConfig,
+        configure_wrapped_sessions,
+    )
     from cyclecloud.client import Client
 
     cluster_name = hpctypes.ClusterName(config["cluster_name"])
@@ -16,6 +20,9 @@ def new_cluster_bindings(config: dict,) -> ClusterBindingInterface:
     if read_only is None:
         read_only = False
 
+    # pooling, timeouts and retries for the requests made by the cyclecloud client
+    configure_wrapped_sessions(cluster._client.session, HTTPConfig(config))
+
     return legacy.ClusterBinding(
         config, cluster._client.session, cluster._client, read_only=read_only
     )
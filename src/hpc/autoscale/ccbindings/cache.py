@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import hpc.autoscale.hpclogging as logging
+
+_CACHE_FORMAT_VERSION = 1
+
+
+class ClusterStatusCache:
+    """
+    Local on disk cache of the last cluster status / node list payloads, so that
+    read only commands and shell completion do not have to wait on CycleCloud.
+
+    Configured via the cluster_status_cache section of the autoscale config:
+
+        "cluster_status_cache": {
+            "ttl": 30,
+            "max_stale": 300,
+            "path": "~/.cache/cyclecloud-scalelib/cluster_status_{cluster}.json"
+        }
+
+    ttl - entries younger than this many seconds are served from the cache.
+    max_stale - if CycleCloud can not be reached, entries up to this many
+                seconds old are served instead of failing. Defaults to ttl.
+    """
+
+    def __init__(
+        self, path: str, ttl: float, max_stale: Optional[float] = None
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = ttl if max_stale is None else max(ttl, max_stale)
+
+    def get(self, key: str, stale: bool = False) -> Optional[Dict]:
+        """
+        Returns the cached payload for key, if it is younger than the ttl (or
+        max_stale, if stale=True). Otherwise None.
+        """
+        entry = self._read().get(key)
+        if not entry:
+            return None
+
+        age = self.now() - entry["time"]
+        max_age = self.max_stale if stale else self.ttl
+        if age < 0 or age > max_age:
+            return None
+
+        logging.debug("Using cached %s from %.1f seconds ago", key, age)
+        return entry["payload"]
+
+    def age(self, key: str) -> Optional[float]:
+        entry = self._read().get(key)
+        if not entry:
+            return None
+        return self.now() - entry["time"]
+
+    def put(self, key: str, payload: Dict) -> None:
+        entries = self._read()
+        entries[key] = {"time": self.now(), "payload": payload}
+        self._write(entries)
+
+    def invalidate(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(
+                "Could not remove cluster status cache %s: %s", self.path, e
+            )
+
+    def now(self) -> float:
+        return time.time()
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as fr:
+                contents = json.load(fr)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(
+                "Ignoring unreadable cluster status cache %s: %s", self.path, e
+            )
+            return {}
+
+        if (
+            not isinstance(contents, dict)
+            or contents.get("version") != _CACHE_FORMAT_VERSION
+        ):
+            return {}
+        return contents.get("entries", {})
+
+    def _write(self, entries: Dict[str, Any]) -> None:
+        parent = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(parent, exist_ok=True)
+            # write to a temp file and rename it, so that readers never see a
+            # partially written cache.
+            fd, temp_path = tempfile.mkstemp(dir=parent, prefix=".cluster_status")
+            try:
+                with os.fdopen(fd, "w") as fw:
+                    json.dump(
+                        {"version": _CACHE_FORMAT_VERSION, "entries": entries}, fw
+                    )
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError as e:
+            logging.warning("Could not write cluster status cache %s: %s", self.path, e)
+
+    def __repr__(self) -> str:
+        return "ClusterStatusCache({}, ttl={}, max_stale={})".format(
+            self.path, self.ttl, self.max_stale
+        )
+
+
+def new_cluster_status_cache(config: Dict) -> Optional[ClusterStatusCache]:
+    """
+    Returns None unless the cluster_status_cache section of the config sets a
+    positive ttl.
+    """
+    cache_config = config.get("cluster_status_cache") or {}
+    ttl = float(cache_config.get("ttl", 0))
+    if ttl <= 0:
+        return None
+
+    default_path = os.path.join(
+        "~", ".cache", "cyclecloud-scalelib", "cluster_status_{cluster}.json"
+    )
+    path = cache_config.get("path") or default_path
+    path = os.path.expanduser(path.format(cluster=config.get("cluster_name", "")))
+
+    max_stale = cache_config.get("max_stale")
+    return ClusterStatusCache(
+        path, ttl, float(max_stale) if max_stale is not None else None
+    )
@@ -0,0 +1,166 @@
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import hpc.autoscale.hpclogging as logging
+
+# retrying a POST (e.g. create_nodes) could create nodes twice.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class HTTPConfig:
+    """
+    Connection pooling, timeouts and retries for requests to CycleCloud, from
+    the http section of the autoscale config:
+
+        "http": {
+            "pool_size": 10,
+            "connect_timeout": 10,
+            "read_timeout": 120,
+            "retries": 3,
+            "backoff_factor": 0.5
+        }
+
+    Retries use exponential backoff (backoff_factor * 2^retry seconds) and only
+    apply to idempotent requests.
+    """
+
+    def __init__(self, config: Dict) -> None:
+        http_config = config.get("http") or {}
+        self.pool_size = int(http_config.get("pool_size", 10))
+        self.connect_timeout = float(http_config.get("connect_timeout", 10))
+        self.read_timeout = float(http_config.get("read_timeout", 120))
+        self.retries = int(http_config.get("retries", 3))
+        self.backoff_factor = float(http_config.get("backoff_factor", 0.5))
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+    def new_retry(self) -> Retry:
+        kwargs: Dict[str, Any] = dict(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        try:
+            return Retry(allowed_methods=IDEMPOTENT_METHODS, **kwargs)
+        except TypeError:
+            # urllib3 < 1.26
+            return Retry(method_whitelist=IDEMPOTENT_METHODS, **kwargs)  # type: ignore
+
+    def __repr__(self) -> str:
+        return (
+            "HTTPConfig(pool_size={}, timeout={}, retries={}, backoff_factor={})"
+        ).format(self.pool_size, self.timeout, self.retries, self.backoff_factor)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    requests has no session wide timeout, so apply a default one to every
+    request that does not set its own.
+    """
+
+    def __init__(self, timeout: Tuple[float, float], **kwargs: Any) -> None:
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request: Any, **kwargs: Any) -> Any:  # type: ignore
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def configure_session(session: requests.Session, config: HTTPConfig) -> None:
+    adapter = TimeoutHTTPAdapter(
+        config.timeout,
+        pool_connections=config.pool_size,
+        pool_maxsize=config.pool_size,
+        max_retries=config.new_retry(),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def configure_wrapped_sessions(wrapper: Any, http_config: HTTPConfig) -> bool:
+    """
+    Configures any requests.Session held by wrapper, e.g. the cyclecloud
+    client's session. Returns False if there were none.
+    """
+    found = False
+    for value in list(vars(wrapper).values()):
+        if isinstance(value, requests.Session):
+            configure_session(value, http_config)
+            found = True
+    if not found:
+        logging.debug(
+            "Could not find a requests.Session in %s - using its defaults",
+            type(wrapper).__name__,
+        )
+    return found
+
+
+class ApiLatency:
+    """
+    Latency of each CycleCloud API call, by name.
+    """
+
+    def __init__(self) -> None:
+        self.__stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, elapsed: float) -> None:
+        if name not in self.__stats:
+            self.__stats[name] = {"count": 0, "total": 0.0, "max": 0.0}
+        stats = self.__stats[name]
+        stats["count"] += 1
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+        logging.debug("%s took %.3fs", name, elapsed)
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        def timed_func(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        return timed_func
+
+    def get(self, name: str) -> Optional[Dict[str, float]]:
+        return self.__stats.get(name)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        ret = {}
+        for name, stats in self.__stats.items():
+            ret[name] = dict(stats)
+            ret[name]["mean"] = stats["total"] / stats["count"]
+        return ret
+
+    def __repr__(self) -> str:
+        return "ApiLatency({})".format(self.to_dict())
+
+
+class TimedModule:
+    """
+    Wraps a module of API functions (e.g. cyclecloud.api.clusters) so that the
+    latency of every call is recorded.
+    """
+
+    def __init__(self, module: Any, latency: ApiLatency) -> None:
+        self.__module = module
+        self.__latency = latency
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self.__module, name)
+        if callable(value):
+            return self.__latency.timed(name, value)
+        return value
@@ -11,6 +11,7 @@ import cyclecloud.api.clusters
 import cyclecloud.session
 import requests
 import urllib3
+from cyclecloud.model.ClusterStatusModule import ClusterStatus
 from cyclecloud.model.NodeCreationRequestModule import NodeCreationRequest
 from cyclecloud.model.NodeCreationRequestSetDefinitionModule import (
     NodeCreationRequestSetDefinition,
@@ -27,6 +28,13 @@ from urllib3.exceptions import InsecureRequestWarning
 
 import hpc.autoscale.hpclogging as logging
 from hpc.autoscale import hpctypes as ht
+from hpc.autoscale.ccbindings.cache import new_cluster_status_cache
+from hpc.autoscale.ccbindings.httpsession import (
+    ApiLatency,
+    HTTPConfig,
+    TimedModule,
+    configure_session,
+)
 from hpc.autoscale.ccbindings.interface import ClusterBindingInterface
 from hpc.autoscale.ccbindings.mock import _node_to_ccnode
 from hpc.autoscale.codeanalysis import hpcwrap, hpcwrapclass
@@ -65,11 +73,17 @@ class ClusterBinding(ClusterBindingInterface):
         self.__cluster_name = config["cluster_name"]
         self.session = session
         self.client = client
-        self.clusters_module: cyclecloud.api.clusters = cyclecloud.api.clusters
-        if clusters_module:
-            self.clusters_module = clusters_module  # type: ignore
+        # latency of every call to CycleCloud, by api function name
+        self.api_latency = ApiLatency()
+        self.clusters_module: cyclecloud.api.clusters = TimedModule(  # type: ignore
+            clusters_module or cyclecloud.api.clusters, self.api_latency
+        )
         self.read_only = read_only
         self._read_only_nodes: Dict[ht.OperationId, List[Dict]] = {}
+        # see ClusterStatusCache - only read only commands are served from the
+        # cache, unless a fresh read is forced (autoscale, even in dry run mode)
+        self._status_cache = new_cluster_status_cache(config)
+        self._force_refresh = bool(config.get("_cluster_status_refresh", False))
 
     @property
     def cluster_name(self) -> ht.ClusterName:
@@ -151,6 +165,7 @@ class ClusterBinding(ClusterBindingInterface):
         )
 
         self._log_response(http_response, result)
+        self._invalidate_cache()
 
         return result
 
@@ -176,12 +191,20 @@ class ClusterBinding(ClusterBindingInterface):
             self.session, self.cluster_name, request
         )
         self._log_response(http_response, result)
+        self._invalidate_cache()
         return result
 
     @hpcwrap
     def get_cluster_status(self, nodes: bool = False) -> cyclecloud.model.ClusterStatus:
-        http_response, result = self.clusters_module.get_cluster_status(
-            self.session, self.cluster_name, nodes
+        def fetch_cluster_status() -> ClusterStatus:
+            http_response, result = self.clusters_module.get_cluster_status(
+                self.session, self.cluster_name, nodes
+            )
+            return result
+
+        cache_key = "cluster_status_with_nodes" if nodes else "cluster_status"
+        result = self._cached_fetch(
+            cache_key, fetch_cluster_status, ClusterStatus.from_dict
         )
         if self.read_only and nodes:
             for nodes_list in self._read_only_nodes.values():
@@ -202,12 +225,54 @@ class ClusterBinding(ClusterBindingInterface):
                     nodes.extend(sub_list)
             return NodeList(nodes=nodes)
 
-        http_response, result = self.clusters_module.get_nodes(
-            self.session, self.cluster_name, operation_id, request_id
-        )
-        self._log_response(http_response, result)
+        def fetch_nodes() -> NodeList:
+            http_response, result = self.clusters_module.get_nodes(
+                self.session, self.cluster_name, operation_id, request_id
+            )
+            self._log_response(http_response, result)
+            return result
+
+        if operation_id or request_id:
+            return fetch_nodes()
+        return self._cached_fetch("nodes", fetch_nodes, NodeList.from_dict)
+
+    def _cached_fetch(
+        self, cache_key: str, fetch: Callable[[], Any], from_dict: Callable[[Dict], Any]
+    ) -> Any:
+        if not self._status_cache:
+            return fetch()
+
+        use_cache = self.read_only and not self._force_refresh
+        if use_cache:
+            payload = self._status_cache.get(cache_key)
+            if payload is not None:
+                return from_dict(payload)
+
+        try:
+            result = fetch()
+        except Exception as e:
+            if not use_cache:
+                raise
+            payload = self._status_cache.get(cache_key, stale=True)
+            if payload is None:
+                raise
+            logging.warning(
+                "Could not get %s from CycleCloud (%s)"
+                + " - using the copy cached %.0f seconds ago",
+                cache_key,
+                e,
+                self._status_cache.age(cache_key) or 0,
+            )
+            return from_dict(payload)
+
+        self._status_cache.put(cache_key, result.to_dict())
         return result
 
+    def _invalidate_cache(self) -> None:
+        # anything that changes nodes makes the cached cluster status stale.
+        if self._status_cache:
+            self._status_cache.invalidate()
+
     @notreadonly
     def remove_nodes(
         self,
@@ -230,6 +295,7 @@ class ClusterBinding(ClusterBindingInterface):
             self.session, self.cluster_name, request
         )
         self._log_response(http_response, result)
+        self._invalidate_cache()
         return result
 
     @notreadonly
@@ -248,6 +314,7 @@ class ClusterBinding(ClusterBindingInterface):
             total_node_count,
         )
         self._log_response(http_response, result)
+        self._invalidate_cache()
         return result
 
     @notreadonly
@@ -273,6 +340,7 @@ class ClusterBinding(ClusterBindingInterface):
         )
 
         self._log_response(http_response, result)
+        self._invalidate_cache()
         return result
 
     @hpcwrap
@@ -344,6 +412,7 @@ class ClusterBinding(ClusterBindingInterface):
             self.session, self.cluster_name, request
         )
         self._log_response(http_response, result)
+        self._invalidate_cache()
         return result
 
     @notreadonly
@@ -368,6 +437,7 @@ class ClusterBinding(ClusterBindingInterface):
             self.session, self.cluster_name, request
         )
         self._log_response(http_response, result)
+        self._invalidate_cache()
         return result
 
     @notreadonly
@@ -393,7 +463,9 @@ class ClusterBinding(ClusterBindingInterface):
         _responses.append((200, "object", lambda v: v))
 
         _status: cyclecloud.session.ResponseStatus
-        _status, _response = self.session.request(
+        _status, _response = self.api_latency.timed(
+            "retry_failed_nodes", self.session.request
+        )(
             _request_context,
             "POST",
             query=_query,
@@ -401,6 +473,7 @@ class ClusterBinding(ClusterBindingInterface):
             body=_body,
             expected_responses=_responses,
         )
+        self._invalidate_cache()
         if _status.status_code < 200 or _status.status_code > 299:
             raise RuntimeError(
                 "Attempt to retry failed nodes did not succeed: %s" % _response
@@ -502,8 +575,8 @@ def _get_session(config: Dict) -> requests.sessions.Session:
 
                 s = requests.session()
                 s.auth = (config["username"], config["password"])
-                # TODO apparently this does nothing...
-                # s.timeout = config["cycleserver"]["timeout"]
+                # pooling, timeouts and retries - see HTTPConfig
+                configure_session(s, HTTPConfig(config))
                 s.verify = config[
                     "verify_certificates"
                 ]  # Should we auto-accept unrecognized certs?
@@ -32,6 +32,7 @@ from hpc.autoscale.results import (
     DefaultContextHandler,
     EarlyBailoutResult,
     MatchResult,
+    new_context_handler,
     register_result_handler,
 )
 from hpc.autoscale.util import (
@@ -388,7 +389,7 @@ class CommonCLI(ABC):
         return dcalc
 
     def _ctx_handler(self, config: Dict) -> DefaultContextHandler:
-        return DefaultContextHandler("[{}]".format(self.project_name))
+        return new_context_handler("[{}]".format(self.project_name), config)
 
     def autoscale_parser(self, parser: ArgumentParser) -> None:
         parser.set_defaults(read_only=False)
@@ -406,6 +407,9 @@ class CommonCLI(ABC):
         """End-to-end autoscale process, including creation, deletion and joining of nodes."""
         output_columns = output_columns or self._get_default_output_columns(config)
 
+        # never act on a cached cluster status, even in dry run mode
+        config["_cluster_status_refresh"] = True
+
         if dry_run:
             logging.warning("Running gridengine autoscaler in dry run mode")
             # allow multiple instances
@@ -134,6 +134,46 @@ __CALL_ID = 10000
 __INSTANCE_ID = time.time()
 
 
+class _LazyArgs:
+    """
+    Formats the arguments of an apitraced call only if a record is emitted.
+    """
+
+    def __init__(
+        self, param_names: List[str], args: Iterable[Any], kwargs: Dict[str, Any]
+    ) -> None:
+        self.param_names = param_names
+        self.args = args
+        self.kwargs = kwargs
+        self.__formatted: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.__formatted is None:
+            arg_strs: List[str] = []
+            for arg_name, arg_value in _named_args(self.param_names, self.args):
+                if arg_name != "self":
+                    arg_strs.append("{}={}".format(arg_name, repr(arg_value)))
+
+            for arg_name, arg_value in self.kwargs.items():
+                arg_strs.append("{}={}".format(arg_name, repr(arg_value)))
+            self.__formatted = ", ".join(arg_strs)
+        return self.__formatted
+
+
+class _LazyRepr:
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __str__(self) -> str:
+        return repr(self.value)
+
+
+def _named_args(param_names: List[str], args: Iterable[Any]) -> Iterable[Any]:
+    for n, arg_value in enumerate(args):
+        # extra positional args are all named after the last param (*args)
+        yield param_names[min(n, len(param_names) - 1)], arg_value
+
+
 def apitrace(
     function: Callable,
     repro_level: bool = True,
@@ -147,75 +187,74 @@ def apitrace(
     if hasattr(function, "is_apitraced"):
         return function
 
+    # computed once, rather than on every call
+    try:
+        param_names = list(inspect.signature(function).parameters.keys()) or ["arg"]
+    except (TypeError, ValueError):
+        param_names = ["arg"]
+    root_logger = logging.getLogger()
+
     def apitrace_wrapper(*args: Any, **kwargs: Any) -> Any:
+        root_level = root_logger.getEffectiveLevel()
+        trace_enabled = trace_level and root_level <= TRACE
+        fine_enabled = fine_level and root_level <= FINE
+        repro_enabled = repro_level and _REPRO_LOGGER.getEffectiveLevel() <= REPRO
+
+        if not (trace_enabled or fine_enabled or repro_enabled):
+            return function(*args, **kwargs)
+
         global __CALL_ID
         call_id = "invoke-{}".format(__CALL_ID)
         __CALL_ID += 1
         instance_id = "inst-{}".format(__INSTANCE_ID)
 
-        sig = inspect.signature(function)
-        arg_strs: List[str] = []
-        param_names = list(sig.parameters.keys())
-        self_arg = None
-        args_dict = {}
-
-        for n in range(len(args)):
-            arg_name = param_names[min(n, len(param_names) - 1)]
-            arg_value = args[n]
-            args_dict[arg_name] = arg_value
-
-            if arg_name == "self":
-                if function.__name__ != "__init__":
-                    self_arg = arg_value
-                else:
-                    self_arg = "__init__"
-            else:
-                arg_strs.append("{}={}".format(arg_name, repr(arg_value)))
-
-        args_dict.update(kwargs)
+        arg_strs = _LazyArgs(param_names, args, kwargs)
 
-        for arg_name, arg_value in kwargs.items():
-            arg_strs.append("{}={}".format(arg_name, repr(arg_value)))
+        if trace_enabled:
+            self_arg = None
+            if args and param_names[0] == "self":
+                self_arg = args[0] if function.__name__ != "__init__" else "__init__"
 
-        if trace_level:
             trace(
                 "TRACE_ENTER: [%s] [%s] %s invoke %s(%s)",
                 instance_id,
                 call_id,
                 self_arg or "function",
                 function.__name__,
-                ", ".join(arg_strs),
+                arg_strs,
             )
 
-        if fine_level:
+        if fine_enabled:
             fine(
                 "ENTER: [%s] [%s] %s(%s)",
                 instance_id,
                 call_id,
                 function.__name__,
-                ", ".join(arg_strs),
+                arg_strs,
             )
 
         ret_val = function(*args, **kwargs)
-        if trace_level:
+        if trace_enabled:
             trace(
                 "TRACE_EXIT: [%s] [%s] %s(...) -> %s",
                 instance_id,
                 call_id,
                 function.__name__,
-                repr(ret_val),
+                _LazyRepr(ret_val),
             )
 
-        if fine_level:
+        if fine_enabled:
             fine(
                 "EXIT: [%s] [%s] %s(...) -> %s",
                 instance_id,
                 call_id,
                 function.__name__,
-                repr(ret_val),
+                _LazyRepr(ret_val),
             )
 
-        if repro_level:
+        if repro_enabled:
+            args_dict = dict(_named_args(param_names, args))
+            args_dict.update(kwargs)
             reprolog(function, args_dict, ret_val)
 
         return ret_val
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
 
 import hpc.autoscale.hpclogging as logging
 from hpc.autoscale.codeanalysis import hpcwrapclass
@@ -8,6 +8,12 @@ from hpc.autoscale.job.demand import DemandResult
 from hpc.autoscale.job.job import Job, PackingStrategy
 from hpc.autoscale.job.nodequeue import NodeQueue
 from hpc.autoscale.job.schedulernode import SchedulerNode
+from hpc.autoscale.node.constraints import (
+    ExclusiveNode,
+    NodeConstraint,
+    constraint_cache,
+    constraints_signature,
+)
 from hpc.autoscale.node.node import Node
 from hpc.autoscale.node.nodehistory import (
     NodeHistory,
@@ -15,7 +21,14 @@ from hpc.autoscale.node.nodehistory import (
     SQLiteNodeHistory,
 )
 from hpc.autoscale.node.nodemanager import NodeManager, new_node_manager
-from hpc.autoscale.results import AllocationResult, BootupResult, DeleteResult, Result
+from hpc.autoscale.results import (
+    AllocationResult,
+    BootupResult,
+    DeleteResult,
+    Reason,
+    Reasons,
+    Result,
+)
 from hpc.autoscale.util import (
     NullSingletonLock,
     SingletonLock,
@@ -74,8 +87,50 @@ class DemandCalculator:
 
     @apitrace
     def add_jobs(self, jobs: List[Job]) -> None:
-        for job in jobs:
-            self._add_job(job)
+        # Capacity only shrinks while adding jobs, so once a job could not be
+        # allocated, every later job of the same shape that asks for at least
+        # as much will fail as well. Smaller requests are still attempted, as
+        # e.g. an all or nothing job may fit when a larger one did not.
+        # Jobs are still allocated one at a time and in order, so assignments
+        # and the resulting demand are the same as calling add_job for each.
+        # Skipped jobs still get their own failed result, so that result
+        # handlers see every job.
+        unsatisfiable: Dict[Hashable, Tuple[int, Result]] = {}
+
+        with constraint_cache():
+            for job in jobs:
+                shape = _job_shape(job)
+                request = _job_request(job)
+
+                if (
+                    shape is not None
+                    and shape in unsatisfiable
+                    and request >= unsatisfiable[shape][0]
+                ):
+                    failed = unsatisfiable[shape][1]
+                    logging.fine(
+                        "Skipping job %s: a job with the same shape failed: %s",
+                        job.name,
+                        failed,
+                    )
+                    AllocationResult(
+                        "Failed",
+                        reasons=[
+                            Reason(
+                                "Skipped {}: a job with the same shape could not"
+                                " be allocated",
+                                job.name,
+                            ),
+                            *failed.raw_reasons,
+                        ],
+                    )
+                    continue
+
+                result = self._add_job(job)
+
+                if shape is not None and not result:
+                    if shape not in unsatisfiable or request < unsatisfiable[shape][0]:
+                        unsatisfiable[shape] = (request, result)
 
     @apitrace
     def add_job(self, job: Job) -> None:
@@ -162,13 +217,13 @@ class DemandCalculator:
 
     def _handle_allocate(
         self, job: Job, allocated_nodes_out: List[Node], all_or_nothing: bool,
-    ) -> Optional[List[str]]:
+    ) -> Reasons:
         result = job.do_allocate(
             self.node_mgr, all_or_nothing=all_or_nothing, allow_existing=True,
         )
 
         if not result:
-            return result.reasons
+            return result.raw_reasons
 
         for node in result.nodes:
             if not node.exists and node.metadata.get("__demand_allocated") is None:
@@ -386,6 +441,35 @@ class DemandCalculator:
         return ret
 
 
+def _job_shape(job: Job) -> Optional[Hashable]:
+    """
+    Jobs with the same shape compete for exactly the same nodes. Returns None
+    for jobs that can not be grouped - i.e. their constraints depend on the job
+    itself (exclusive_task) or on shared state (e.g. shared resources).
+    """
+    to_visit: List[NodeConstraint] = list(job._constraints)
+    while to_visit:
+        constraint = to_visit.pop()
+        if isinstance(constraint, ExclusiveNode) and not constraint.job_exclusive:
+            return None
+        to_visit.extend(constraint.get_children())
+
+    signature = constraints_signature(job._constraints)
+    if signature is None:
+        return None
+
+    return (job.packing_strategy, job.colocated, job.node_count, signature)
+
+
+def _job_request(job: Job) -> int:
+    """
+    How much a job asks for: its node count, or the slots it still needs.
+    """
+    if job.node_count > 0:
+        return job.node_count
+    return job.iterations_remaining
+
+
 @apitrace
 def new_demand_calculator(
     config: Union[str, dict],
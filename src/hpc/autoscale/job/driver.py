@@ -8,7 +8,11 @@ from hpc.autoscale.job.job import Job
 from hpc.autoscale.job.nodequeue import NodeQueue
 from hpc.autoscale.job.schedulernode import SchedulerNode
 from hpc.autoscale.node.node import Node
-from hpc.autoscale.node.nodehistory import NodeHistory, SQLiteNodeHistory
+from hpc.autoscale.node.nodehistory import (
+    MemoryNodeHistory,
+    NodeHistory,
+    SQLiteNodeHistory,
+)
 from hpc.autoscale.node.nodemanager import NodeManager
 from hpc.autoscale.util import (
     NullSingletonLock,
@@ -138,7 +142,23 @@ class SchedulerDriver(ABC):
             db_path = os.path.join(self.autoscale_home, "nodehistory.db")
 
         read_only = config.get("read_only", False)
-        self.__node_history = SQLiteNodeHistory(db_path, read_only)
+        backend = config.get("nodehistory_backend", "sqlite")
+
+        if backend == "memory" and not read_only:
+            # for long running processes that own the history. Read only
+            # commands still read its snapshots through sqlite.
+            self.__node_history = MemoryNodeHistory(
+                db_path,
+                snapshot_interval=config.get("nodehistory_snapshot_interval", 60),
+            )
+        elif backend in ["sqlite", "memory"]:
+            self.__node_history = SQLiteNodeHistory(db_path, read_only)
+        else:
+            raise RuntimeError(
+                "Unknown nodehistory_backend {} - expected sqlite or memory".format(
+                    backend
+                )
+            )
 
         return self.__node_history
 
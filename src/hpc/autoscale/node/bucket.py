@@ -1,18 +1,19 @@
+import heapq
 import typing
+from bisect import bisect_left, insort
 from copy import deepcopy
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from immutabledict import ImmutableOrderedDict
 
 from hpc.autoscale import hpctypes as ht
 from hpc.autoscale import util
-from hpc.autoscale.codeanalysis import hpcwrapclass
+from hpc.autoscale.codeanalysis import RUNTIME_TYPE_CHECKING, hpcwrapclass
 from hpc.autoscale.hpctypes import PlacementGroup
 from hpc.autoscale.node import constraints as constraintslib  # noqa: F401
 from hpc.autoscale.node.delayednodeid import DelayedNodeId
 from hpc.autoscale.node.limits import BucketLimits, _SharedLimit
-from hpc.autoscale.results import CandidatesResult, Result
-from hpc.autoscale.util import partition
+from hpc.autoscale.results import CandidatesResult, Result, fire_result_handlers
 
 if typing.TYPE_CHECKING:
     from hpc.autoscale.node.node import Node
@@ -96,7 +97,12 @@ class NodeBucket:
         self.limits = limits
         self.max_placement_group_size = max_placement_group_size
         self.priority = 0
-        # list of nodes cyclecloud currently says are in this bucket
+        self.__transient_ids: Set[str] = set()
+        self.__hostnames: Set[str] = set()
+        self.__capacity_index = _FreeCapacityIndex()
+        # nodes cyclecloud currently says are in this bucket, in insertion order
+        self.__members: Dict["Node", None] = {}
+        self.__nodes_tuple: Optional[Tuple["Node", ...]] = None
         self.nodes = nodes
         self.__decrement_counter = 0
         example_node_name = ht.NodeName("{}-0".format(definition.nodearray))
@@ -249,21 +255,66 @@ class NodeBucket:
     def supports_colocation(self) -> bool:
         return self.software_configuration.get("autoscale", {}).get("is_hpc", True)
 
-    def add_nodes(self, nodes: List["Node"]) -> None:
-        new_by_id = partition(nodes, lambda n: n.delayed_node_id.transient_id)
-        cur_by_id = partition(self.nodes, lambda n: n.delayed_node_id.transient_id)
-
-        filtered = []
-        for new_id, new_nodes in new_by_id.items():
-            if new_id not in cur_by_id:
-                filtered.append(new_nodes[0])
+    @property
+    def nodes(self) -> Tuple["Node", ...]:
+        """
+        The nodes in this bucket, as a tuple. Use add_nodes and remove_node,
+        or assign a new list, to modify it.
+        """
+        if self.__nodes_tuple is None:
+            self.__nodes_tuple = tuple(self.__members)
+        return self.__nodes_tuple
+
+    @nodes.setter
+    def nodes(self, nodes: List["Node"]) -> None:
+        for node in list(self.__members):
+            self.remove_node(node)
+        for node in nodes:
+            self.__track(node)
+
+    def has_node(self, node: "Node") -> bool:
+        return node in self.__members
 
-        new_by_hostname = partition(filtered, lambda n: n.hostname_or_uuid)
-        cur_by_hostname = partition(self.nodes, lambda n: n.hostname_or_uuid)
+    def add_nodes(self, nodes: List["Node"]) -> None:
+        for node in nodes:
+            if node.delayed_node_id.transient_id in self.__transient_ids:
+                continue
+            if node.hostname_or_uuid in self.__hostnames:
+                continue
+            self.__track(node)
+
+    def remove_node(self, node: "Node") -> None:
+        if node not in self.__members:
+            raise ValueError("{} is not in bucket {}".format(node, self))
+        self.__members.pop(node)
+        self.__nodes_tuple = None
+        self.__transient_ids.discard(node.delayed_node_id.transient_id)
+        self.__hostnames.discard(node.hostname_or_uuid)
+        self.__capacity_index.remove(node)
+
+    def open_nodes(
+        self, constraints: List["constraintslib.NodeConstraint"]
+    ) -> Iterator["Node"]:
+        """
+        Yields the nodes that are not closed, in the same order as self.nodes,
+        skipping those that can not satisfy the MinResourcePerNode constraints.
+        The caller is still responsible for evaluating all of the constraints.
+        """
+        return self.__capacity_index.candidates(constraints)
 
-        for new_hostname, new_nodes in new_by_hostname.items():
-            if new_hostname not in cur_by_hostname:
-                self.nodes.append(new_nodes[0])
+    @property
+    def unallocated_count(self) -> int:
+        """
+        Number of nodes in this bucket that have not been allocated yet.
+        """
+        return self.__capacity_index.unallocated_count
+
+    def __track(self, node: "Node") -> None:
+        self.__members[node] = None
+        self.__nodes_tuple = None
+        self.__transient_ids.add(node.delayed_node_id.transient_id)
+        self.__hostnames.add(node.hostname_or_uuid)
+        self.__capacity_index.add(node)
 
     def clone_with_placement_group(self, pg_name: PlacementGroup) -> "NodeBucket":
         if self.placement_group:
@@ -323,6 +374,200 @@ class NodeBucket:
         return str(self)
 
 
+class _ResourceLevels:
+    """
+    Open nodes grouped by how much of a single resource they have available.
+    Nodes are referred to by their position in the bucket and each group is kept
+    sorted by position.
+    """
+
+    def __init__(self, attr: str) -> None:
+        self.attr = attr
+        # sorted, distinct amounts
+        self.__amounts: List[float] = []
+        self.__by_amount: Dict[float, List[int]] = {}
+        # nodes with non-numeric values can not be ordered, so they are
+        # always candidates
+        self.__unordered: List[int] = []
+        self.__amount_by_position: Dict[int, Optional[float]] = {}
+
+    def update(self, position: int, node: "Node") -> None:
+        self.discard(position)
+        if self.attr not in node.available:
+            return
+
+        value = node.available[self.attr]
+        if not isinstance(value, (int, float, ht.Size)):
+            insort(self.__unordered, position)
+            self.__amount_by_position[position] = None
+            return
+
+        amount = float(value)
+        if amount not in self.__by_amount:
+            insort(self.__amounts, amount)
+            self.__by_amount[amount] = []
+        insort(self.__by_amount[amount], position)
+        self.__amount_by_position[position] = amount
+
+    def discard(self, position: int) -> None:
+        if position not in self.__amount_by_position:
+            return
+
+        amount = self.__amount_by_position.pop(position)
+        if amount is None:
+            _remove_sorted(self.__unordered, position)
+            return
+
+        positions = self.__by_amount[amount]
+        _remove_sorted(positions, position)
+        if not positions:
+            self.__by_amount.pop(amount)
+            _remove_sorted(self.__amounts, amount)
+
+    def count_at_least(self, threshold: float) -> int:
+        index = bisect_left(self.__amounts, threshold)
+        ret = len(self.__unordered)
+        for amount in self.__amounts[index:]:
+            ret += len(self.__by_amount[amount])
+        return ret
+
+    def at_least(self, threshold: float) -> Iterator[int]:
+        """positions, in order, of the nodes with at least threshold available"""
+        index = bisect_left(self.__amounts, threshold)
+        groups = [self.__by_amount[amount] for amount in self.__amounts[index:]]
+        groups.append(self.__unordered)
+        return heapq.merge(*groups)
+
+
+class _FreeCapacityIndex:
+    """
+    Index of the open nodes in a bucket, keyed by their remaining available
+    resources, so that MinResourcePerNode constraints can jump straight to the
+    nodes that can fit them. Nodes notify the index whenever their available
+    resources change or they are closed, and are re-indexed lazily on the next
+    query. The number of unallocated nodes is kept up to date eagerly.
+    """
+
+    def __init__(self) -> None:
+        self.__positions: Dict["Node", int] = {}
+        self.__nodes: Dict[int, "Node"] = {}
+        self.__next_position = 0
+        self.__open: List[int] = []
+        self.__levels: Dict[str, _ResourceLevels] = {}
+        self.__dirty: Set["Node"] = set()
+        self.__unallocated: Set["Node"] = set()
+
+    @property
+    def unallocated_count(self) -> int:
+        return len(self.__unallocated)
+
+    def add(self, node: "Node") -> None:
+        if node in self.__positions:
+            return
+        position = self.__next_position
+        self.__next_position += 1
+        self.__positions[node] = position
+        self.__nodes[position] = node
+        node._add_capacity_listener(self.__mark_dirty)
+        if not node._allocated:
+            self.__unallocated.add(node)
+        self.__reindex(node)
+
+    def remove(self, node: "Node") -> None:
+        if node not in self.__positions:
+            return
+        node._remove_capacity_listener(self.__mark_dirty)
+        self.__dirty.discard(node)
+        self.__unallocated.discard(node)
+        self.__close(node)
+        self.__nodes.pop(self.__positions.pop(node))
+
+    def candidates(
+        self, constraints: List["constraintslib.NodeConstraint"]
+    ) -> Iterator["Node"]:
+        self.__flush()
+
+        best: Optional[Tuple[int, _ResourceLevels, float]] = None
+        for attr, threshold in _min_resource_thresholds(constraints):
+            if attr not in self.__levels:
+                levels = self.__levels[attr] = _ResourceLevels(attr)
+                for position in self.__open:
+                    levels.update(position, self.__nodes[position])
+            levels = self.__levels[attr]
+            count = levels.count_at_least(threshold)
+            if best is None or count < best[0]:
+                best = (count, levels, threshold)
+
+        if best is None:
+            positions: Iterator[int] = iter(list(self.__open))
+        else:
+            positions = best[1].at_least(best[2])
+
+        # nodes may be closed or decremented while the caller iterates, which
+        # is fine as they are only re-indexed on the next call.
+        for position in positions:
+            yield self.__nodes[position]
+
+    def __mark_dirty(self, node: "Node") -> None:
+        self.__dirty.add(node)
+        if node._allocated:
+            self.__unallocated.discard(node)
+        else:
+            self.__unallocated.add(node)
+
+    def __flush(self) -> None:
+        dirty = self.__dirty
+        self.__dirty = set()
+        for node in dirty:
+            self.__reindex(node)
+
+    def __reindex(self, node: "Node") -> None:
+        if node.closed:
+            self.__close(node)
+            return
+
+        position = self.__positions[node]
+        _insert_sorted(self.__open, position)
+        for levels in self.__levels.values():
+            levels.update(position, node)
+
+    def __close(self, node: "Node") -> None:
+        position = self.__positions[node]
+        _remove_sorted(self.__open, position)
+        for levels in self.__levels.values():
+            levels.discard(position)
+
+
+def _insert_sorted(values: List[Any], value: Any) -> None:
+    index = bisect_left(values, value)
+    if index == len(values) or values[index] != value:
+        values.insert(index, value)
+
+
+def _remove_sorted(values: List[Any], value: Any) -> None:
+    index = bisect_left(values, value)
+    if index < len(values) and values[index] == value:
+        values.pop(index)
+
+
+def _min_resource_thresholds(
+    constraints: List["constraintslib.NodeConstraint"],
+) -> List[Tuple[str, float]]:
+    """
+    The (attr, minimum amount) pairs every satisfying node must have available,
+    i.e. the MinResourcePerNode constraints at the top level or under an And.
+    The amounts are relaxed slightly so float rounding never excludes a node.
+    """
+    ret: List[Tuple[str, float]] = []
+    for constraint in constraints:
+        if isinstance(constraint, constraintslib.And):
+            ret.extend(_min_resource_thresholds(constraint.constraints))
+        elif isinstance(constraint, constraintslib.MinResourcePerNode):
+            threshold = float(constraint.value)
+            ret.append((constraint.attr, threshold - abs(threshold) * 1e-9 - 1e-9))
+    return ret
+
+
 def bucket_candidates(
     candidates: List["NodeBucket"], constraints: List["constraintslib.NodeConstraint"],
 ) -> CandidatesResult:
@@ -370,10 +615,11 @@ def bucket_candidates(
             satisfied_buckets.append(bucket)
 
     if satisfied_buckets:
-        for cc in constraints:
-            for b in satisfied_buckets:
-                assert cc.satisfied_by_bucket(b)
-                assert cc.satisfied_by_node(b.example_node)
+        if RUNTIME_TYPE_CHECKING:
+            for cc in constraints:
+                for b in satisfied_buckets:
+                    assert cc.satisfied_by_bucket(b)
+                    assert constraintslib.satisfied_by_node(cc, b.example_node)
         artificial = []
         actual = []
         for c in satisfied_buckets:
@@ -386,6 +632,38 @@ def bucket_candidates(
     return CandidatesResult("CompoundFailure", child_results=allocation_failures)
 
 
+class CandidateCache:
+    """
+    Caches the results of bucket_candidates per constraint signature. The
+    candidates only depend on the buckets' definitions and example nodes, not
+    on how many nodes are still available, so the cache only needs to be
+    cleared when the example nodes change, e.g. new default resources.
+    """
+
+    def __init__(self) -> None:
+        self.__results: Dict[Tuple[str, Tuple[int, ...]], CandidatesResult] = {}
+
+    def bucket_candidates(
+        self,
+        candidates: List["NodeBucket"],
+        constraints: List["constraintslib.NodeConstraint"],
+    ) -> CandidatesResult:
+        signature = constraintslib.constraints_signature(constraints)
+        if signature is None:
+            return bucket_candidates(candidates, constraints)
+
+        key = (signature, tuple([id(b) for b in candidates]))
+        if key not in self.__results:
+            self.__results[key] = bucket_candidates(candidates, constraints)
+        else:
+            # let the result handlers know, as if it was just calculated
+            fire_result_handlers(self.__results[key])
+        return self.__results[key]
+
+    def clear(self) -> None:
+        self.__results.clear()
+
+
 def node_from_bucket(
     bucket: "NodeBucket",
     new_node_name: ht.NodeName,
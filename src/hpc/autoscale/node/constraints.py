@@ -1,8 +1,21 @@
+import json
 import re
 import typing
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from fnmatch import fnmatch
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 from uuid import uuid4
 
 import hpc  # noqa: F401
@@ -10,7 +23,7 @@ import hpc.autoscale.hpclogging as logging
 from hpc.autoscale import hpctypes as ht
 from hpc.autoscale.codeanalysis import hpcwrap, hpcwrapclass
 from hpc.autoscale.hpctypes import ResourceType
-from hpc.autoscale.results import SatisfiedResult
+from hpc.autoscale.results import Reason, SatisfiedResult
 
 ConstraintDict = typing.NewType("ConstraintDict", Dict[Any, Any])
 
@@ -22,8 +35,21 @@ if typing.TYPE_CHECKING:
     from hpc.autoscale.node.bucket import NodeBucket
 
 
+def _describe_node(node: "Node", attr: str) -> Reason:
+    if node._is_example_node():
+        return Reason(
+            "Bucket[array={} vm_size={} attr={}]", node.nodearray, node.vm_size, attr
+        )
+    return Reason("Node[name={} attr={}]", node.name, attr)
+
+
 # TODO split by job and node constraints (job being a subclass of node constraint)
 class NodeConstraint(ABC):
+    # True when satisfied_by_node and minimum_space only depend on the node and
+    # on this constraint's own attributes, so that their results can be
+    # memoized within a constraint_cache()
+    cacheable = False
+
     def weight_buckets(
         self, bucket_weights: List[Tuple["NodeBucket", float]]
     ) -> List[Tuple["NodeBucket", float]]:
@@ -104,6 +130,8 @@ class NodeResourceConstraint(BaseNodeConstraint):
     ```
     """
 
+    cacheable = True
+
     def __init__(self, attr: str, *values: ht.ResourceTypeAtom, **flags: Any) -> None:
         self.attr = attr
         self.values: List[ResourceType] = list(values)
@@ -171,8 +199,11 @@ class NodeResourceConstraint(BaseNodeConstraint):
                 self,
                 node,
                 [
-                    "Resource[name={}] not defined for Node[name={} hostname={}]".format(
-                        self.attr, node.name, node.hostname
+                    Reason(
+                        "Resource[name={}] not defined for Node[name={} hostname={}]",
+                        self.attr,
+                        node.name,
+                        node.hostname,
                     )
                 ],
             )
@@ -190,20 +221,22 @@ class NodeResourceConstraint(BaseNodeConstraint):
                 score = len(self.values) - n
                 return SatisfiedResult("success", self, node, score=score,)
 
-        if node._is_example_node():
-            node_str = "Bucket[array={} vm_size={} attr={}]".format(
-                node.nodearray, node.vm_size, self.attr
-            )
-        else:
-            node_str = "Node[name={} attr={}]".format(node.name, self.attr)
-
+        node_str = _describe_node(node, self.attr)
         if len(self.values) > 1:
-            msg = "Resource[name={} value={}] is not one of the options {} for {}".format(
-                self.attr, repr(target), self.values, node_str
+            msg = Reason(
+                "Resource[name={} value={!r}] is not one of the options {} for {}",
+                self.attr,
+                target,
+                self.values,
+                node_str,
             )
         else:
-            msg = "Resource[name={} value={}] != {} for {}".format(
-                self.attr, repr(target), repr(self.values[0]), node_str
+            msg = Reason(
+                "Resource[name={} value={!r}] != {!r} for {}",
+                self.attr,
+                target,
+                self.values[0],
+                node_str,
             )
 
         return SatisfiedResult("InvalidOption", self, node, [msg],)
@@ -244,22 +277,21 @@ class MinResourcePerNode(BaseNodeConstraint):
     ```
     """
 
+    cacheable = True
+
     def __init__(self, attr: str, value: Union[int, float, ht.Size]) -> None:
         self.attr = attr
         self.value = value
         assert isinstance(self.value, (int, float, ht.Size))
 
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
-        if node._is_example_node():
-            node_str = "Bucket[array={} vm_size={} attr={}]".format(
-                node.nodearray, node.vm_size, self.attr
-            )
-        else:
-            node_str = "Node[name={} attr={}]".format(node.name, self.attr)
-
         if self.attr not in node.available:
             # TODO log
-            msg = "Resource[name={}] is not defined for {}".format(self.attr, node_str)
+            msg = Reason(
+                "Resource[name={}] is not defined for {}",
+                self.attr,
+                _describe_node(node, self.attr),
+            )
             return SatisfiedResult("UndefinedResource", self, node, [msg],)
 
         try:
@@ -283,16 +315,21 @@ class MinResourcePerNode(BaseNodeConstraint):
             )
 
         if node._is_example_node():
-            msg = "Resource[name={} value={}] > Bucket[array={} vm_size={} value={}]".format(
+            msg = Reason(
+                "Resource[name={} value={!r}] > Bucket[array={} vm_size={} value={!r}]",
                 self.attr,
-                repr(self.value),
+                self.value,
                 node.nodearray,
                 node.vm_size,
-                repr(node.available[self.attr]),
+                node.available[self.attr],
             )
         else:
-            msg = "Resource[name={} value={}] > Node[name={} value={}]".format(
-                self.attr, repr(self.value), node.name, repr(node.available[self.attr]),
+            msg = Reason(
+                "Resource[name={} value={!r}] > Node[name={} value={!r}]",
+                self.attr,
+                self.value,
+                node.name,
+                node.available[self.attr],
             )
         return SatisfiedResult("InsufficientResource", self, node, reasons=[msg],)
 
@@ -351,6 +388,8 @@ class ExclusiveNode(BaseNodeConstraint):
     -> One or more iterations of the same job can run on this node.
     """
 
+    cacheable = True
+
     def __init__(
         self,
         is_exclusive: bool = True,
@@ -374,8 +413,11 @@ class ExclusiveNode(BaseNodeConstraint):
         if node.assignments or node.closed:
 
             if self.job_exclusive or self.assignment_id not in node.assignments:
-                msg = "[name={} hostname={}] already has an exclusive job: {}".format(
-                    node.name, node.hostname, node.assignments
+                msg = Reason(
+                    "[name={} hostname={}] already has an exclusive job: {}",
+                    node.name,
+                    node.hostname,
+                    set(node.assignments),
                 )
                 return SatisfiedResult("ExclusiveRequirementFailed", self, node, [msg],)
         return SatisfiedResult("success", self, node)
@@ -427,17 +469,24 @@ class InAPlacementGroup(BaseNodeConstraint):
     ```
     """
 
+    cacheable = True
+
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
         if node.placement_group:
             return SatisfiedResult("success", self, node,)
 
         if node.name.endswith("-0"):
-            msg = "Bucket[array={} vm_size={} id={}] is not in a placement group".format(
-                node.nodearray, node.vm_size, node.bucket_id
+            msg = Reason(
+                "Bucket[array={} vm_size={} id={}] is not in a placement group",
+                node.nodearray,
+                node.vm_size,
+                node.bucket_id,
             )
         else:
-            msg = "Node[name={} hostname={}] is not in a placement group".format(
-                node.name, node.hostname
+            msg = Reason(
+                "Node[name={} hostname={}] is not in a placement group",
+                node.name,
+                node.hostname,
             )
         return SatisfiedResult("NotInAPlacementGroup", self, node, [msg],)
 
@@ -475,6 +524,7 @@ class Or(BaseNodeConstraint):
         if len(constraints) <= 1:
             raise AssertionError("Or expression requires at least 2 constraints")
         self.constraints = get_constraints(list(constraints))
+        self.cacheable = all(c.cacheable for c in self.constraints)
         self.weight = 100
 
     def weight_buckets(
@@ -496,9 +546,9 @@ class Or(BaseNodeConstraint):
         return ret
 
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
-        reasons: List[str] = []
+        reasons: List[Union[str, Reason]] = []
         for n, c in enumerate(self.constraints):
-            result = c.satisfied_by_node(node)
+            result = satisfied_by_node(c, node)
 
             if result:
                 return SatisfiedResult(
@@ -506,13 +556,13 @@ class Or(BaseNodeConstraint):
                 )
 
             if hasattr(result, "reasons"):
-                reasons.extend(result.reasons)
+                reasons.extend(result.raw_reasons)
 
         return SatisfiedResult("CompoundFailure", self, node, reasons)
 
     def do_decrement(self, node: "Node") -> bool:
         for c in self.constraints:
-            result = c.satisfied_by_node(node)
+            result = satisfied_by_node(c, node)
 
             if result:
                 return c.do_decrement(node)
@@ -521,10 +571,10 @@ class Or(BaseNodeConstraint):
 
     def minimum_space(self, node: "Node") -> int:
         for c in self.constraints:
-            result = c.satisfied_by_node(node)
+            result = satisfied_by_node(c, node)
 
             if result:
-                return c.minimum_space(node)
+                return minimum_space(c, node)
         return 0
 
     def get_children(self) -> Iterable[NodeConstraint]:
@@ -554,13 +604,14 @@ class XOr(BaseNodeConstraint):
         if len(constraints) <= 1:
             raise AssertionError("XOr expression requires at least 2 constraints")
         self.constraints = get_constraints(list(constraints))
+        self.cacheable = all(c.cacheable for c in self.constraints)
 
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
-        reasons: List[str] = []
+        reasons: List[Union[str, Reason]] = []
         xor_result: Optional[SatisfiedResult] = None
 
         for n, c in enumerate(self.constraints):
-            expr_result = c.satisfied_by_node(node)
+            expr_result = satisfied_by_node(c, node)
 
             if expr_result:
                 # true ^ true == false
@@ -569,13 +620,13 @@ class XOr(BaseNodeConstraint):
                     msg = "Multiple expressions evaluated as true. See below:\n\t{}\n\t{}".format(
                         xor_result.message, expr_result.message
                     )
-                    return SatisfiedResult("XORFailed", self, node, [msg] + reasons,)
+                    return SatisfiedResult("XORFailed", self, node, [msg, *reasons],)
                 # assign the first true expression as the final result
                 xor_result = expr_result
             elif hasattr(expr_result, "reasons"):
                 # if this does end up failing for all expressions, keep
                 # track of the set of reasons
-                reasons.extend(expr_result.reasons)
+                reasons.extend(expr_result.raw_reasons)
 
         if xor_result:
             return xor_result
@@ -587,7 +638,7 @@ class XOr(BaseNodeConstraint):
         first_matched_constraint: Optional[NodeConstraint] = None
 
         for c in self.constraints:
-            expr_result = c.satisfied_by_node(node)
+            expr_result = satisfied_by_node(c, node)
             if expr_result:
                 if xor_result:
                     raise AssertionError(
@@ -607,7 +658,7 @@ class XOr(BaseNodeConstraint):
         successful_constraint: Optional[NodeConstraint] = None
 
         for n, c in enumerate(self.constraints):
-            expr_result = c.satisfied_by_node(node)
+            expr_result = satisfied_by_node(c, node)
 
             if expr_result:
                 # true ^ true == false
@@ -619,7 +670,7 @@ class XOr(BaseNodeConstraint):
                 successful_constraint = c
 
         if xor_result and successful_constraint:
-            return successful_constraint.minimum_space(node)
+            return minimum_space(successful_constraint, node)
 
         return 0
 
@@ -656,6 +707,7 @@ class And(BaseNodeConstraint):
         #         if len(constraints) == 1 and isinstance(constraints[0], list):
         #             constraints = constraints[0]
         self.constraints = get_constraints(list(constraints))
+        self.cacheable = all(c.cacheable for c in self.constraints)
 
     def weight_buckets(
         self, bucket_weights: List[Tuple["NodeBucket", float]]
@@ -668,7 +720,7 @@ class And(BaseNodeConstraint):
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
 
         for c in self.constraints:
-            result = c.satisfied_by_node(node)
+            result = satisfied_by_node(c, node)
             if not result:
                 return result
 
@@ -676,7 +728,7 @@ class And(BaseNodeConstraint):
 
     def do_decrement(self, node: "Node") -> bool:
         for c in self.constraints:
-            if c.satisfied_by_node(node):
+            if satisfied_by_node(c, node):
                 assert c.do_decrement(node)
         return True
 
@@ -686,7 +738,7 @@ class And(BaseNodeConstraint):
     def minimum_space(self, node: "Node") -> int:
         m = -1
         for child in self.get_children():
-            child_min = child.minimum_space(node)
+            child_min = minimum_space(child, node)
             if child_min == -1:
                 continue
 
@@ -744,10 +796,11 @@ class Not(BaseNodeConstraint):
 
     def __init__(self, condition: Union[NodeConstraint, ConstraintDict]) -> None:
         self.condition = get_constraints([condition])[0]
+        self.cacheable = self.condition.cacheable
 
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
 
-        result = self.condition.satisfied_by_node(node)
+        result = satisfied_by_node(self.condition, node)
         # TODO ugly
         status = "success" if not result else "not(success)"
         return SatisfiedResult(status, self, node, [str(self)])
@@ -783,6 +836,8 @@ class NodePropertyConstraint(BaseNodeConstraint):
     matches nodes that have a pcpu_count of exactly 44.
     """
 
+    cacheable = True
+
     def __init__(
         self, attr: str, *values: typing.Union[None, ht.ResourceTypeAtom]
     ) -> None:
@@ -838,7 +893,7 @@ class NodePropertyConstraint(BaseNodeConstraint):
 
     def _satisfied(
         self, node: "Node", value: typing.Union[None, ht.ResourceTypeAtom]
-    ) -> Optional[str]:
+    ) -> Optional[Reason]:
         target = getattr(node, self.attr)
 
         if isinstance(value, str) and isinstance(target, str):
@@ -847,20 +902,22 @@ class NodePropertyConstraint(BaseNodeConstraint):
         elif value == target:
             return None
 
-        if node._is_example_node():
-            node_str = "Bucket[array={} vm_size={} attr={}]".format(
-                node.nodearray, node.vm_size, self.attr
-            )
-        else:
-            node_str = "Node[name={} attr={}]".format(node.name, self.attr)
-
+        node_str = _describe_node(node, self.attr)
         if len(self.values) > 1:
-            return "Property[name={} value={}] is not one of the options {} for {}".format(
-                self.attr, target, self.values, node_str
+            return Reason(
+                "Property[name={} value={}] is not one of the options {} for {}",
+                self.attr,
+                target,
+                self.values,
+                node_str,
             )
         else:
-            return "Property[name={} value={}] != {} for {}".format(
-                self.attr, self.values[0], target, node_str
+            return Reason(
+                "Property[name={} value={}] != {} for {}",
+                self.attr,
+                self.values[0],
+                target,
+                node_str,
             )
 
     def __str__(self) -> str:
@@ -881,6 +938,8 @@ class NotAllocated(BaseNodeConstraint):
     Deprecated, do not use.
     """
 
+    cacheable = True
+
     def satisfied_by_node(self, node: "Node") -> SatisfiedResult:
 
         if node._allocated:
@@ -916,6 +975,8 @@ class Never(BaseNodeConstraint):
     ```
     """
 
+    cacheable = True
+
     def __init__(self, message: str) -> None:
         self.__message = message
 
@@ -937,6 +998,8 @@ class Never(BaseNodeConstraint):
 
 
 class ReadOnlyAlias(BaseNodeConstraint):
+    cacheable = True
+
     def __init__(self, alias: str, resource_name: str) -> None:
         self.alias = alias
         self.resource_name = resource_name
@@ -1073,7 +1136,8 @@ class SharedConsumableConstraint(SharedConstraint):
                     self,
                     node,
                     reasons=[
-                        "Insufficiant shared resource {} ({}/{}): Requested {} > {}".format(
+                        Reason(
+                            "Insufficiant shared resource {} ({}/{}): Requested {} > {}",
                             shared_resource.resource_name,
                             shared_resource.current_value,
                             shared_resource.initial_value,
@@ -1190,8 +1254,10 @@ class SharedNonConsumableConstraint(SharedConstraint):
             self,
             node,
             reasons=[
-                "Shared value does not match requested value: {} != {}".format(
-                    self.shared_resource.current_value, self.target
+                Reason(
+                    "Shared value does not match requested value: {} != {}",
+                    self.shared_resource.current_value,
+                    self.target,
                 )
             ],
         )
@@ -1429,3 +1495,129 @@ def register_parser(
     assert isinstance(custom_attribute, str)
     assert hasattr(parser, "__call__")
     _CUSTOM_PARSERS[custom_attribute] = parser
+
+
+class _ConstraintCache:
+    """
+    Memoized satisfied_by_node / minimum_space results, keyed by the constraint's
+    fingerprint, the node and the node's resource version. Any change to the
+    node's available resources, assignments or closed state bumps the version,
+    so stale entries are simply never read again.
+    """
+
+    def __init__(self) -> None:
+        # keep a reference to the constraint so that its id is not reused
+        self.__fingerprints: Dict[int, Tuple[NodeConstraint, Hashable]] = {}
+        self.__results: Dict[Tuple[str, Hashable, "Node"], Tuple[int, Any]] = {}
+
+    def fingerprint(self, constraint: NodeConstraint) -> Hashable:
+        cached = self.__fingerprints.get(id(constraint))
+        if cached is None:
+            cached = (constraint, _fingerprint(constraint))
+            self.__fingerprints[id(constraint)] = cached
+        return cached[1]
+
+    def get(
+        self,
+        kind: str,
+        constraint: NodeConstraint,
+        node: "Node",
+        evaluate: Callable[[NodeConstraint, "Node"], Any],
+    ) -> Any:
+        key = (kind, self.fingerprint(constraint), node)
+        version = node._resource_version
+        cached = self.__results.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        ret = evaluate(constraint, node)
+        self.__results[key] = (version, ret)
+        return ret
+
+
+def _fingerprint(value: Any) -> Hashable:
+    if isinstance(value, NodeConstraint):
+        return (value.__class__, _fingerprint(vars(value)))
+
+    if isinstance(value, dict):
+        return tuple(
+            sorted(((str(k), _fingerprint(v)) for k, v in value.items()), key=str)
+        )
+
+    if isinstance(value, (list, tuple)):
+        return tuple([_fingerprint(v) for v in value])
+
+    try:
+        hash(value)
+        return (value.__class__, value)
+    except TypeError:
+        return (value.__class__, repr(value))
+
+
+_ACTIVE_CACHE: Optional[_ConstraintCache] = None
+
+
+@contextmanager
+def constraint_cache() -> Iterator[None]:
+    """
+    Memoizes satisfied_by_node and minimum_space for cacheable constraints until
+    the outermost constraint_cache() exits. Can also be used as a decorator.
+    """
+    global _ACTIVE_CACHE
+    if _ACTIVE_CACHE is not None:
+        yield
+        return
+
+    _ACTIVE_CACHE = _ConstraintCache()
+    try:
+        yield
+    finally:
+        _ACTIVE_CACHE = None
+
+
+def _satisfied_by_node(constraint: NodeConstraint, node: "Node") -> SatisfiedResult:
+    return constraint.satisfied_by_node(node)
+
+
+def _minimum_space(constraint: NodeConstraint, node: "Node") -> int:
+    return constraint.minimum_space(node)
+
+
+def satisfied_by_node(constraint: NodeConstraint, node: "Node") -> SatisfiedResult:
+    """
+    Same as constraint.satisfied_by_node(node), but memoized within a
+    constraint_cache()
+    """
+    if _ACTIVE_CACHE is None or not constraint.cacheable:
+        return constraint.satisfied_by_node(node)
+    return _ACTIVE_CACHE.get("satisfied", constraint, node, _satisfied_by_node)
+
+
+def minimum_space(constraint: NodeConstraint, node: "Node") -> int:
+    """
+    Same as constraint.minimum_space(node), but memoized within a
+    constraint_cache()
+    """
+    if _ACTIVE_CACHE is None or not constraint.cacheable:
+        return constraint.minimum_space(node)
+    return _ACTIVE_CACHE.get("minimum_space", constraint, node, _minimum_space)
+
+
+def constraints_signature(constraints: List[NodeConstraint]) -> Optional[str]:
+    """
+    A canonical representation of the constraints, based on to_dict, which
+    ignores per-job state like assignment ids. Returns None if any of the
+    constraints are not cacheable or can not be serialized.
+    """
+    to_visit = list(constraints)
+    while to_visit:
+        constraint = to_visit.pop()
+        if not constraint.cacheable:
+            return None
+        to_visit.extend(constraint.get_children())
+
+    try:
+        return json.dumps(
+            [c.to_dict() for c in constraints], sort_keys=True, default=str
+        )
+    except Exception:
+        return None
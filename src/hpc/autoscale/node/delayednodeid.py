@@ -26,6 +26,14 @@ class DelayedNodeId:
     should be able to have one unique NodeId.
     """
 
+    __slots__ = (
+        "name",
+        "__transient_id",
+        "operation_id",
+        "operation_offset",
+        "node_id",
+    )
+
     def __init__(
         self,
         name: ht.NodeName,
@@ -34,11 +42,18 @@ class DelayedNodeId:
         operation_offset: Optional[int] = None,
     ) -> None:
         self.name = name
-        self.transient_id = ht.NodeId(str(uuid4()))
+        # generated on first use - most nodes never need one.
+        self.__transient_id: Optional[ht.NodeId] = None
         self.operation_id = operation_id
         self.operation_offset = operation_offset
         self.node_id = node_id
 
+    @property
+    def transient_id(self) -> ht.NodeId:
+        if self.__transient_id is None:
+            self.__transient_id = ht.NodeId(str(uuid4()))
+        return self.__transient_id
+
     def __str__(self) -> ht.NodeId:
         return ht.NodeId(
             "NodeId(name={}, node_id={}, operation_id={}, operation_offset={}, transient_id={})".format(
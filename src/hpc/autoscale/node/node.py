@@ -2,7 +2,7 @@ import re
 from abc import ABC
 from copy import deepcopy
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set, Union
 from uuid import uuid4
 
 from immutabledict import ImmutableOrderedDict
@@ -10,10 +10,11 @@ from immutabledict import ImmutableOrderedDict
 import hpc.autoscale.hpclogging as logging
 from hpc.autoscale import hpctypes as ht
 from hpc.autoscale.codeanalysis import hpcwrap
+from hpc.autoscale.node import constraints as constraintslib
 from hpc.autoscale.node import vm_sizes
 from hpc.autoscale.node.constraints import NodeConstraint
 from hpc.autoscale.node.delayednodeid import DelayedNodeId
-from hpc.autoscale.results import MatchResult
+from hpc.autoscale.results import MatchResult, Reason
 
 # state is added by default because it also has a setter
 # property and most tools get confused by this
@@ -35,7 +36,161 @@ def nodeproperty(function: Callable) -> property:
     return property(function)
 
 
+_MISSING = object()
+
+# values that are never modified in place, so copies of a resource dict can share them
+_IMMUTABLE_RESOURCE_TYPES = (str, int, float, bool, type(None), ht.Size)
+
+
+def _copy_resources(resources: Dict[str, Any]) -> Dict[str, Any]:
+    ret = {}
+    for key, value in resources.items():
+        if not isinstance(value, _IMMUTABLE_RESOURCE_TYPES):
+            value = deepcopy(value)
+        ret[key] = value
+    return ret
+
+
+class _AvailableResources(dict):
+    """
+    The dict backing Node.available. Calls _on_change, if set, whenever the
+    contents change so that the node can bump its resource version and notify
+    any indices over its free capacity (see NodeBucket). Copies are plain dicts.
+
+    While _undo_log is set, the original value of every key that is changed is
+    recorded in it (_MISSING if the key did not exist) so that the changes can
+    be reverted without copying the whole dict. See Node._record_changes
+    """
+
+    __slots__ = ("_on_change", "_undo_log")
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        dict.__init__(self, *args, **kwargs)
+        self._on_change: Optional[Callable[[], None]] = None
+        self._undo_log: Optional[Dict[str, Any]] = None
+
+    def __remember(self, key: str) -> None:
+        if self._undo_log is not None and key not in self._undo_log:
+            self._undo_log[key] = dict.get(self, key, _MISSING)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.__remember(key)
+        dict.__setitem__(self, key, value)
+        if self._on_change:
+            self._on_change()
+
+    def __delitem__(self, key: str) -> None:
+        self.__remember(key)
+        dict.__delitem__(self, key)
+        if self._on_change:
+            self._on_change()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        if self._undo_log is not None:
+            updates = dict(*args, **kwargs)
+            for key in updates:
+                self.__remember(key)
+            dict.update(self, updates)
+        else:
+            dict.update(self, *args, **kwargs)
+        if self._on_change:
+            self._on_change()
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        self.__remember(key)
+        ret = dict.setdefault(self, key, default)
+        if self._on_change:
+            self._on_change()
+        return ret
+
+    def pop(self, key: str, *args: Any) -> Any:
+        self.__remember(key)
+        ret = dict.pop(self, key, *args)
+        if self._on_change:
+            self._on_change()
+        return ret
+
+    def popitem(self) -> Any:
+        ret = dict.popitem(self)
+        if self._undo_log is not None and ret[0] not in self._undo_log:
+            self._undo_log[ret[0]] = ret[1]
+        if self._on_change:
+            self._on_change()
+        return ret
+
+    def clear(self) -> None:
+        for key in list(self.keys()):
+            self.__remember(key)
+        dict.clear(self)
+        if self._on_change:
+            self._on_change()
+
+    def _revert(self, undo_log: Dict[str, Any]) -> None:
+        for key, value in undo_log.items():
+            if value is _MISSING:
+                dict.pop(self, key, None)
+            else:
+                dict.__setitem__(self, key, value)
+        if undo_log and self._on_change:
+            self._on_change()
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __copy__(self) -> dict:
+        return dict(self)
+
+    def __deepcopy__(self, memo: Dict) -> dict:
+        return deepcopy(dict(self), memo)
+
+    def __reduce__(self) -> Any:
+        return (dict, (dict(self),))
+
+
 class Node(ABC):
+    # there can be tens of thousands of nodes, so avoid a per instance __dict__
+    __slots__ = (
+        "__name",
+        "__nodearray",
+        "__bucket_id",
+        "__vm_size",
+        "__hostname",
+        "__private_ip",
+        "__instance_id",
+        "__location",
+        "__spot",
+        "__vcpu_count",
+        "__memory",
+        "__infiniband",
+        "_resources",
+        "__available",
+        "__capacity_listeners",
+        "__resource_version",
+        "__state",
+        "__target_state",
+        "__exists",
+        "__placement_group",
+        "__power_state",
+        "__managed",
+        "__node_id",
+        "__allocated",
+        "__closed",
+        "_node_index",
+        "__marked_for_deletion",
+        "__metadata",
+        "__node_attribute_overrides",
+        "__assignments",
+        "__aux_vm_info",
+        "__software_configuration",
+        "__create_time",
+        "__last_match_time",
+        "__delete_time",
+        "__create_time_remaining",
+        "__idle_time_remaining",
+        "__keep_alive",
+        "__gpu_count",
+    )
+
     def __init__(
         self,
         node_id: DelayedNodeId,
@@ -77,7 +232,10 @@ class Node(ABC):
         self.__infiniband = infiniband
 
         self._resources = resources or ht.ResourceDict({})
-        self.__available = deepcopy(self._resources)
+        # copied from _resources the first time it is accessed. See available
+        self.__available: Optional[Dict[str, Any]] = None
+        self.__capacity_listeners: Optional[List[Callable[["Node"], None]]] = None
+        self.__resource_version = 0
 
         self.__state = state
         self.__target_state = target_state
@@ -87,9 +245,8 @@ class Node(ABC):
         self.placement_group = placement_group
         self.__power_state = power_state
         self.__managed = managed
-        self.__version = "7.9"
         self.__node_id = node_id
-        self._allocated: bool = False
+        self.__allocated = False
         self.__closed = False
         self._node_index: Optional[int] = None
         self.__marked_for_deletion = False
@@ -98,8 +255,9 @@ class Node(ABC):
                 self._node_index = int(self.name.rsplit("-")[-1])
             except ValueError:
                 pass
-        self.__metadata: Dict = {}
-        self.__node_attribute_overrides: Dict = {}
+        # created on first access, most nodes never use them
+        self.__metadata: Optional[Dict] = None
+        self.__node_attribute_overrides: Optional[Dict] = None
         self.__assignments: Set[str] = set()
 
         self.__aux_vm_info = vm_sizes.get_aux_vm_size_info(location, vm_size)
@@ -121,6 +279,16 @@ class Node(ABC):
     def required(self, value: bool) -> None:
         self._allocated = value
 
+    @property
+    def _allocated(self) -> bool:
+        return self.__allocated
+
+    @_allocated.setter
+    def _allocated(self, value: bool) -> None:
+        if value != self.__allocated:
+            self.__allocated = value
+            self.__capacity_changed()
+
     @property
     def keep_alive(self) -> bool:
         """Is this node protected by CycleCloud to prevent it from being terminated."""
@@ -305,7 +473,7 @@ class Node(ABC):
     @nodeproperty
     def version(self) -> str:
         """Internal version property to handle upgrades"""
-        return self.__version
+        return "7.9"
 
     @property
     def delayed_node_id(self) -> DelayedNodeId:
@@ -350,6 +518,8 @@ class Node(ABC):
         during allocation process. See results.DefaultContextHandler
         for an example.
         """
+        if self.__metadata is None:
+            self.__metadata = {}
         return self.__metadata
 
     @property
@@ -358,6 +528,8 @@ class Node(ABC):
         Override attributes for the Cloud.Node attributes created in
         Cyclecloud
         """
+        if self.__node_attribute_overrides is None:
+            self.__node_attribute_overrides = {}
         if self.exists:
             return ImmutableOrderedDict(self.__node_attribute_overrides)
         return self.__node_attribute_overrides
@@ -477,14 +649,53 @@ class Node(ABC):
     @closed.setter
     def closed(self, value: bool) -> None:
         if value:
+            changed = not self.__closed
             self.__closed = value
+            if changed:
+                self.__capacity_changed()
         elif self.__closed:
             raise RuntimeError("Can not unclose a job.")
 
     @property
     def available(self) -> dict:
+        """
+        The resources that are still available on this node. Copied from
+        resources on first access, rather than for every node up front.
+        """
+        if self.__available is None:
+            available = _AvailableResources(_copy_resources(self._resources))
+            available._on_change = self.__capacity_changed
+            self.__available = available
         return self.__available
 
+    @property
+    def _resource_version(self) -> int:
+        """
+        Incremented whenever the available resources, assignments, closed or
+        allocated state of this node changes, i.e. anything that can change
+        whether a constraint is satisfied during allocation.
+        """
+        return self.__resource_version
+
+    def _add_capacity_listener(self, listener: Callable[["Node"], None]) -> None:
+        """
+        listener is called with this node whenever its available resources
+        change, it is closed or it is allocated.
+        """
+        if self.__capacity_listeners is None:
+            self.__capacity_listeners = []
+        self.__capacity_listeners.append(listener)
+
+    def _remove_capacity_listener(self, listener: Callable[["Node"], None]) -> None:
+        if self.__capacity_listeners and listener in self.__capacity_listeners:
+            self.__capacity_listeners.remove(listener)
+
+    def __capacity_changed(self) -> None:
+        self.__resource_version += 1
+        if self.__capacity_listeners:
+            for listener in self.__capacity_listeners:
+                listener(self)
+
     def decrement(
         self,
         constraints: List[NodeConstraint],
@@ -500,15 +711,15 @@ class Node(ABC):
 
         assignment_id = assignment_id or str(uuid4())
 
-        reasons: List[str] = []
+        reasons: List[Union[str, Reason]] = []
         is_unsatisfied = False
         for constraint in constraints:
-            result = constraint.satisfied_by_node(self)
+            result = constraintslib.satisfied_by_node(constraint, self)
             if not result:
                 is_unsatisfied = True
                 # TODO need to propagate reason. Maybe a constraint result object?
                 if hasattr(result, "reasons"):
-                    reasons.extend(result.reasons)
+                    reasons.extend(result.raw_reasons)
 
         if is_unsatisfied:
             # TODO log why things are rejected at fine detail
@@ -541,7 +752,48 @@ class Node(ABC):
         return MatchResult("success", node=self, slots=to_pack)
 
     def assign(self, assignment_id: str) -> None:
-        self.__assignments.add(assignment_id)
+        if assignment_id not in self.__assignments:
+            self.__assignments.add(assignment_id)
+            self.__resource_version += 1
+
+    def _unassign(self, assignment_id: str) -> None:
+        if assignment_id in self.__assignments:
+            self.__assignments.discard(assignment_id)
+            self.__resource_version += 1
+
+    def _record_changes(self) -> None:
+        """
+        Start recording the original values of any available resources that
+        change, until _stop_recording is called.
+        """
+        available = self.available
+        if isinstance(available, _AvailableResources):
+            assert available._undo_log is None
+            available._undo_log = {}
+
+    def _stop_recording(self) -> Dict[str, Any]:
+        """
+        Returns the original values of the available resources that changed
+        since _record_changes. Pass this to _revert_changes to restore them.
+        """
+        available = self.available
+        if not isinstance(available, _AvailableResources):
+            return {}
+        undo_log = available._undo_log or {}
+        available._undo_log = None
+        return undo_log
+
+    def _revert_changes(self, undo_log: Dict[str, Any]) -> None:
+        available = self.available
+        if isinstance(available, _AvailableResources):
+            available._revert(undo_log)
+            return
+
+        for key, value in undo_log.items():
+            if value is _MISSING:
+                available.pop(key, None)
+            else:
+                available[key] = value
 
     @property
     def assignments(self) -> Set[str]:
@@ -549,7 +801,7 @@ class Node(ABC):
 
     @property
     def software_configuration(self) -> Dict:
-        overrides = self.node_attribute_overrides
+        overrides = self.__node_attribute_overrides
         if overrides and overrides.get("Configuration"):
             ret: Dict = {}
             ret.update(self.__software_configuration)
@@ -584,14 +836,16 @@ class Node(ABC):
         # TODO RDH test coverage
         self.required = self.required or snode.required or bool(snode.assignments)
         self.__assignments.update(snode.assignments)
+        self.__resource_version += 1
         self.metadata.update(deepcopy(snode.metadata))
 
     def shellify(self) -> None:
         from hpc.autoscale.clilib import ShellDict
 
+        available = self.available
         self._resources = ShellDict(self._resources)  # type: ignore
-        self.__available = ShellDict(self.__available)  # type: ignore
-        self.__metadata = ShellDict(self.__metadata)  # type: ignore
+        self.__available = ShellDict(available)  # type: ignore
+        self.__metadata = ShellDict(self.metadata)  # type: ignore
 
     def _is_example_node(self) -> bool:
         return self.name == "{}-0".format(self.nodearray)
@@ -768,7 +1022,7 @@ def minimum_space(constraints: List[NodeConstraint], node: "Node") -> int:
 
     for constraint in constraints:
         # TODO not sure about how to handle this
-        constraint_min_space = constraint.minimum_space(node)
+        constraint_min_space = constraintslib.minimum_space(constraint, node)
         assert constraint_min_space is not None
 
         if constraint_min_space > -1:
@@ -1,9 +1,14 @@
+import atexit
+import bisect
 import datetime
+import math
 import os
 import shutil
 import sqlite3
+import threading
 import typing
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 import hpc.autoscale.hpclogging as logging
 from hpc.autoscale.hpctypes import Hostname, NodeId
@@ -11,13 +16,22 @@ from hpc.autoscale.node.node import Node
 from hpc.autoscale.util import parse_boot_timeout, parse_idle_timeout, partition_single
 
 # TODO RDH reset
-SQLITE_VERSION = "0.0.6"
+SQLITE_VERSION = "0.0.7"
 
 # the keyword true/false is relatively new for sqlite, so use int values for
 # backwards compatibility.
 SQL_TRUE = 1
 SQL_FALSE = 0
 
+# older versions whose nodes table can still be read as is.
+_READABLE_VERSIONS = ["0.0.6"]
+
+# see SQLiteNodeHistory.__init__
+LAST_MATCH_QUANTUM = float(os.getenv("SCALELIB_LAST_MATCH_QUANTUM", "60"))
+
+# negative values are in KiB, see https://www.sqlite.org/pragma.html#pragma_cache_size
+SQLITE_CACHE_SIZE = int(os.getenv("SCALELIB_SQLITE_CACHE_SIZE", "-16384"))
+
 
 NodeHistoryResult = typing.List[typing.Tuple[NodeId, Hostname, float]]
 
@@ -91,8 +105,40 @@ class NullNodeHistory(NodeHistory):
             n.metadata["__ignore__"] = False
 
 
-def upgrade_database(current_version: str, conn: sqlite3.Connection) -> None:
-    assert False, "Please contact CycleCloud support"
+def upgrade_database(current_version: str, conn: sqlite3.Connection) -> bool:
+    """
+    Upgrades the database in place to SQLITE_VERSION. Returns False if that is
+    not possible, in which case the caller moves the old database aside.
+    """
+    if current_version == "0.0.6":
+        # 0.0.7 only adds indexes
+        _create_indexes(conn)
+        conn.execute("UPDATE metadata SET version=?", (SQLITE_VERSION,))
+        conn.commit()
+        return True
+    return False
+
+
+def _set_pragmas(conn: sqlite3.Connection, read_only: bool) -> None:
+    conn.execute("PRAGMA cache_size={}".format(SQLITE_CACHE_SIZE))
+    if read_only:
+        # the journal mode is persisted in the database by the writer.
+        return
+    try:
+        # readers no longer block the writer (and vice versa), and with WAL
+        # synchronous=NORMAL is still safe against corruption, it only skips
+        # the fsync on every commit.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    except sqlite3.OperationalError as e:
+        logging.warning("Could not enable WAL journaling for node history: %s", e)
+
+
+def _create_indexes(conn: sqlite3.Connection) -> None:
+    for column in ["delete_time", "last_match_time", "create_time", "ready_time"]:
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS nodes_{0} ON nodes ({0})".format(column)
+        )
 
 
 def initialize_db(path: str, read_only: bool, uri: bool = False) -> sqlite3.Connection:
@@ -119,6 +165,8 @@ def initialize_db(path: str, read_only: bool, uri: bool = False) -> sqlite3.Conn
         logging.exception("Error while opening %s - %s", file_uri, e)
         raise
 
+    _set_pragmas(conn, read_only)
+
     try:
         conn.execute("CREATE TABLE metadata (version)")
     except sqlite3.OperationalError as e:
@@ -130,20 +178,20 @@ def initialize_db(path: str, read_only: bool, uri: bool = False) -> sqlite3.Conn
     if version_result:
         version = version_result[0][0]
     else:
-        conn.execute(
-            "INSERT INTO metadata (version) VALUES ('{}')".format(SQLITE_VERSION)
-        )
+        conn.execute("INSERT INTO metadata (version) VALUES (?)", (SQLITE_VERSION,))
         version = SQLITE_VERSION
 
     if version != SQLITE_VERSION:
-        if SQLITE_VERSION > "0.0.6":
-            upgrade_database(version, conn)
+        if read_only and version in _READABLE_VERSIONS:
+            # the tables are compatible, we just can not add the indexes
+            return conn
 
-        conn.close()
-        new_path = "{}.{}".format(path, version)
-        print("Invalid version - moving to {}".format(new_path))
-        shutil.move(path, new_path)
-        return initialize_db(path, read_only)
+        if read_only or not upgrade_database(version, conn):
+            conn.close()
+            new_path = "{}.{}".format(path, version)
+            print("Invalid version - moving to {}".format(new_path))
+            shutil.move(path, new_path)
+            return initialize_db(path, read_only)
 
     try:
         conn.execute(
@@ -157,17 +205,87 @@ def initialize_db(path: str, read_only: bool, uri: bool = False) -> sqlite3.Conn
         if "table nodes already exists" not in e.args:
             raise
 
+    if not read_only:
+        _create_indexes(conn)
+        conn.commit()
+
     return conn
 
 
+class _NodeArrayTimeouts:
+    """
+    The boot and idle timeouts only depend on the nodearray, so they are
+    parsed once per nodearray rather than once per node.
+    """
+
+    def __init__(self, config: typing.Dict) -> None:
+        self.config = config
+        self.__by_nodearray: typing.Dict[str, typing.Tuple[int, int]] = {}
+
+    def get(self, node: Node) -> typing.Tuple[int, int]:
+        """
+        returns (boot_timeout, idle_timeout)
+        """
+        if node.nodearray not in self.__by_nodearray:
+            self.__by_nodearray[node.nodearray] = (
+                parse_boot_timeout(self.config, node),
+                parse_idle_timeout(self.config, node),
+            )
+        return self.__by_nodearray[node.nodearray]
+
+
+def _decorate_node(
+    node: Node,
+    times: typing.Sequence[typing.Any],
+    now: float,
+    timeouts: _NodeArrayTimeouts,
+) -> None:
+    """
+    times - (create_time, last_match_time, ready_time, delete_time)
+    """
+    create_time, last_match_time, ready_time, delete_time = times
+    node.create_time_unix = create_time
+    node.last_match_time_unix = last_match_time
+    node.delete_time_unix = delete_time
+    boot_timeout, idle_timeout = timeouts.get(node)
+    if boot_timeout:
+        if ready_time < 1:
+            create_elapsed = max(0, now - create_time)
+            create_remaining = max(0, boot_timeout - create_elapsed)
+            node.create_time_remaining = create_remaining
+
+    if idle_timeout:
+        if node.keep_alive or node.state != "Ready":
+            node.idle_time_remaining = -1
+        else:
+            match_elapsed = max(0, now - last_match_time)
+            match_remaining = max(0, idle_timeout - match_elapsed)
+            node.idle_time_remaining = match_remaining
+
+
 class SQLiteNodeHistory(NodeHistory):
-    def __init__(self, path: str = "nodehistory.db", read_only: bool = False) -> None:
+    def __init__(
+        self,
+        path: str = "nodehistory.db",
+        read_only: bool = False,
+        last_match_quantum: float = LAST_MATCH_QUANTUM,
+    ) -> None:
+        """
+        last_match_quantum - last_match_time is rounded up to a multiple of this
+        many seconds, so a node that keeps matching is only rewritten once per
+        quantum. Idle nodes may be reported as unmatched up to this much later.
+        """
         self.path = path
         self.conn = initialize_db(path, read_only)
         self.read_only = read_only
+        self.last_match_quantum = last_match_quantum
 
     def update(self, nodes: typing.Iterable[Node]) -> None:
-        self._update(nodes)
+        if self.read_only:
+            return
+        # one transaction, so that each update is a single commit/fsync
+        with self._transaction():
+            self._update(nodes)
 
     def _update(self, nodes: typing.Iterable[Node]) -> None:
         if self.read_only:
@@ -183,6 +301,9 @@ class SQLiteNodeHistory(NodeHistory):
         )
 
         rows_by_id = partition_single(rows, lambda r: r[0])
+        # so that we only write the rows that actually changed
+        loaded_rows = dict(rows_by_id)
+        match_time_now = self._quantize_match_time(now)
         nodes_with_ids = [n for n in nodes if n.delayed_node_id.node_id]
 
         nodes_by_id: typing.Dict[typing.Optional[NodeId], Node] = partition_single(
@@ -191,7 +312,8 @@ class SQLiteNodeHistory(NodeHistory):
 
         to_delete = set(rows_by_id.keys()) - set(nodes_by_id.keys())
 
-        for node in nodes:
+        # nodes without a node_id do not exist yet, so there is nothing to track.
+        for node in nodes_with_ids:
             node_id = node.delayed_node_id.node_id
 
             if node_id not in rows_by_id:
@@ -202,7 +324,7 @@ class SQLiteNodeHistory(NodeHistory):
 
             if node.required or node.state != "Ready":
                 rec = list(rows_by_id[node_id])
-                rec[-3] = now
+                rec[-3] = match_time_now
                 rows_by_id[node_id] = tuple(rec)
 
             # if a node is running a job according to the scheduler, assume it
@@ -230,9 +352,17 @@ class SQLiteNodeHistory(NodeHistory):
                         ]
                     )
 
-        if rows_by_id:
-            exprs = []
-            for row in rows_by_id.values():
+        new_records = []
+        changed_records = []
+        for node_id, row in rows_by_id.items():
+            if node_id in loaded_rows:
+                if row != loaded_rows[node_id]:
+                    _, _, _, _, match_time, ready_time, ignore = row
+                    ignore_int = SQL_TRUE if ignore else SQL_FALSE
+                    changed_records.append(
+                        (match_time, ready_time, ignore_int, node_id)
+                    )
+            else:
                 (
                     node_id,
                     instance_id,
@@ -243,28 +373,46 @@ class SQLiteNodeHistory(NodeHistory):
                     ignore,
                 ) = row
                 ignore_int = SQL_TRUE if ignore else SQL_FALSE
-                expr = f"('{node_id}', '{instance_id}', '{hostname}', {create_time}, {match_time}, {ready_time}, NULL, {ignore_int})".lower()
-
-                exprs.append(expr)
-            block_size = int(os.getenv("SCALELIB_SQLITE_INSERT_BLOCK", "25"))
-            for i in range(0, len(exprs), block_size):
-                sub_exprs = exprs[i: i + block_size]
-                values_expr = ",".join(sub_exprs)
-                stmt = "INSERT OR REPLACE INTO nodes (node_id, instance_id, hostname, create_time, last_match_time, ready_time, delete_time, ignore) VALUES {}".format(
-                    values_expr
+                # ids and hostnames have always been stored in lower case
+                new_records.append(
+                    (
+                        str(node_id).lower(),
+                        str(instance_id).lower(),
+                        str(hostname).lower(),
+                        create_time,
+                        match_time,
+                        ready_time,
+                        ignore_int,
+                    )
                 )
-                self._execute(stmt)
 
-        if to_delete:
-            to_delete_expr = " OR ".join(
-                ['node_id="{}"'.format(node_id) for node_id in to_delete]
+        if new_records:
+            self._executemany(
+                """INSERT OR REPLACE INTO nodes (node_id, instance_id, hostname, create_time, last_match_time, ready_time, delete_time, ignore)
+                         VALUES (?, ?, ?, ?, ?, ?, NULL, ?)""",
+                new_records,
             )
+
+        if changed_records:
+            self._executemany(
+                "UPDATE nodes SET last_match_time=?, ready_time=?, ignore=? WHERE node_id=?",
+                changed_records,
+            )
+
+        if to_delete:
             now = self.now()
-            self._execute(
-                "UPDATE nodes set delete_time={} where {}".format(now, to_delete_expr)
+            self._executemany(
+                "UPDATE nodes set delete_time=? where node_id=?",
+                [(now, node_id) for node_id in to_delete],
             )
 
-        self.retire_records(commit=True)
+        self.retire_records(commit=False)
+
+    def _quantize_match_time(self, now: float) -> float:
+        if self.last_match_quantum <= 0:
+            return now
+        # round up, so that idle nodes are never reported as unmatched early.
+        return math.ceil(now / self.last_match_quantum) * self.last_match_quantum
 
     def retire_records(
         self, timeout: int = (7 * 24 * 60 * 60), commit: bool = True
@@ -274,9 +422,8 @@ class SQLiteNodeHistory(NodeHistory):
 
         retire_omega = self.now() - timeout
         cursor = self._execute(
-            """DELETE from nodes where delete_time is not null AND delete_time < {} AND delete_time > 0""".format(
-                retire_omega
-            )
+            """DELETE from nodes where delete_time is not null AND delete_time < ? AND delete_time > 0""",
+            (retire_omega,),
         )
         deleted = list(cursor)
         logging.info(
@@ -290,9 +437,8 @@ class SQLiteNodeHistory(NodeHistory):
         omega = now - for_at_least
         return list(
             self._execute(
-                "SELECT node_id, hostname, last_match_time from nodes where last_match_time < {}".format(
-                    omega
-                )
+                "SELECT node_id, hostname, last_match_time from nodes where last_match_time < ?",
+                (omega,),
             )
         )
 
@@ -302,35 +448,32 @@ class SQLiteNodeHistory(NodeHistory):
 
         return list(
             self._execute(
-                f"SELECT node_id, hostname, create_time as ctime from nodes where ctime < {omega} AND ready_time < create_time"
+                "SELECT node_id, hostname, create_time as ctime from nodes where ctime < ? AND ready_time < create_time",
+                (omega,),
             )
         )
 
     def decorate(self, nodes: typing.List[Node], config: typing.Dict = {}) -> None:
-        for i in range(0, len(nodes), 100):
-            nodes_sublist = nodes[i: i + 100]
-            self._decorate(nodes_sublist)
+        # a single query, see _select_by_ids
+        self._decorate(nodes, config)
 
     def _decorate(self, nodes: typing.List[Node], config: typing.Dict = {}) -> None:
         if not nodes:
             nodes = []
 
         nodes = [n for n in nodes if n.exists]
-        equalities = [
-            " (node_id == '{}') ".format(n.delayed_node_id.node_id) for n in nodes
-        ]
 
-        if not equalities:
+        if not nodes:
             return
 
-        stmt = "select node_id, create_time, last_match_time, ready_time, delete_time from nodes where {}".format(
-            "{}".format(" OR ".join(equalities))
+        rows = self._select_by_ids(
+            "nodes.node_id, create_time, last_match_time, ready_time, delete_time",
+            [n.delayed_node_id.node_id for n in nodes],
         )
-
-        rows = self._execute(stmt)
-        rows_by_id = partition_single(list(rows), lambda r: r[0])
+        rows_by_id = partition_single(rows, lambda r: r[0])
 
         now = self.now()
+        timeouts = _NodeArrayTimeouts(config)
 
         for node in nodes:
             node_id = node.delayed_node_id.node_id
@@ -344,33 +487,7 @@ class SQLiteNodeHistory(NodeHistory):
                 continue
 
             if node_id in rows_by_id:
-
-                (
-                    node_id,
-                    create_time,
-                    last_match_time,
-                    ready_time,
-                    delete_time,
-                ) = rows_by_id[node_id]
-
-                node.create_time_unix = create_time
-                node.last_match_time_unix = last_match_time
-                node.delete_time_unix = delete_time
-                boot_timeout = parse_boot_timeout(config, node)
-                idle_timeout = parse_idle_timeout(config, node)
-                if boot_timeout:
-                    if ready_time < 1:
-                        create_elapsed = max(0, now - create_time)
-                        create_remaining = max(0, boot_timeout - create_elapsed)
-                        node.create_time_remaining = create_remaining
-
-                if idle_timeout:
-                    if node.keep_alive or node.state != "Ready":
-                        node.idle_time_remaining = -1
-                    else:
-                        match_elapsed = max(0, now - last_match_time)
-                        match_remaining = max(0, idle_timeout - match_elapsed)
-                        node.idle_time_remaining = match_remaining
+                _decorate_node(node, rows_by_id[node_id][1:], now, timeouts)
 
     def find_ignored(self) -> NodeHistoryResult:
         return list(
@@ -380,24 +497,484 @@ class SQLiteNodeHistory(NodeHistory):
         )
 
     def mark_ignored(self, nodes: typing.List[Node]) -> None:
-        for n in nodes:
-            if n.delayed_node_id:
-                self._execute(
-                    f"UPDATE nodes SET ignore={SQL_TRUE} WHERE node_id='{n.delayed_node_id.node_id}'"
-                )
+        self._executemany(
+            "UPDATE nodes SET ignore=? WHERE node_id=?",
+            [
+                (SQL_TRUE, n.delayed_node_id.node_id)
+                for n in nodes
+                if n.delayed_node_id
+            ],
+        )
         self.conn.commit()
 
     def unmark_ignored(self, nodes: typing.List[Node]) -> None:
-        for n in nodes:
-            if n.delayed_node_id:
-                self._execute(
-                    f"UPDATE nodes SET ignore={SQL_FALSE} WHERE node_id='{n.delayed_node_id.node_id}'"
+        self._executemany(
+            "UPDATE nodes SET ignore=? WHERE node_id=?",
+            [
+                (SQL_FALSE, n.delayed_node_id.node_id)
+                for n in nodes
+                if n.delayed_node_id
+            ],
+        )
+        self.conn.commit()
+
+    @contextmanager
+    def _transaction(self) -> typing.Iterator[None]:
+        if self.conn.in_transaction:
+            self.conn.commit()
+
+        # IMMEDIATE takes the write lock up front, so what we read can not change
+        # before we write it back. In WAL mode this does not block readers.
+        self._execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def _select_by_ids(
+        self, columns: str, node_ids: typing.List[typing.Optional[NodeId]]
+    ) -> typing.List[typing.Tuple]:
+        """
+        Selects columns from the nodes with the given node_ids, by joining
+        against a temp table of the ids instead of a long chain of OR expressions.
+        """
+        self._execute(
+            "CREATE TEMP TABLE IF NOT EXISTS lookup_ids (node_id TEXT PRIMARY KEY)"
+        )
+        self._execute("DELETE FROM lookup_ids")
+        self._executemany(
+            "INSERT OR IGNORE INTO lookup_ids (node_id) VALUES (?)",
+            [(node_id,) for node_id in node_ids],
+        )
+        # CROSS JOIN makes sqlite loop over the ids and use the primary key of
+        # nodes, rather than scanning nodes.
+        rows = list(
+            self._execute(
+                "SELECT {} FROM lookup_ids CROSS JOIN nodes ON nodes.node_id = lookup_ids.node_id".format(
+                    columns
                 )
+            )
+        )
+        # writing to the temp table opened a transaction, which would otherwise
+        # keep the database locked for other connections.
         self.conn.commit()
+        return rows
 
-    def _execute(self, stmt: str) -> sqlite3.Cursor:
+    def _execute(self, stmt: str, params: typing.Sequence = ()) -> sqlite3.Cursor:
+        logging.debug("%s %s", stmt, params)
+        return self.conn.execute(stmt, params)
+
+    def _executemany(
+        self, stmt: str, params: typing.Iterable[typing.Sequence]
+    ) -> sqlite3.Cursor:
         logging.debug(stmt)
-        return self.conn.execute(stmt)
+        return self.conn.executemany(stmt, params)
 
     def __repr__(self) -> str:
         return "SQLiteNodeHistory({}, read_only={})".format(self.path, self.read_only)
+
+
+class _HistoryRecord:
+    """
+    One row of the nodes table.
+    """
+
+    __slots__ = (
+        "node_id",
+        "hostname",
+        "instance_id",
+        "create_time",
+        "last_match_time",
+        "ready_time",
+        "delete_time",
+        "ignore",
+    )
+
+    def __init__(
+        self,
+        node_id: str,
+        hostname: str,
+        instance_id: str,
+        create_time: float,
+        last_match_time: float,
+        ready_time: float,
+        delete_time: typing.Optional[float],
+        ignore: bool,
+    ) -> None:
+        self.node_id = node_id
+        self.hostname = hostname
+        self.instance_id = instance_id
+        self.create_time = create_time
+        self.last_match_time = last_match_time
+        self.ready_time = ready_time
+        self.delete_time = delete_time
+        self.ignore = ignore
+
+    @property
+    def booting(self) -> bool:
+        return self.ready_time < self.create_time
+
+    def to_row(self) -> typing.Tuple:
+        return (
+            self.node_id,
+            self.hostname,
+            self.instance_id,
+            self.create_time,
+            self.last_match_time,
+            self.ready_time,
+            self.delete_time,
+            SQL_TRUE if self.ignore else SQL_FALSE,
+        )
+
+
+class _TimeIndex:
+    """
+    node_ids sorted by a time. Changes are applied lazily on the next query, and
+    a large batch of changes (e.g. loading or retiring many nodes) is applied by
+    sorting once rather than inserting one at a time.
+    """
+
+    REBUILD_THRESHOLD = 256
+
+    def __init__(self) -> None:
+        self.__keys: typing.Dict[str, float] = {}
+        self.__sorted: typing.List[typing.Tuple[float, str]] = []
+        self.__pending: typing.List[typing.Tuple[bool, float, str]] = []
+
+    def add(self, node_id: str, key: float) -> None:
+        self.discard(node_id)
+        self.__keys[node_id] = key
+        self.__pending.append((True, key, node_id))
+
+    def discard(self, node_id: str) -> None:
+        if node_id in self.__keys:
+            key = self.__keys.pop(node_id)
+            self.__pending.append((False, key, node_id))
+
+    def before(self, omega: float) -> typing.List[typing.Tuple[float, str]]:
+        """
+        (time, node_id) for every time < omega, in time order.
+        """
+        self.__flush()
+        # (omega,) sorts before any (omega, node_id)
+        return self.__sorted[: bisect.bisect_left(self.__sorted, (omega,))]
+
+    def __flush(self) -> None:
+        if not self.__pending:
+            return
+
+        if len(self.__pending) > _TimeIndex.REBUILD_THRESHOLD:
+            self.__sorted = sorted((k, node_id) for node_id, k in self.__keys.items())
+        else:
+            for added, key, node_id in self.__pending:
+                if added:
+                    bisect.insort(self.__sorted, (key, node_id))
+                else:
+                    i = bisect.bisect_left(self.__sorted, (key, node_id))
+                    del self.__sorted[i]
+        self.__pending = []
+
+
+class MemoryNodeHistory(NodeHistory):
+    """
+    Keeps the node history in memory, for long running processes that own the
+    history. The history is loaded from and snapshotted to a file in the same
+    format as SQLiteNodeHistory, so either can be used to read it.
+    """
+
+    def __init__(
+        self,
+        path: str = "nodehistory.db",
+        read_only: bool = False,
+        last_match_quantum: float = LAST_MATCH_QUANTUM,
+        snapshot_interval: float = 60,
+    ) -> None:
+        """
+        snapshot_interval - write the history to path every this many seconds
+        from a background thread. The history is always written on close(),
+        which is also called at exit. Disable the background thread with 0.
+        """
+        self.path = path
+        self.read_only = read_only
+        self.last_match_quantum = last_match_quantum
+        self.snapshot_interval = snapshot_interval
+
+        self.__lock = threading.RLock()
+        self.__snapshot_lock = threading.Lock()
+        self.__records: typing.Dict[str, _HistoryRecord] = {}
+        self.__by_last_match = _TimeIndex()
+        # only the nodes that are booting, i.e. ready_time < create_time
+        self.__booting_by_create = _TimeIndex()
+        # only the nodes that are deleted
+        self.__deleted_by_delete = _TimeIndex()
+        self.__dirty = False
+
+        self._load()
+
+        self.__stop = threading.Event()
+        self.__snapshot_thread: typing.Optional[threading.Thread] = None
+        if not read_only:
+            atexit.register(self.close)
+            if snapshot_interval > 0:
+                self.__snapshot_thread = threading.Thread(
+                    target=self.__snapshot_loop,
+                    name="nodehistory-snapshot",
+                    daemon=True,
+                )
+                self.__snapshot_thread.start()
+
+    def _load(self) -> None:
+        conn = initialize_db(self.path, self.read_only)
+        try:
+            rows = list(
+                conn.execute(
+                    """SELECT node_id, hostname, instance_id, create_time, last_match_time, ready_time, delete_time, ignore
+                             from nodes"""
+                )
+            )
+        finally:
+            conn.close()
+
+        with self.__lock:
+            for row in rows:
+                self.__add(_HistoryRecord(*row[:-1], bool(row[-1])))  # type: ignore
+        logging.debug("Loaded %s node history records from %s", len(rows), self.path)
+
+    def update(self, nodes: typing.Iterable[Node]) -> None:
+        if self.read_only:
+            return
+
+        now = self.now()
+        match_time_now = self._quantize_match_time(now)
+
+        with self.__lock:
+            seen: typing.Set[str] = set()
+            # nodes without a node_id do not exist yet, so there is nothing to track.
+            for node in nodes:
+                if not node.delayed_node_id.node_id:
+                    continue
+
+                node_id = _history_key(node.delayed_node_id.node_id)
+                seen.add(node_id)
+                record = self.__records.get(node_id)
+
+                if record is None or record.delete_time is not None:
+                    # first time we see it, just put an entry
+                    if record is not None:
+                        self.__remove(record)
+                    record = _HistoryRecord(
+                        node_id,
+                        str(node.hostname).lower(),
+                        str(node.instance_id).lower(),
+                        now,
+                        now,
+                        0,
+                        None,
+                        False,
+                    )
+                    self.__add(record)
+
+                if node.required or node.state != "Ready":
+                    self.__set_last_match_time(record, match_time_now)
+
+                # if a node is running a job according to the scheduler, assume it
+                # is 'ready' for boot timeout purposes.
+                if node.state == "Ready" or node.metadata.get("_running_job_"):
+                    if record.ready_time < 1:
+                        self.__set_ready_time(record, now)
+
+            for record in list(self.__records.values()):
+                if record.delete_time is None and record.node_id not in seen:
+                    record.delete_time = now
+                    self.__deleted_by_delete.add(record.node_id, now)
+                    self.__dirty = True
+
+            self.retire_records()
+
+    def _quantize_match_time(self, now: float) -> float:
+        if self.last_match_quantum <= 0:
+            return now
+        # round up, so that idle nodes are never reported as unmatched early.
+        return math.ceil(now / self.last_match_quantum) * self.last_match_quantum
+
+    def retire_records(self, timeout: int = (7 * 24 * 60 * 60)) -> None:
+        if self.read_only:
+            return
+
+        retire_omega = self.now() - timeout
+        with self.__lock:
+            retired = [
+                self.__records[node_id]
+                for delete_time, node_id in self.__deleted_by_delete.before(
+                    retire_omega
+                )
+                if delete_time > 0
+            ]
+            for record in retired:
+                self.__remove(record)
+        if retired:
+            logging.info(
+                "Deleted %s nodes - %s",
+                len(retired),
+                [(r.node_id, r.hostname) for r in retired],
+            )
+
+    def find_unmatched(self, for_at_least: float = 300) -> NodeHistoryResult:
+        omega = self.now() - for_at_least
+        with self.__lock:
+            return [
+                self.__result(node_id, last_match_time)
+                for last_match_time, node_id in self.__by_last_match.before(omega)
+            ]
+
+    def find_booting(self, for_at_least: float = 1800) -> NodeHistoryResult:
+        omega = self.now() - for_at_least
+        with self.__lock:
+            return [
+                self.__result(node_id, create_time)
+                for create_time, node_id in self.__booting_by_create.before(omega)
+            ]
+
+    def find_ignored(self) -> NodeHistoryResult:
+        with self.__lock:
+            return [
+                self.__result(r.node_id, r.create_time)
+                for r in self.__records.values()
+                if r.ignore
+            ]
+
+    def mark_ignored(self, nodes: typing.List[Node]) -> None:
+        self.__set_ignore(nodes, True)
+
+    def unmark_ignored(self, nodes: typing.List[Node]) -> None:
+        self.__set_ignore(nodes, False)
+
+    def decorate(self, nodes: typing.List[Node], config: typing.Dict = {}) -> None:
+        now = self.now()
+        timeouts = _NodeArrayTimeouts(config)
+        with self.__lock:
+            for node in nodes or []:
+                if not node.exists or not node.delayed_node_id.node_id:
+                    continue
+                record = self.__records.get(_history_key(node.delayed_node_id.node_id))
+                if record:
+                    times = (
+                        record.create_time,
+                        record.last_match_time,
+                        record.ready_time,
+                        record.delete_time,
+                    )
+                    _decorate_node(node, times, now, timeouts)
+
+    def snapshot(self) -> None:
+        """
+        Writes the history to path in a single transaction, if anything changed.
+        """
+        if self.read_only:
+            return
+
+        with self.__snapshot_lock:
+            with self.__lock:
+                if not self.__dirty:
+                    return
+                rows = [r.to_row() for r in self.__records.values()]
+                self.__dirty = False
+
+            try:
+                conn = initialize_db(self.path, self.read_only)
+                try:
+                    with conn:
+                        conn.execute("DELETE FROM nodes")
+                        conn.executemany(
+                            """INSERT INTO nodes (node_id, hostname, instance_id, create_time, last_match_time, ready_time, delete_time, ignore)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                            rows,
+                        )
+                finally:
+                    conn.close()
+            except Exception:
+                with self.__lock:
+                    self.__dirty = True
+                raise
+
+    def close(self) -> None:
+        """
+        Stops the background snapshots and writes a final snapshot.
+        """
+        if self.read_only:
+            return
+        self.__stop.set()
+        if self.__snapshot_thread:
+            self.__snapshot_thread.join()
+            self.__snapshot_thread = None
+        self.snapshot()
+        atexit.unregister(self.close)
+
+    def __snapshot_loop(self) -> None:
+        while not self.__stop.wait(self.snapshot_interval):
+            try:
+                self.snapshot()
+            except Exception:
+                logging.exception("Could not snapshot node history to %s", self.path)
+
+    def __result(
+        self, node_id: str, time: float
+    ) -> typing.Tuple[NodeId, Hostname, float]:
+        return (
+            NodeId(node_id),
+            Hostname(self.__records[node_id].hostname),
+            time,
+        )
+
+    def __set_ignore(self, nodes: typing.List[Node], ignore: bool) -> None:
+        with self.__lock:
+            for node in nodes:
+                if not node.delayed_node_id.node_id:
+                    continue
+                record = self.__records.get(_history_key(node.delayed_node_id.node_id))
+                if record and record.ignore != ignore:
+                    record.ignore = ignore
+                    self.__dirty = True
+
+    def __set_last_match_time(
+        self, record: _HistoryRecord, last_match_time: float
+    ) -> None:
+        if record.last_match_time == last_match_time:
+            return
+        record.last_match_time = last_match_time
+        self.__by_last_match.add(record.node_id, last_match_time)
+        self.__dirty = True
+
+    def __set_ready_time(self, record: _HistoryRecord, ready_time: float) -> None:
+        record.ready_time = ready_time
+        if record.booting:
+            self.__booting_by_create.add(record.node_id, record.create_time)
+        else:
+            self.__booting_by_create.discard(record.node_id)
+        self.__dirty = True
+
+    def __add(self, record: _HistoryRecord) -> None:
+        self.__records[record.node_id] = record
+        self.__by_last_match.add(record.node_id, record.last_match_time)
+        if record.booting:
+            self.__booting_by_create.add(record.node_id, record.create_time)
+        if record.delete_time is not None:
+            self.__deleted_by_delete.add(record.node_id, record.delete_time)
+        self.__dirty = True
+
+    def __remove(self, record: _HistoryRecord) -> None:
+        self.__records.pop(record.node_id)
+        self.__by_last_match.discard(record.node_id)
+        self.__booting_by_create.discard(record.node_id)
+        self.__deleted_by_delete.discard(record.node_id)
+        self.__dirty = True
+
+    def __repr__(self) -> str:
+        return "MemoryNodeHistory({}, read_only={})".format(self.path, self.read_only)
+
+
+def _history_key(node_id: NodeId) -> str:
+    # ids have always been stored in lower case
+    return str(node_id).lower()
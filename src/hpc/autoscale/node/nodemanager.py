@@ -1,11 +1,27 @@
-import functools
+import heapq
 import re
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from typing import Callable, Dict, List, Optional, Tuple, TypeVar, Union
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from uuid import uuid4
 
 from cyclecloud.model.ClusterStatusModule import ClusterStatus
 from cyclecloud.model.NodearrayBucketStatusModule import NodearrayBucketStatus
-from cyclecloud.model.NodeCreationResultModule import NodeCreationResult
 from cyclecloud.model.NodeListModule import NodeList
 from cyclecloud.model.NodeManagementResultModule import NodeManagementResult
 from cyclecloud.model.NodeManagementResultNodeModule import NodeManagementResultNode
@@ -22,9 +38,9 @@ from hpc.autoscale.hpclogging import apitrace
 from hpc.autoscale.node import constraints as constraintslib
 from hpc.autoscale.node import vm_sizes
 from hpc.autoscale.node.bucket import (
+    CandidateCache,
     NodeBucket,
     NodeDefinition,
-    bucket_candidates,
     node_from_bucket,
 )
 from hpc.autoscale.node.constraints import NodeConstraint, get_constraints
@@ -42,8 +58,8 @@ from hpc.autoscale.results import (
     DeallocateResult,
     DeleteResult,
     MatchResult,
+    Reason,
     RemoveResult,
-    SatisfiedResult,
     ShutdownResult,
     StartResult,
     TerminateResult,
@@ -77,17 +93,48 @@ class NodeManager:
         self, cluster_bindings: ClusterBindingInterface, node_buckets: List[NodeBucket],
     ) -> None:
         self.__cluster_bindings = cluster_bindings
-        self.__node_buckets = node_buckets
+        self.__default_resources: List[_DefaultResource] = []
+        # how many of __default_resources have been applied to every bucket/node
+        self.__defaults_applied = 0
+        self.__defer_defaults = False
+        self.__node_buckets: List[NodeBucket] = []
+        self.__buckets_by_id_and_pg: Dict[
+            Tuple[ht.BucketId, Optional[ht.PlacementGroup]], NodeBucket
+        ] = {}
+        self.__buckets_by_nodearray_and_pg: Dict[
+            Tuple[ht.NodeArrayName, Optional[ht.PlacementGroup]], List[NodeBucket]
+        ] = {}
+        for node_bucket in node_buckets:
+            self._add_bucket(node_bucket)
         self._node_names = {}
         for node_bucket in node_buckets:
             for node in node_bucket.nodes:
                 self._node_names[node.name] = True
 
-        self.__default_resources: List[_DefaultResource] = []
         self.__journal: List[_JournalEntry] = []
+        self.__candidate_cache = CandidateCache()
+        self.__name_allocators: Dict[ht.NodeArrayName, _NodeNameAllocator] = {}
+        # names handed out by _next_node_name that are not committed yet
+        self.__uncommitted_names: Dict[ht.NodeName, ht.NodeArrayName] = {}
+        # seconds spent in each phase of building this NodeManager, see timings
+        self.__timings: Dict[str, float] = {}
+        # node operations are split into requests of at most max_batch_size
+        # nodes (0 means no limit), with up to max_workers requests in flight.
+        self.max_batch_size = 0
+        self.max_workers = 4
         # list of nodes a user has 'allocated'.
         # self.new_nodes = []  # type: List[Node]
 
+    @property
+    def timings(self) -> Dict[str, float]:
+        """
+        Seconds spent in each phase of building this NodeManager, when built by
+        new_node_manager: fetch (the cluster status request), parse (filtering,
+        limits and partitioning the nodes) and buckets (creating the buckets and
+        their nodes).
+        """
+        return self.__timings
+
     @property
     def new_nodes(self) -> List[Node]:
         return [
@@ -100,8 +147,15 @@ class NodeManager:
 
     def _add_bucket(self, bucket: NodeBucket) -> None:
         self.__node_buckets.append(bucket)
+        self.__buckets_by_id_and_pg[(bucket.bucket_id, bucket.placement_group)] = bucket
+        self.__buckets_by_nodearray_and_pg.setdefault(
+            (bucket.nodearray, bucket.placement_group), []
+        ).append(bucket)
+        # the new bucket needs every default, not just the pending ones
+        self.__defaults_applied = 0
 
     @apitrace
+    @constraintslib.constraint_cache()
     def allocate(
         self,
         constraints: Union[List[constraintslib.Constraint], constraintslib.Constraint],
@@ -128,10 +182,12 @@ class NodeManager:
 
         parsed_constraints = constraintslib.get_constraints(constraints)
 
-        candidates_result = bucket_candidates(self.get_buckets(), parsed_constraints)
+        candidates_result = self.__candidate_cache.bucket_candidates(
+            self.get_buckets(), parsed_constraints
+        )
         if not candidates_result:
             return AllocationResult(
-                "NoCandidatesFound", reasons=candidates_result.reasons,
+                "NoCandidatesFound", reasons=candidates_result.raw_reasons,
             )
 
         logging.debug(
@@ -141,7 +197,7 @@ class NodeManager:
         allocated_nodes = {}
         total_slots_allocated = 0
 
-        additional_reasons = []
+        additional_reasons: List[Union[str, Reason]] = []
 
         for candidate in candidates_result.candidates:
 
@@ -200,7 +256,7 @@ class NodeManager:
 
                 if not result:
                     if hasattr(result, "reasons"):
-                        additional_reasons.extend(result.reasons)
+                        additional_reasons.extend(result.raw_reasons)
                     continue
 
                 for node in result.nodes:
@@ -241,7 +297,7 @@ class NodeManager:
         remaining = slot_count
         allocated_nodes: Dict[str, Tuple[Node, Node]] = {}
         alloc_result: Optional[AllocationResult] = None
-        reasons = []
+        reasons: List[Union[str, Reason]] = []
 
         assert remaining > 0
 
@@ -261,7 +317,7 @@ class NodeManager:
                 for cons in constraints:
                     res = cons.satisfied_by_bucket(bucket)
                     if not res:
-                        reasons.extend(res.reasons)
+                        reasons.extend(res.raw_reasons)
                 break
 
             alloc_result = self._allocate_nodes(
@@ -276,7 +332,7 @@ class NodeManager:
             )
 
             if not alloc_result:
-                reasons.extend(alloc_result.reasons)
+                reasons.extend(alloc_result.raw_reasons)
                 break
 
             for node in alloc_result.nodes:
@@ -334,9 +390,6 @@ class NodeManager:
         assignment_id: Optional[str] = None,
         commit: bool = True,
     ) -> AllocationResult:
-        for node in bucket.nodes:
-            assert node.placement_group == bucket.placement_group
-
         if not allow_existing and bucket.available_count < 1:
             return AllocationResult(
                 "OutOfCapacity",
@@ -366,9 +419,9 @@ class NodeManager:
                 min_space = remaining_slots()
             else:
                 for constraint in constraints:
-                    res = constraint.satisfied_by_node(node)
+                    res = constraintslib.satisfied_by_node(constraint, node)
                     assert res, "{} {} {}".format(res, constraint, node.vcpu_count)
-                    m = constraint.minimum_space(node)
+                    m = constraintslib.minimum_space(constraint, node)
                     assert (
                         m != 0
                     ), "{} satisfies node {} but minimum_space was {}".format(
@@ -378,9 +431,9 @@ class NodeManager:
             per_node = 1 if total_iterations < 0 else min(remaining_slots(), min_space)
             if per_node == 0:
                 for constraint in constraints:
-                    res = constraint.satisfied_by_node(node)
+                    res = constraintslib.satisfied_by_node(constraint, node)
                     assert res, "{} {} {}".format(res, constraint, node.vcpu_count)
-                    m = constraint.minimum_space(node)
+                    m = constraintslib.minimum_space(constraint, node)
                     assert (
                         m != 0
                     ), "{} satisfies node {} but minimum_space was {}".format(
@@ -407,26 +460,20 @@ class NodeManager:
                 ],
             )
 
-        for node in bucket.nodes:
+        # only visit the open nodes that have enough resources left for
+        # the MinResourcePerNode constraints.
+        for node in bucket.open_nodes(constraints):
+            assert node.placement_group == bucket.placement_group
 
             if node.closed:
                 continue
 
-            satisfied: Union[SatisfiedResult, bool]
-
-            if constraints:
-                for c in constraints:
-
-                    result = c.satisfied_by_node(node)
-                    if not result:
-                        satisfied = result
-
-                satisfied: bool = functools.reduce(lambda a, b: bool(a) and bool(b), [c.satisfied_by_node(node) for c in constraints])  # type: ignore
-            else:
-                satisfied = True
+            satisfied = all(
+                constraintslib.satisfied_by_node(c, node) for c in constraints
+            )
 
             if satisfied:
-                
+
                 do_decrement = node.state == "Deallocated" and not node.assignments
 
                 per_node = _per_node(node, constraints)
@@ -516,16 +563,12 @@ class NodeManager:
 
         self.__journal = []
 
-        by_name = partition(bucket.nodes, lambda n: n.name)
         new_nodes = [n[0] for n in allocated_nodes if not n[0].exists]
-
-        for new_node in new_nodes:
-            if new_node.name not in by_name:
-                bucket.add_nodes([new_node])
-                by_name[new_node.name] = [new_node]
+        bucket.add_nodes(new_nodes)
 
         for node in new_nodes:
             self._node_names[node.name] = True
+            self.__uncommitted_names.pop(node.name, None)
 
         bucket.commit()
         return [n[1] for n in allocated_nodes]
@@ -536,9 +579,12 @@ class NodeManager:
 
         self.__journal = []
         bucket.rollback()
-        for name in list(self._node_names.keys()):
-            if not self._node_names[name]:
+        for name, nodearray in self.__uncommitted_names.items():
+            if not self._node_names.get(name, True):
                 self._node_names.pop(name)
+                # let the next new node reuse this name
+                self.__name_allocator(nodearray).release(name)
+        self.__uncommitted_names.clear()
 
     @apitrace
     def allocate_at_least(
@@ -578,19 +624,26 @@ class NodeManager:
 
         if allow_existing:
             # let's include the unallocated existing nodes
-            for node in bucket.nodes:
-                if not node._allocated:
-                    available_count_total += 1
+            available_count_total += bucket.unallocated_count
         return available_count_total
 
     def _next_node_name(self, bucket: NodeBucket) -> ht.NodeName:
-        index = 1
+        allocator = self.__name_allocator(bucket.nodearray)
         while True:
-            name = ht.NodeName("{}-{}".format(bucket.nodearray, index))
+            name = allocator.next_name()
             if name not in self._node_names:
                 self._node_names[name] = False
+                self.__uncommitted_names[name] = bucket.nodearray
                 return name
-            index += 1
+
+    def __name_allocator(self, nodearray: ht.NodeArrayName) -> "_NodeNameAllocator":
+        if nodearray not in self.__name_allocators:
+            # seeded lazily, so that it includes all of the names passed in
+            # after construction, i.e. by _new_node_manager_79
+            self.__name_allocators[nodearray] = _NodeNameAllocator(
+                nodearray, self._node_names
+            )
+        return self.__name_allocators[nodearray]
 
     @apitrace
     def add_unmanaged_nodes(self, existing_nodes: List[UnmanagedNode]) -> None:
@@ -604,17 +657,15 @@ class NodeManager:
             lambda n: (n.placement_group, n.bucket_id),
         )
 
-        buckets = partition_single(
-            self.__node_buckets, lambda b: (b.placement_group, b.bucket_id)
-        )
-
         for key, nodes_list in by_key.items():
-            if key in buckets:
-                buckets[key].add_nodes(nodes_list)
-                continue
-
             placement_group, bucket_id = key
 
+            if (bucket_id, placement_group) in self.__buckets_by_id_and_pg:
+                self.__buckets_by_id_and_pg[(bucket_id, placement_group)].add_nodes(
+                    nodes_list
+                )
+                continue
+
             a_node = nodes_list[0]
             # create a null definition, limits and bucket for each
             # unique set of unmanaged nodes
@@ -640,25 +691,30 @@ class NodeManager:
                 node_def, limits, len(nodes_list), nodes_list, artificial=True
             )
 
-            self.__node_buckets.append(bucket)
+            self._add_bucket(bucket)
             bucket.add_nodes(nodes_list)
 
-        self._apply_defaults_all()
+        self.__defaults_applied = 0
+        if not self.__defer_defaults:
+            self._apply_defaults_all()
 
     def get_nodes(self) -> List[Node]:
         # TODO slow
+        self._apply_defaults_all()
         ret: List[Node] = []
         for node_bucket in self.__node_buckets:
             ret.extend(node_bucket.nodes)
         return ret
 
     def get_non_failed_nodes(self) -> List[Node]:
+        self._apply_defaults_all()
         ret: List[Node] = []
         for node_bucket in self.__node_buckets:
             ret.extend([n for n in node_bucket.nodes if n.state != "Failed"])
         return ret
 
     def get_failed_nodes(self) -> List[Node]:
+        self._apply_defaults_all()
         ret: List[Node] = []
         for node_bucket in self.__node_buckets:
             ret.extend([n for n in node_bucket.nodes if n.state == "Failed"])
@@ -668,6 +724,7 @@ class NodeManager:
         return self.new_nodes
 
     def get_buckets(self) -> List[NodeBucket]:
+        self._apply_defaults_all()
         return self.__node_buckets
 
     def get_buckets_by_id(self) -> Dict[ht.BucketId, NodeBucket]:
@@ -687,9 +744,33 @@ class NodeManager:
         )
         return self._get_nodes_by_id(relevant_node_list)
 
-    def _get_nodes_by_id(self, relevant_node_list: NodeList) -> List[Node]:
-        relevant_node_names = [n["Name"] for n in relevant_node_list.nodes]
+    def _get_nodes_by_operations(
+        self, operation_ids: List[ht.OperationId]
+    ) -> Dict[ht.OperationId, List[Node]]:
+        """
+        Like get_nodes_by_operation, but only fetches the cluster status once.
+        """
+        if not operation_ids:
+            return {}
         updated_cluster_status = self.__cluster_bindings.get_cluster_status(True)
+        ret: Dict[ht.OperationId, List[Node]] = {}
+        for operation_id in operation_ids:
+            relevant_node_list = self.__cluster_bindings.get_nodes(
+                operation_id=operation_id
+            )
+            ret[operation_id] = self._get_nodes_by_id(
+                relevant_node_list, updated_cluster_status
+            )
+        return ret
+
+    def _get_nodes_by_id(
+        self,
+        relevant_node_list: NodeList,
+        updated_cluster_status: Optional[ClusterStatus] = None,
+    ) -> List[Node]:
+        relevant_node_names = [n["Name"] for n in relevant_node_list.nodes]
+        if updated_cluster_status is None:
+            updated_cluster_status = self.__cluster_bindings.get_cluster_status(True)
 
         updated_cc_nodes = partition_single(
             updated_cluster_status.nodes, lambda n: n["Name"]
@@ -741,61 +822,60 @@ class NodeManager:
         nodes_to_create = [n for n in nodes if n.target_state != "Deallocated"]
         booted_nodes = []
 
-        operation_id: str = ""
-
-        if nodes_to_start:
-            start_result: NodeManagementResult = self.__cluster_bindings.start_nodes(
-                nodes_to_start, request_id=request_id_start
+        requests: List[_NodeOperationRequest] = []
+        requests.extend(
+            self._node_operation_requests(
+                "start_nodes",
+                self.__cluster_bindings.start_nodes,
+                nodes_to_start,
+                request_id_start,
             )
-            operation_id = start_result.operation_id
-
-            started_nodes = self.get_nodes_by_operation(start_result.operation_id)
-
-            started_node_mappings: Dict[str, Node] = partition_single(
-                started_nodes, lambda n: n.name
+        )
+        requests.extend(
+            self._node_operation_requests(
+                "create_nodes",
+                self.__cluster_bindings.create_nodes,
+                nodes_to_create,
+                request_id_create,
             )
+        )
+        # more than one per operation if they were split into chunks
+        request_ids = [r.request_id for r in requests if r.request_id]
 
-            for offset, node in enumerate(started_nodes):
-                node.delayed_node_id.operation_id = start_result.operation_id
-                node.delayed_node_id.operation_offset = offset
-                if node.name in started_node_mappings:
-                    booted_nodes.append(node)
-                else:
-                    node.state = ht.NodeStatus("Unknown")
-
-        if nodes_to_create:
-
-            create_result: NodeCreationResult = self.__cluster_bindings.create_nodes(
-                nodes_to_create, request_id=request_id_create
-            )
+        self._dispatch(requests)
 
-            if operation_id:
-                operation_id = operation_id + "," + create_result.operation_id
-            else:
-                operation_id = create_result.operation_id
+        for request in requests:
+            if request.result and request.name == "create_nodes":
+                for s in request.result.sets:
+                    if s.message:
+                        logging.warning(s.message)
+                    else:
+                        logging.info("Create %d nodes", s.added)
 
-            for s in create_result.sets:
-                if s.message:
-                    logging.warning(s.message)
-                else:
-                    logging.info("Create %d nodes", s.added)
+        operation_ids = [r.result.operation_id for r in requests if r.result]
+        nodes_by_operation = self._get_nodes_by_operations(operation_ids)
 
-            created_nodes = self.get_nodes_by_operation(create_result.operation_id)
+        for operation_id in operation_ids:
+            operation_nodes = nodes_by_operation[operation_id]
 
-            created_node_mappings: Dict[str, Node] = partition_single(
-                created_nodes, lambda n: n.name
+            operation_node_mappings: Dict[str, Node] = partition_single(
+                operation_nodes, lambda n: n.name
             )
 
-            for offset, node in enumerate(created_nodes):
-                node.delayed_node_id.operation_id = create_result.operation_id
+            for offset, node in enumerate(operation_nodes):
+                node.delayed_node_id.operation_id = operation_id
                 node.delayed_node_id.operation_offset = offset
-                if node.name in created_node_mappings:
+                if node.name in operation_node_mappings:
                     booted_nodes.append(node)
                 else:
                     node.state = ht.NodeStatus("Unknown")
 
         return BootupResult(
-            "success", ht.OperationId(operation_id), request_ids, booted_nodes
+            "success",
+            ht.OperationId(",".join(operation_ids)),
+            request_ids,
+            booted_nodes,
+            reasons=_failed_request_reasons(requests),
         )
 
     @property
@@ -917,23 +997,29 @@ class NodeManager:
         constraints = constraintslib.get_constraints(selection)
 
         default_value_expr = str(default_value)
-        if not hasattr(default_value, "__call__"):
-
-            def default_value_func(node: Node) -> ht.ResourceTypeAtom:
+        default_value_func: DefaultValueFunc
+        if (
+            isinstance(default_value, str)
+            and len(default_value) > 1
+            and default_value.startswith("`")
+            and default_value.endswith("`")
+        ):
+            default_value_func = _CompiledExpression(default_value[1:-1])
+
+        elif not hasattr(default_value, "__call__"):
+
+            def _literal_value(node: Node) -> ht.ResourceTypeAtom:
                 # already checked if it has a call
                 ret = default_value
                 if isinstance(default_value, str):
-                    if default_value.startswith("`") and default_value.endswith("`"):
-                        expr = default_value[1:-1]
-                        return eval(
-                            "(lambda: {})()".format(expr), {"node": node.clone()}
-                        )
-                    elif re.match("size::[0-9a-zA-Z]+", default_value):
+                    if re.match("size::[0-9a-zA-Z]+", default_value):
                         ret = ht.Size.value_of(default_value)
                     elif re.match("memory::[0-9a-zA-Z]+", default_value):
                         ret = ht.Memory.value_of(default_value)
                 return ret  # type: ignore
 
+            default_value_func = _literal_value
+
         else:
             default_value_func = default_value  # type: ignore
 
@@ -947,17 +1033,54 @@ class NodeManager:
             allow_none,
         )
         self.__default_resources.append(dr)
+        # callers may already hold nodes, so apply it now unless we are
+        # within _deferred_defaults.
+        if not self.__defer_defaults:
+            self._apply_defaults_all()
+
+    @contextmanager
+    def _deferred_defaults(self) -> Iterator[None]:
+        """
+        Default resources added within this block are applied to every bucket
+        and node in a single pass at the end, rather than one at a time.
+        """
+        self.__defer_defaults = True
+        try:
+            yield
+        finally:
+            self.__defer_defaults = False
         self._apply_defaults_all()
 
     def _apply_defaults_all(self) -> None:
+        """
+        Applies the default resources that have not been applied yet to every
+        bucket and node, in the order they were added. Selections that only
+        depend on bucket level properties are evaluated once per bucket.
+        """
+        pending = self.__default_resources[self.__defaults_applied :]
+        if not pending:
+            return
+        self.__defaults_applied = len(self.__default_resources)
+
+        # the example nodes may change, so the candidates may as well
+        self.__candidate_cache.clear()
+
+        for bucket in self.__node_buckets:
+            selected: List[Optional[bool]] = []
+            for dr in pending:
+                bucket_selected = dr.selects(bucket.example_node)
+                if bucket_selected:
+                    dr.apply_default(bucket.example_node, selected=True)
+                selected.append(
+                    bucket_selected
+                    if dr.bucket_level and not bucket._artificial
+                    else None
+                )
+            bucket.resources.update(bucket.example_node.available)
 
-        for dr in self.__default_resources:
-            for bucket in self.get_buckets():
-                dr.apply_default(bucket.example_node)
-                bucket.resources.update(bucket.example_node.available)
-
-            for node in self.get_nodes():
-                dr.apply_default(node)
+            for node in bucket.nodes:
+                for dr, node_selected in zip(pending, selected):
+                    dr.apply_default(node, selected=node_selected)
 
     def _apply_defaults(self, node: Node) -> None:
         for dr in self.__default_resources:
@@ -966,13 +1089,9 @@ class NodeManager:
     def add_placement_group(
         self, pg_name: ht.PlacementGroup, bucket: NodeBucket
     ) -> None:
-        by_key = partition(
-            self.__node_buckets, lambda b: (b.nodearray, b.placement_group)
-        )
-
         key = (bucket.nodearray, pg_name)
 
-        if key in by_key:
+        if key in self.__buckets_by_nodearray_and_pg:
             logging.warning(
                 "Bucket with nodearray=%s, vm_size=%s, location=%s and placement group %s already exists. Ignoring",
                 bucket.nodearray,
@@ -982,7 +1101,7 @@ class NodeManager:
             )
             return
 
-        self.__node_buckets.append(bucket.clone_with_placement_group(pg_name))
+        self._add_bucket(bucket.clone_with_placement_group(pg_name))
 
     @apitrace
     def deallocate_nodes(self, nodes: List[Node]) -> DeallocateResult:
@@ -1011,7 +1130,10 @@ class NodeManager:
     @apitrace
     def start_nodes(self, nodes: List[Node], request_id: Optional[str] = None) -> StartResult:
         return self._nodes_operation(
-            nodes, lambda n: self.__cluster_bindings.start_nodes(n, request_id=request_id), StartResult
+            nodes,
+            self.__cluster_bindings.start_nodes,
+            StartResult,
+            request_id=ht.RequestId(request_id) if request_id else None,
         )
 
     @apitrace
@@ -1027,8 +1149,9 @@ class NodeManager:
     def _nodes_operation(
         self,
         nodes: List[Node],
-        function: Callable[[List[Node]], NodeManagementResult],
-        ctor: Callable[[str, ht.OperationId, Optional[ht.RequestId], List[Node]], T],
+        function: Callable[..., NodeManagementResult],
+        ctor: Callable[..., T],
+        request_id: Optional[ht.RequestId] = None,
     ) -> T:
         managed_nodes = [node for node in nodes if node.managed]
         unmanaged_node_names = [node.name for node in nodes if not node.managed]
@@ -1045,56 +1168,128 @@ class NodeManager:
             logging.warning("No nodes to {}".format(op_name))
             return ctor("success", ht.OperationId(""), None, [])
 
-        result: NodeManagementResult = function(managed_nodes)
+        requests = self._node_operation_requests(
+            op_name, function, managed_nodes, request_id
+        )
+        self._dispatch(requests)
 
         by_name = partition_single(nodes, lambda n: n.name, strict=False)
-        mgmt_by_name: Dict[ht.NodeName, NodeManagementResultNode]
-        mgmt_by_name = partition_single(result.nodes, lambda n: n.name)
-
         affected_nodes: List[Node] = []
 
+        operation_ids = [r.result.operation_id for r in requests if r.result]
         # force the node.state to be updated
-        self.get_nodes_by_operation(result.operation_id)
+        self._get_nodes_by_operations(operation_ids)
 
-        for name, mgmt_node in mgmt_by_name.items():
-            assert isinstance(mgmt_node, NodeManagementResultNode)
-
-            if name not in by_name:
+        for request in requests:
+            if not request.result:
                 continue
 
-            node = by_name[name]
-            if mgmt_node.status != "OK":
-                logging.warning("%s was unaffected by call %s", node, function.__name__)
-                continue
+            mgmt_by_name: Dict[ht.NodeName, NodeManagementResultNode]
+            mgmt_by_name = partition_single(request.result.nodes, lambda n: n.name)
 
-            affected_nodes.append(node)
+            for name, mgmt_node in mgmt_by_name.items():
+                assert isinstance(mgmt_node, NodeManagementResultNode)
 
-            if node.state in ["Terminating", "Off"]:
-                self._remove_node_internally(node)
+                if name not in by_name:
+                    continue
 
+                node = by_name[name]
+                if mgmt_node.status != "OK":
+                    logging.warning("%s was unaffected by call %s", node, op_name)
+                    continue
+
+                affected_nodes.append(node)
+
+                if node.state in ["Terminating", "Off"]:
+                    self._remove_node_internally(node)
+
+        request_ids = [r.request_id for r in requests if r.request_id]
         return ctor(
-            "success", ht.OperationId(result.operation_id), None, affected_nodes
+            "success",
+            ht.OperationId(",".join(operation_ids)),
+            request_ids or None,
+            affected_nodes,
+            reasons=_failed_request_reasons(requests),
         )
 
-    def _remove_node_internally(self, node: Node) -> None:
-        by_bucket_id_and_pg = partition_single(
-            self.__node_buckets, lambda b: (b.bucket_id, b.placement_group)
-        )
+    def _node_operation_requests(
+        self,
+        name: str,
+        function: Callable[..., Any],
+        nodes: List[Node],
+        request_id: Optional[ht.RequestId],
+    ) -> List["_NodeOperationRequest"]:
+        """
+        Splits nodes into chunks of at most max_batch_size, grouped by nodearray
+        and placement group. If there is more than one chunk, each gets its own
+        request_id, derived from request_id.
+        """
+        if not nodes:
+            return []
 
+        if self.max_batch_size <= 0 or len(nodes) <= self.max_batch_size:
+            chunks = [nodes]
+        else:
+            chunks = []
+            groups = partition(nodes, lambda n: (n.nodearray, n.placement_group))
+            for group in groups.values():
+                for i in range(0, len(group), self.max_batch_size):
+                    chunks.append(group[i : i + self.max_batch_size])  # noqa: E203
+
+        ret = []
+        for index, chunk in enumerate(chunks):
+            chunk_request_id = request_id
+            if request_id and index > 0:
+                chunk_request_id = ht.RequestId("{}-{}".format(request_id, index))
+            ret.append(_NodeOperationRequest(name, function, chunk, chunk_request_id))
+        return ret
+
+    def _dispatch(self, requests: List["_NodeOperationRequest"]) -> None:
+        """
+        Sends the requests. Unless max_batch_size is set, they are sent one at
+        a time and the first error is raised, as if the bindings were called
+        directly.
+
+        Otherwise up to max_workers are sent at a time. If every request of an
+        operation (e.g. every create_nodes chunk) fails, its first error is
+        raised, otherwise the errors are kept on each request and reported by
+        the caller.
+        """
+        if self.max_batch_size <= 0:
+            for request in requests:
+                request()
+                if request.error:
+                    raise request.error
+            return
+
+        if len(requests) <= 1 or self.max_workers <= 1:
+            for request in requests:
+                request()
+        else:
+            workers = min(self.max_workers, len(requests))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # request() never raises, see _NodeOperationRequest
+                list(executor.map(lambda r: r(), requests))
+
+        for op_requests in partition(requests, lambda r: r.name).values():
+            errors = [r.error for r in op_requests if r.error]
+            if errors and len(errors) == len(op_requests):
+                raise errors[0]
+
+    def _remove_node_internally(self, node: Node) -> None:
         key = (node.bucket_id, node.placement_group)
 
-        if key not in by_bucket_id_and_pg:
+        if key not in self.__buckets_by_id_and_pg:
             logging.warning(
                 "Unknown bucketid/placement_group??? %s not in %s",
                 key,
-                by_bucket_id_and_pg,
+                self.__buckets_by_id_and_pg,
             )
             return
 
-        bucket = by_bucket_id_and_pg[key]
-        nodes_list = bucket.nodes
+        bucket = self.__buckets_by_id_and_pg[key]
 
-        if node not in nodes_list:
+        if not bucket.has_node(node):
 
             logging.warning(
                 (
@@ -1104,7 +1299,7 @@ class NodeManager:
             )
             return
 
-        bucket.nodes.remove(node)
+        bucket.remove_node(node)
 
     def set_system_default_resources(self) -> None:
         self.add_default_resource({}, "ncpus", "node.vcpu_count")
@@ -1196,6 +1391,65 @@ class GetFromBaseNode:
         return "node.{}".format(self.attr)
 
 
+class _CompiledExpression:
+    """
+    A `backtick` default resource expression, compiled once and evaluated
+    against a read only view of each node.
+    """
+
+    def __init__(self, expr: str) -> None:
+        self.expr = expr
+        try:
+            self.__code = compile(expr, "<default_resource `{}`>".format(expr), "eval")
+        except SyntaxError as e:
+            raise RuntimeError(
+                "Invalid default resource expression `{}`: {}".format(expr, e)
+            )
+
+    def __call__(self, node: Node) -> ht.ResourceTypeAtom:
+        return eval(self.__code, {"node": _ReadOnlyNode(node)})
+
+    def __repr__(self) -> str:
+        return "`{}`".format(self.expr)
+
+
+class _ReadOnlyNode:
+    """
+    Read only view of a node for default resource expressions, so that they
+    can not modify the node without having to clone it.
+    """
+
+    __slots__ = ("_ReadOnlyNode__node",)
+
+    _MUTATORS = {"assign", "decrement", "shellify", "update"}
+
+    def __init__(self, node: Node) -> None:
+        object.__setattr__(self, "_ReadOnlyNode__node", node)
+
+    def __getattr__(self, name: str) -> Any:
+        if name in _ReadOnlyNode._MUTATORS or name.startswith("_"):
+            raise AttributeError(
+                "{} is not available in default resource expressions".format(name)
+            )
+        value = getattr(self.__node, name)
+        if isinstance(value, dict):
+            return MappingProxyType(value)
+        if isinstance(value, set):
+            return frozenset(value)
+        return value
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(
+            "Can not set {} in a default resource expression".format(name)
+        )
+
+    def __str__(self) -> str:
+        return str(self.__node)
+
+    def __repr__(self) -> str:
+        return repr(self.__node)
+
+
 class MemoryDefault:
     def __init__(self, mag: ht.MemoryMagnitude):
         self.mag = mag
@@ -1219,41 +1473,47 @@ def new_node_manager(
     ret = _new_node_manager_79(new_cluster_bindings(config), config)
     existing_nodes = existing_nodes or []
 
-    if not disable_default_resources or not config.get(
-        "disable_default_resources", False
-    ):
-        ret.set_system_default_resources()
+    node_operations = config.get("node_operations", {})
+    ret.max_batch_size = int(node_operations.get("max_batch_size", ret.max_batch_size))
+    ret.max_workers = int(node_operations.get("max_workers", ret.max_workers))
 
-    for entry in config.get("default_resources", []):
+    # register every default first, then apply them in one pass
+    with ret._deferred_defaults():
+        if not disable_default_resources or not config.get(
+            "disable_default_resources", False
+        ):
+            ret.set_system_default_resources()
 
-        try:
-            assert isinstance(entry["select"], dict)
-            assert isinstance(entry["name"], str)
-            assert isinstance(entry["value"], (str, int, float, bool))
-        except AssertionError as e:
-            raise RuntimeError(
-                "default_resources: Expected select=dict name=str value=str|int|float|bool: {}".format(
-                    e
+        for entry in config.get("default_resources", []):
+
+            try:
+                assert isinstance(entry["select"], dict)
+                assert isinstance(entry["name"], str)
+                assert isinstance(entry["value"], (str, int, float, bool))
+            except AssertionError as e:
+                raise RuntimeError(
+                    "default_resources: Expected select=dict name=str value=str|int|float|bool: {}".format(
+                        e
+                    )
                 )
-            )
-        modifier = None
-        for op in ["add", "subtract", "multiply", "divide", "divide_floor"]:
-            if op in entry:
-                if modifier:
-                    raise RuntimeError(
-                        "Can not support more than one modifier for default resources at this time. {}".format(
-                            entry
+            modifier = None
+            for op in ["add", "subtract", "multiply", "divide", "divide_floor"]:
+                if op in entry:
+                    if modifier:
+                        raise RuntimeError(
+                            "Can not support more than one modifier for default resources at this time. {}".format(
+                                entry
+                            )
                         )
-                    )
-                modifier = op
-
-        ret.add_default_resource(
-            entry["select"],
-            entry["name"],
-            entry["value"],
-            modifier,
-            entry.get(modifier, None),
-        )
+                    modifier = op
+
+            ret.add_default_resource(
+                entry["select"],
+                entry["name"],
+                entry["value"],
+                modifier,
+                entry.get(modifier, None),
+            )
 
     return ret
 
@@ -1281,19 +1541,25 @@ def _cluster_limits(cluster_name: str, cluster_status: ClusterStatus) -> _Shared
 def _new_node_manager_79(
     cluster_bindings: ClusterBindingInterface, autoscale_config: Dict,
 ) -> NodeManager:
+    timings: Dict[str, float] = {}
+    phase_start = time.perf_counter()
+
+    # the cluster status already includes every node, so there is no need to
+    # request them separately via get_nodes()
     cluster_status = cluster_bindings.get_cluster_status(nodes=True)
-    nodes_list = cluster_bindings.get_nodes()
+    nodes_list = NodeList(nodes=cluster_status.nodes)
+
+    timings["fetch"] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
 
     # to make it trivial to mimic 'onprem' nodes by simply filtering them out
     # of the response.
     mimic_on_prem = autoscale_config.get("_mimic_on_prem", [])
     if mimic_on_prem:
-        nodes_list.nodes = [
-            n for n in nodes_list.nodes if n["Name"] not in mimic_on_prem
-        ]
         cluster_status.nodes = [
             n for n in cluster_status.nodes if n["Name"] not in mimic_on_prem
         ]
+        nodes_list.nodes = cluster_status.nodes
 
     all_node_names = [n["Name"] for n in nodes_list.nodes]
 
@@ -1301,13 +1567,32 @@ def _new_node_manager_79(
 
     cluster_limit = _cluster_limits(cluster_bindings.cluster_name, cluster_status)
 
+    overrides = autoscale_config.get("_node-overrides", {})
+    if overrides:
+        for n in nodes_list.nodes:
+            n.update(overrides.get(n.get(""), {}))
+
     cc_nodes_by_template = partition(nodes_list.nodes, lambda n: n["Template"])
 
+    # partition the nodes once up front, rather than scanning every node
+    # for every bucket and placement group below.
+    cc_nodes_by_bucket_and_pg = partition(
+        [
+            n
+            for n in nodes_list.nodes
+            if n["TargetState"] == "Started" or n["Status"] == "Deallocated"
+        ],
+        lambda n: (n["Template"], n["MachineType"], n.get("PlacementGroupId")),
+    )
+
     nodearray_limits: Dict[str, _SharedLimit] = {}
     regional_limits: Dict[str, _SharedLimit] = {}
     regional_spot_limits: Dict[str, _SharedLimit] = {}
     family_limits: Dict[str, _SharedLimit] = {}
 
+    timings["parse"] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+
     for nodearray_status in cluster_status.nodearrays:
         nodearray = nodearray_status.nodearray
         nodearray_name = nodearray_status.name
@@ -1442,19 +1727,9 @@ def _new_node_manager_79(
 
                 bucket_id = bucket.bucket_id
 
-                for n in nodes_list.nodes:
-                    ov = autoscale_config.get("_node-overrides", {})
-                    n.update(ov.get(n.get(""), {}))
-
-                # TODO the bucket has a list of node names
-                cc_node_records = [
-                    n
-                    for n in nodes_list.nodes
-                    if n["Template"] == nodearray_name
-                    and n["MachineType"] == bucket.definition.machine_type
-                    and (n["TargetState"] == "Started" or n["Status"] == "Deallocated")
-                    and n.get("PlacementGroupId") == pg_name
-                ]
+                cc_node_records = cc_nodes_by_bucket_and_pg.get(
+                    (nodearray_name, bucket.definition.machine_type, pg_name), []
+                )
 
                 family_limit: Union[_SpotLimit, _SharedLimit] = family_limits[vm_family]
 
@@ -1540,9 +1815,72 @@ def _new_node_manager_79(
     ret = NodeManager(cluster_bindings, buckets)
     for name in all_node_names:
         ret._node_names[name] = True
+
+    timings["buckets"] = time.perf_counter() - phase_start
+    ret.timings.update(timings)
+    logging.debug(
+        "Built node manager with %s buckets and %s nodes in %.3fs - %s",
+        len(buckets),
+        len(all_node_names),
+        sum(timings.values()),
+        ", ".join("{}={:.3f}s".format(k, v) for k, v in timings.items()),
+    )
     return ret
 
 
+class _NodeOperationRequest:
+    """
+    One chunk of a node operation, e.g. create_nodes for up to max_batch_size
+    nodes, and its result or error.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[..., Any],
+        nodes: List[Node],
+        request_id: Optional[ht.RequestId],
+    ) -> None:
+        self.name = name
+        self.function = function
+        self.nodes = nodes
+        self.request_id = request_id
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+
+    def __call__(self) -> None:
+        try:
+            if self.request_id:
+                self.result = self.function(self.nodes, request_id=self.request_id)
+            else:
+                self.result = self.function(self.nodes)
+        except Exception as e:
+            logging.error(
+                "%s failed for %d nodes (%s): %s",
+                self.name,
+                len(self.nodes),
+                ",".join(n.name for n in self.nodes),
+                e,
+            )
+            logging.debug("Full stacktrace", exc_info=True)
+            self.error = e
+
+    def __repr__(self) -> str:
+        return "NodeOperationRequest({}, nodes={}, request_id={})".format(
+            self.name, len(self.nodes), self.request_id
+        )
+
+
+def _failed_request_reasons(requests: List[_NodeOperationRequest]) -> List[str]:
+    return [
+        "{} failed for {}: {}".format(
+            r.name, ",".join(n.name for n in r.nodes), r.error
+        )
+        for r in requests
+        if r.error
+    ]
+
+
 def _node_from_cc_node(
     cc_node_rec: dict, bucket: NodearrayBucketStatus, region: ht.Location
 ) -> Node:
@@ -1594,6 +1932,63 @@ def _node_from_cc_node(
     )
 
 
+class _NodeNameAllocator:
+    """
+    Hands out the lowest unused {nodearray}-{index} name, starting at 1, in
+    amortized constant time. Names that are released are reused first, so gaps
+    are filled exactly like probing from index 1 would.
+    """
+
+    def __init__(self, nodearray: ht.NodeArrayName, taken: Iterable[str]) -> None:
+        self.__prefix = "{}-".format(nodearray)
+        self.__taken: Set[int] = set()
+        for name in taken:
+            index = self.__index_of(name)
+            if index is not None:
+                self.__taken.add(index)
+        # every index below this is either taken or released
+        self.__next_index = 1
+        self.__released: List[int] = []
+
+    def next_name(self) -> ht.NodeName:
+        index: Optional[int] = None
+        while self.__released:
+            candidate = heapq.heappop(self.__released)
+            if candidate not in self.__taken:
+                index = candidate
+                break
+
+        if index is None:
+            while self.__next_index in self.__taken:
+                self.__next_index += 1
+            index = self.__next_index
+            self.__next_index += 1
+
+        self.__taken.add(index)
+        return ht.NodeName("{}{}".format(self.__prefix, index))
+
+    def release(self, name: str) -> None:
+        index = self.__index_of(name)
+        if index is None or index not in self.__taken:
+            return
+        self.__taken.discard(index)
+        if index < self.__next_index:
+            heapq.heappush(self.__released, index)
+
+    def __index_of(self, name: str) -> Optional[int]:
+        if not name.startswith(self.__prefix):
+            return None
+        suffix = name[len(self.__prefix) :]
+        # only exact matches, i.e. execute-01 does not block execute-1
+        if not suffix.isdigit() or str(int(suffix)) != suffix or int(suffix) < 1:
+            return None
+        return int(suffix)
+
+
+# node properties that every node in a (non-artificial) bucket shares
+_BUCKET_LEVEL_PROPERTIES = {"nodearray", "vm_size", "location", "spot"}
+
+
 class _DefaultResource:
     def __init__(
         self,
@@ -1615,16 +2010,33 @@ class _DefaultResource:
         self.modifier = modifier
         self.modifier_magnitude = modifier_magnitude
         self.allow_none = allow_none
+        # true if the selection gives the same answer for every node in a bucket
+        self.bucket_level = all(
+            isinstance(c, constraintslib.NodePropertyConstraint)
+            and c.attr in _BUCKET_LEVEL_PROPERTIES
+            for c in selection
+        )
+
+    def selects(self, node: Node) -> bool:
+        for criteria in self.selection:
+            if not criteria.satisfied_by_node(node):
+                return False
+        return True
 
-    def apply_default(self, node: Node) -> None:
+    def apply_default(self, node: Node, selected: Optional[bool] = None) -> None:
+        """
+        selected - the result of selects(node), if it is already known
+        """
 
         # obviously we don't want to override anything
-        if node.resources.get(self.resource_name) is not None:
+        if node._resources.get(self.resource_name) is not None:
             return
 
-        for criteria in self.selection:
-            if not criteria.satisfied_by_node(node):
-                return
+        if selected is None:
+            selected = self.selects(node)
+
+        if not selected:
+            return
 
         # it met all of our criteria, so set the default
         default_value = self.default_value_function(node)
@@ -1687,6 +2099,12 @@ class _DefaultResource:
 
 
 class _JournalEntry:
+    """
+    Undo log for a single decrement. Only the available resources that changed,
+    the assignment id and the allocated flag are recorded, so that rollback never
+    has to clone the node.
+    """
+
     def __init__(
         self,
         node: Node,
@@ -1697,25 +2115,35 @@ class _JournalEntry:
         self.node = node
         self.constraints = constraints
         self.per_node = per_node
-        self.assignment_id = assignment_id
+        self.assignment_id = assignment_id or str(uuid4())
         self.invoked = False
-        self.rollback_node: Optional[Node] = None
+        self.undo_log: Optional[Dict[str, Any]] = None
+        self.was_allocated = False
+        self.was_assigned = False
 
     def precommit(self) -> MatchResult:
         assert not self.invoked
-        assert not self.rollback_node
-        self.rollback_node = self.node.clone()
-        result = self.node.decrement(
-            self.constraints, self.per_node, self.assignment_id
-        )
+        assert self.undo_log is None
+        self.was_allocated = self.node._allocated
+        self.was_assigned = self.assignment_id in self.node.assignments
+        self.node._record_changes()
+        try:
+            result = self.node.decrement(
+                self.constraints, self.per_node, self.assignment_id
+            )
+        finally:
+            self.undo_log = self.node._stop_recording()
         self.invoked = True
         return result
 
     def rollback(self) -> None:
         assert self.invoked
-        assert self.rollback_node
-        self.node.update(self.rollback_node)
-        self.rollback_node = None
+        assert self.undo_log is not None
+        self.node._revert_changes(self.undo_log)
+        if not self.was_assigned:
+            self.node._unassign(self.assignment_id)
+        self.node._allocated = self.was_allocated
+        self.undo_log = None
 
     def __repr__(self) -> str:
         return "JournalEntry({}, {}, {}, {})".format(
@@ -1,22 +1,190 @@
 import json
+import mmap
 import os
-from typing import Any, Callable, Dict, List, Optional
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
 
 import hpc.autoscale.hpclogging as logging
 from hpc.autoscale import hpctypes as ht
 
 RESOURCE_FILE = os.path.join(os.path.dirname(__file__), "vm_sizes.json")
-VM_SIZES: Dict[str, Dict] = {}
+CATALOG_FILE = os.path.join(os.path.dirname(__file__), "vm_sizes.catalog")
+CATALOG_VERSION = 1
+
+
+class _JSONCatalog:
+    """
+    The original vm_sizes.json format - every location is parsed up front.
+    """
+
+    def __init__(self, vm_sizes: Dict[str, Dict[str, Dict]]) -> None:
+        self.__vm_sizes = vm_sizes
+
+    def locations(self) -> List[str]:
+        return list(self.__vm_sizes.keys())
+
+    def vm_sizes(self, location: str) -> List[str]:
+        return list(self.__vm_sizes.get(location, {}).keys())
+
+    def get(self, location: str, vm_size: str) -> Optional[Dict]:
+        return self.__vm_sizes.get(location, {}).get(vm_size)
+
+    def close(self) -> None:
+        pass
+
+
+class _CompactCatalog:
+    """
+    Reads the catalog written by write_catalog. The first line is a json
+    header of interned families, capability names (schemas) and the offset
+    of each location's section. The file is memory-mapped and a location's
+    section is only parsed the first time one of its vm sizes is looked up.
+    Records are kept as (family, schema, values, extra) tuples until
+    requested.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as fr:
+            self.__mmap = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_line = self.__mmap.readline()
+        header = json.loads(header_line)
+        if header.get("version") != CATALOG_VERSION:
+            self.close()
+            raise RuntimeError(
+                "Unsupported vm size catalog version {} in {}".format(
+                    header.get("version"), path
+                )
+            )
+
+        self.__body_offset = len(header_line)
+        self.__families: List[str] = [sys.intern(f) for f in header["families"]]
+        self.__schemas: List[Tuple[str, ...]] = [
+            tuple(sys.intern(key) for key in schema) for schema in header["schemas"]
+        ]
+        self.__sections: Dict[str, Tuple[int, int]] = {
+            loc: (offset, length)
+            for loc, (offset, length) in header["locations"].items()
+        }
+        self.__loaded: Dict[str, Dict[str, Tuple]] = {}
+
+    def locations(self) -> List[str]:
+        return list(self.__sections.keys())
+
+    def vm_sizes(self, location: str) -> List[str]:
+        return list(self.__load(location).keys())
+
+    def get(self, location: str, vm_size: str) -> Optional[Dict]:
+        compact = self.__load(location).get(vm_size)
+        if compact is None:
+            return None
+
+        family_index, schema_index, values, extra = compact
+        record = {
+            "name": vm_size,
+            "location": location,
+            "family": self.__families[family_index],
+        }
+        record.update(extra)
+        record["capabilities"] = dict(zip(self.__schemas[schema_index], values))
+        return record
+
+    def __load(self, location: str) -> Dict[str, Tuple]:
+        if location in self.__loaded:
+            return self.__loaded[location]
+
+        section = self.__sections.get(location)
+        if section is None:
+            return {}
+
+        offset, length = section
+        start = self.__body_offset + offset
+        raw = json.loads(self.__mmap[start : start + length])
+        loaded = {vm_size: tuple(compact) for vm_size, compact in raw.items()}
+        self.__loaded[location] = loaded
+        return loaded
+
+    def close(self) -> None:
+        self.__mmap.close()
+
+
+def write_catalog(vm_sizes: Dict[str, Dict[str, Dict]], path: str) -> None:
+    """
+    Writes vm_sizes (location -> vm size -> record, as in vm_sizes.json) in the
+    compact format read by _CompactCatalog.
+    """
+    families: Dict[str, int] = {}
+    schemas: Dict[Tuple[str, ...], int] = {}
+    sections: List[bytes] = []
+    locations: Dict[str, List[int]] = {}
+    offset = 0
+
+    for location in sorted(vm_sizes):
+        section = {}
+        for vm_size in sorted(vm_sizes[location]):
+            record = vm_sizes[location][vm_size]
+            family = record.get("family", "unknown")
+            capabilities = record.get("capabilities", {})
+            schema = tuple(capabilities.keys())
+            extra = {}
+            for key, value in record.items():
+                if key in ["family", "capabilities"]:
+                    continue
+                if key == "name" and value == vm_size:
+                    continue
+                if key == "location" and value == location:
+                    continue
+                extra[key] = value
+
+            section[vm_size] = [
+                families.setdefault(family, len(families)),
+                schemas.setdefault(schema, len(schemas)),
+                list(capabilities.values()),
+                extra,
+            ]
+
+        encoded = json.dumps(section, separators=(",", ":")).encode()
+        locations[location] = [offset, len(encoded)]
+        sections.append(encoded)
+        offset += len(encoded)
+
+    header = {
+        "version": CATALOG_VERSION,
+        "families": list(families),
+        "schemas": [list(schema) for schema in schemas],
+        "locations": locations,
+    }
+
+    with open(path, "wb") as fw:
+        fw.write(json.dumps(header, separators=(",", ":")).encode())
+        fw.write(b"\n")
+        for encoded in sections:
+            fw.write(encoded)
+
+
+CATALOG: Any = None
 
 
 def _inititialize_impl() -> None:
-    global VM_SIZES
-    if VM_SIZES:
+    global CATALOG
+    if CATALOG is not None:
         return
 
+    if os.path.exists(CATALOG_FILE):
+        try:
+            CATALOG = _CompactCatalog(CATALOG_FILE)
+            return
+        except Exception:
+            logging.exception(
+                "Could not load {}, falling back to {}".format(
+                    CATALOG_FILE, RESOURCE_FILE
+                )
+            )
+
     try:
         with open(RESOURCE_FILE) as fr:
-            VM_SIZES = json.load(fr)
+            CATALOG = _JSONCatalog(json.load(fr))
     except Exception:
         logging.exception(
             (
@@ -24,6 +192,8 @@ def _inititialize_impl() -> None:
                 + "(vm_family, gpu_count, capabilities etc) will be unavailable."
             ).format(RESOURCE_FILE)
         )
+        # do not retry on every lookup
+        CATALOG = _JSONCatalog({})
 
 
 def _initialize(f: Callable) -> Callable:
@@ -34,6 +204,42 @@ def _initialize(f: Callable) -> Callable:
     return call_initialize
 
 
+@_initialize
+def get_vm_sizes_by_location(location: str) -> Dict[str, Dict]:
+    """
+    All vm size records (vm size -> record, as in vm_sizes.json) for a location.
+    """
+    ret = {}
+    for vm_size in CATALOG.vm_sizes(location):
+        ret[vm_size] = CATALOG.get(location, vm_size)
+    return ret
+
+
+class _VMSizesByLocation(Mapping):
+    """
+    Read only location -> vm size -> record view of the catalog, for
+    backwards compatibility with the VM_SIZES dict. Locations are only
+    loaded when accessed.
+    """
+
+    def __init__(self) -> None:
+        self.__by_location: Dict[str, Dict[str, Dict]] = {}
+
+    def __getitem__(self, location: str) -> Dict[str, Dict]:
+        if location not in self.__by_location:
+            by_name = get_vm_sizes_by_location(location)
+            if not by_name and location not in all_possible_locations():
+                raise KeyError(location)
+            self.__by_location[location] = by_name
+        return self.__by_location[location]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(all_possible_locations())
+
+    def __len__(self) -> int:
+        return len(all_possible_locations())
+
+
 class AuxVMSizeInfo:
     def __init__(self, record: Dict[str, Any]):
         self.__record = record
@@ -84,32 +290,31 @@ class AuxVMSizeInfo:
         return ShellDict(self.__capabilities)
 
 
-__AUX_CACHE = {}
+__AUX_CACHE: Dict[Tuple[str, str], AuxVMSizeInfo] = {}
 
 
-@_initialize
 def get_aux_vm_size_info(location: str, vm_size: str) -> AuxVMSizeInfo:
     key = (location, vm_size)
-    if key not in __AUX_CACHE:
-        by_name = VM_SIZES.get(location)
-
-        if not by_name:
-            return AuxVMSizeInfo({"family": "unknown"})
-
-        vm_aux_info = by_name.get(vm_size)
-        if not vm_aux_info:
-            return AuxVMSizeInfo({"family": "unknown"})
-
-        __AUX_CACHE[key] = AuxVMSizeInfo(vm_aux_info)
-
+    # called for every node, so check the cache before anything else.
+    # Unknown vm sizes are cached as well.
+    cached = __AUX_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    _inititialize_impl()
+    vm_aux_info = CATALOG.get(location, vm_size)
+    if not vm_aux_info:
+        vm_aux_info = {"family": "unknown"}
+
+    __AUX_CACHE[key] = AuxVMSizeInfo(vm_aux_info)
     return __AUX_CACHE[key]
 
 
 @_initialize
 def all_possible_vm_sizes() -> List[str]:
     ret = set()
-    for by_name in VM_SIZES.values():
-        for vm_size in by_name.keys():
+    for location in CATALOG.locations():
+        for vm_size in CATALOG.vm_sizes(location):
             ret.add(vm_size)
     return sorted(list(ret))
 
@@ -117,22 +322,24 @@ def all_possible_vm_sizes() -> List[str]:
 @_initialize
 def all_possible_vm_families() -> List[str]:
     ret = set()
-    for by_name in VM_SIZES.values():
-        for aux_info in by_name.values():
-            ret.add(aux_info["family"])
+    for location in CATALOG.locations():
+        for vm_size in CATALOG.vm_sizes(location):
+            ret.add(CATALOG.get(location, vm_size)["family"])
     return sorted(list(ret))
 
 
 @_initialize
 def all_possible_locations() -> List[str]:
-    return sorted(list(VM_SIZES.keys()))
+    return sorted(CATALOG.locations())
+
+
+VM_SIZES: Mapping[str, Dict[str, Dict]] = _VMSizesByLocation()
 
 
 @_initialize
 def main() -> None:
-    record = VM_SIZES["southcentralus"]["Standard_M208ms_v2"]
-    for vm_size_name, record in VM_SIZES["southcentralus"].items():
-        aux = AuxVMSizeInfo(record)
+    for vm_size_name in CATALOG.vm_sizes("southcentralus"):
+        aux = AuxVMSizeInfo(CATALOG.get("southcentralus", vm_size_name))
         if aux.vcpu_count < 1:
             print(vm_size_name)
 
@@ -1,8 +1,24 @@
 """ A collection of Result types that are used throughout the demand calculation."""
+import atexit
+import json
+import time
 import typing
 from abc import ABC, abstractmethod
+from collections import deque
 from collections.abc import Hashable
-from typing import Callable, Dict, List, Optional, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+)
 from uuid import uuid4
 
 import hpc.autoscale.hpclogging as logging
@@ -16,41 +32,133 @@ if typing.TYPE_CHECKING:
     from hpc.autoscale.node.bucket import NodeBucket  # noqa: F401
 
 
-Reasons = Optional[List[str]]  # pylint: disable=invalid-name
+class Reason:
+    """
+    A reason that is only formatted when it is read, as most results are
+    created inside of constraint checks and never looked at.
+
+        SatisfiedResult("InsufficientResource", self, node, [Reason("{} < {}", a, b)])
+
+    Arguments are formatted when the reason is first read, so pass immutable
+    values (or copies) rather than objects that may change in the meantime.
+    """
+
+    __slots__ = ("template", "args")
+
+    def __init__(self, template: str, *args: Any) -> None:
+        self.template = template
+        self.args = args
+
+    def __str__(self) -> str:
+        return self.template.format(*self.args)
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+Reasons = Optional[Sequence[Union[str, Reason]]]  # pylint: disable=invalid-name
 
 
 HANDLERS: List[Callable[["Result"], None]] = []
+# id(handler) -> the result types it subscribed to, None meaning all of them.
+_HANDLER_RESULT_TYPES: Dict[int, Optional[Tuple[type, ...]]] = {}
+# result class -> handlers to call. Cleared whenever the handlers change.
+_HANDLERS_BY_RESULT_CLASS: Dict[type, List[Callable[["Result"], None]]] = {}
 
 R = TypeVar("R", bound=Callable[["Result"], None])
 
 
-def register_result_handler(handler: R) -> R:
+def register_result_handler(
+    handler: R, result_types: Optional[Iterable[type]] = None
+) -> R:
+    """
+    Calls handler with every result that is created or, if result_types is
+    set, only with instances of those types. Defaults to handler.result_types,
+    if it has one.
+    """
+    if result_types is None:
+        result_types = getattr(handler, "result_types", None)
     HANDLERS.append(handler)
+    _HANDLER_RESULT_TYPES[id(handler)] = (
+        tuple(result_types) if result_types is not None else None
+    )
+    _HANDLERS_BY_RESULT_CLASS.clear()
     return handler
 
 
 def unregister_result_handler(handler: R) -> Optional[R]:
     try:
         HANDLERS.remove(handler)
-        return handler
     except ValueError:
         return None
 
+    if handler not in HANDLERS:
+        _HANDLER_RESULT_TYPES.pop(id(handler), None)
+    _HANDLERS_BY_RESULT_CLASS.clear()
+    return handler
+
 
 def unregister_all_result_handlers() -> None:
     HANDLERS.clear()
+    _HANDLER_RESULT_TYPES.clear()
+    _HANDLERS_BY_RESULT_CLASS.clear()
 
 
-def fire_result_handlers(result: "Result") -> None:
+def _subscribed_handlers(result_class: type) -> List[Callable[["Result"], None]]:
+    ret = []
     for handler in HANDLERS:
+        result_types = _HANDLER_RESULT_TYPES.get(id(handler))
+        if result_types is None or issubclass(result_class, result_types):
+            ret.append(handler)
+    _HANDLERS_BY_RESULT_CLASS[result_class] = ret
+    return ret
+
+
+def fire_result_handlers(result: "Result") -> None:
+    handlers = _HANDLERS_BY_RESULT_CLASS.get(result.__class__)
+    if handlers is None:
+        handlers = _subscribed_handlers(result.__class__)
+
+    for handler in handlers:
         handler(result)
 
 
 class Result(ABC):
     def __init__(self, status: str, reasons: Reasons) -> None:
         self.status = status
-        self.reasons = reasons or []
-        self.result_id = str(uuid4())
+        self.__reasons: Sequence[Union[str, Reason]] = reasons or []
+        self.__formatted = not self.__reasons
+        self.__result_id: Optional[str] = None
+
+    @property
+    def result_id(self) -> str:
+        if self.__result_id is None:
+            self.__result_id = str(uuid4())
+        return self.__result_id
+
+    @result_id.setter
+    def result_id(self, value: str) -> None:
+        self.__result_id = value
+
+    @property
+    def reasons(self) -> List[str]:
+        if not self.__formatted:
+            self.__reasons = [str(r) for r in self.__reasons]
+            self.__formatted = True
+        return self.__reasons  # type: ignore
+
+    @reasons.setter
+    def reasons(self, value: Reasons) -> None:
+        self.__reasons = value or []
+        self.__formatted = False
+
+    @property
+    def raw_reasons(self) -> Sequence[Union[str, Reason]]:
+        """
+        The reasons, without formatting them. Use this to pass the reasons
+        on to another result.
+        """
+        return self.__reasons
 
     def __bool__(self) -> bool:
         return self.status == "success"
@@ -119,15 +227,15 @@ class MatchResult(Result):
         status: str,
         node: "Node",
         slots: int,
-        reasons: Optional[List[str]] = None,
+        reasons: Reasons = None,
     ) -> None:
         Result.__init__(self, status, reasons)
         self.node = node
         self.total_slots = slots
         if slots:
             assert slots > 0
-        if self.reasons:
-            assert not isinstance(self.reasons[0], list)
+        if self.raw_reasons:
+            assert not isinstance(self.raw_reasons[0], list)
         fire_result_handlers(self)
 
     @property
@@ -157,7 +265,7 @@ class CandidatesResult(Result):
         candidates: Optional[List["NodeBucket"]] = None,
         child_results: List[Result] = None,
     ) -> None:
-        Result.__init__(self, status, [str(r) for r in (child_results or [])])
+        Result.__init__(self, status, [Reason("{}", r) for r in (child_results or [])])
         self.__candidates = candidates
         self.child_results = child_results
         fire_result_handlers(self)
@@ -320,6 +428,9 @@ class EarlyBailoutResult(Result):
 
 
 class ResultsHandler(ABC):
+    # if set, register_result_handler only subscribes this to these types.
+    result_types: Optional[Tuple[type, ...]] = None
+
     @abstractmethod
     def __call__(self, result: Result) -> None:
         pass
@@ -357,11 +468,25 @@ class DefaultContextHandler(ResultsHandler):
         for node in node.get_nodes():
             if "[relevant-id]" in node.metadata["contexts"]:
                 ...
+
+    By default every result is kept. For long running processes, or very large
+    demand calculations, pass max_results to only keep the most recent
+    max_results per context (0 keeps none). status_counts always has the
+    number of results per context and status. track_node_contexts=False skips
+    adding the contexts to node.metadata["contexts"].
     """
 
-    def __init__(self, ctx: Hashable) -> None:
+    def __init__(
+        self,
+        ctx: Hashable,
+        max_results: Optional[int] = None,
+        track_node_contexts: bool = True,
+    ) -> None:
         self.ctx: Hashable
-        self.by_context: Dict[Hashable, List[Result]] = {}
+        self.max_results = max_results
+        self.track_node_contexts = track_node_contexts
+        self.by_context: Dict[Hashable, typing.MutableSequence[Result]] = {}
+        self.status_counts: Dict[Hashable, Dict[str, int]] = {}
         self.set_context(ctx)
 
     def set_context(self, ctx: Hashable, ctx_str: Optional[str] = None) -> None:
@@ -369,12 +494,21 @@ class DefaultContextHandler(ResultsHandler):
 
         self.ctx = ctx
         if self.ctx not in self.by_context:
-            self.by_context[ctx] = []
+            if self.max_results is None:
+                self.by_context[ctx] = []
+            else:
+                self.by_context[ctx] = deque(maxlen=self.max_results)
+            self.status_counts[ctx] = {}
 
     def __call__(self, result: Result) -> None:
         logging.debug("%s: %s", self.ctx, result)
 
         self.by_context[self.ctx].append(result)
+        counts = self.status_counts[self.ctx]
+        counts[result.status] = counts.get(result.status, 0) + 1
+
+        if not self.track_node_contexts:
+            return
 
         if hasattr(result, "nodes") and getattr(result, "nodes"):
             for result_node in getattr(result, "nodes"):
@@ -384,9 +518,137 @@ class DefaultContextHandler(ResultsHandler):
                 result_node.metadata["contexts"].add(self.ctx)
 
     def __str__(self) -> str:
-        return "DefaultContextHandler(cur='{}', all='{}'".format(
-            self.ctx, list(self.by_context.keys())
+        return "{}(cur='{}', all='{}'".format(
+            self.__class__.__name__, self.ctx, list(self.by_context.keys())
         )
 
     def __repr__(self) -> str:
         return str(self)
+
+
+@hpcwrapclass
+class StreamingContextHandler(DefaultContextHandler):
+    """
+    A DefaultContextHandler that also writes every result to sink, one json
+    object per line, as they happen. By default no results are kept in
+    memory. e.g.
+
+        {"time": 1600000000.0, "context": "[Job 1]", "type": "AllocationResult",
+         "status": "success", "nodes": ["htc-1"], "slots": 1}
+    """
+
+    def __init__(
+        self,
+        ctx: Hashable,
+        sink: Union[str, TextIO],
+        max_results: Optional[int] = 0,
+        track_node_contexts: bool = True,
+    ) -> None:
+        if isinstance(sink, str):
+            self.sink: TextIO = open(sink, "a")
+            self.__owns_sink = True
+            atexit.register(self.close)
+        else:
+            self.sink = sink
+            self.__owns_sink = False
+        super().__init__(ctx, max_results, track_node_contexts)
+
+    def set_context(self, ctx: Hashable, ctx_str: Optional[str] = None) -> None:
+        super().set_context(ctx, ctx_str)
+        self.sink.flush()
+
+    def __call__(self, result: Result) -> None:
+        super().__call__(result)
+        self.sink.write(json.dumps(self._to_record(result), default=str))
+        self.sink.write("\n")
+
+    def _to_record(self, result: Result) -> Dict[str, Any]:
+        record: Dict[str, Any] = {
+            "time": time.time(),
+            "context": str(self.ctx),
+            "type": result.__class__.__name__,
+            "status": result.status,
+        }
+        nodes = getattr(result, "nodes", None)
+        if nodes:
+            record["nodes"] = [n.name for n in nodes]
+        elif getattr(result, "node", None) is not None:
+            record["nodes"] = [getattr(result, "node").name]
+
+        if hasattr(result, "total_slots"):
+            record["slots"] = getattr(result, "total_slots")
+
+        if not result and result.reasons:
+            record["reasons"] = result.reasons
+        return record
+
+    def close(self) -> None:
+        if self.sink.closed:
+            return
+        if self.__owns_sink:
+            self.sink.close()
+        else:
+            self.sink.flush()
+
+
+def new_context_handler(ctx: Hashable, config: Dict) -> DefaultContextHandler:
+    """
+    Creates the handler for the context_handler section of the autoscale config:
+
+        "context_handler": {
+            "mode": "full",
+            "max_results": 100,
+            "path": "/opt/cycle/scalelib/results.jsonl",
+            "result_types": ["AllocationResult", "BootupResult"],
+            "node_contexts": true
+        }
+
+    mode - full: keep every result (the default)
+           bounded: keep the last max_results (default 100) per context
+           summary: only keep the status_counts per context
+           stream: write the results to path as json lines, keep none
+    result_types - only handle these types of results. Defaults to all.
+    node_contexts - add the contexts to the metadata of nodes in the results.
+    """
+    handler_config = config.get("context_handler") or {}
+    mode = handler_config.get("mode", "full")
+    track_node_contexts = bool(handler_config.get("node_contexts", True))
+
+    handler: DefaultContextHandler
+    if mode == "full":
+        handler = DefaultContextHandler(ctx, None, track_node_contexts)
+    elif mode == "bounded":
+        max_results = int(handler_config.get("max_results", 100))
+        handler = DefaultContextHandler(ctx, max_results, track_node_contexts)
+    elif mode == "summary":
+        handler = DefaultContextHandler(ctx, 0, track_node_contexts)
+    elif mode == "stream":
+        if not handler_config.get("path"):
+            raise RuntimeError("context_handler.path is required when mode=stream")
+        handler = StreamingContextHandler(
+            ctx,
+            handler_config["path"],
+            int(handler_config.get("max_results", 0)),
+            track_node_contexts,
+        )
+    else:
+        raise RuntimeError(
+            "Unknown context_handler.mode {} - expected one of full, bounded, summary or stream".format(
+                mode
+            )
+        )
+
+    if handler_config.get("result_types"):
+        result_types = []
+        for type_name in handler_config["result_types"]:
+            result_type = globals().get(type_name)
+            if not isinstance(result_type, type) or not issubclass(result_type, Result):
+                raise RuntimeError(
+                    "Unknown result type {} in context_handler.result_types".format(
+                        type_name
+                    )
+                )
+            result_types.append(result_type)
+        handler.result_types = tuple(result_types)
+
+    return handler
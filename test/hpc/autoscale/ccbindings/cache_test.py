@@ -0,0 +1,69 @@
+import os
+
+from hpc.autoscale.ccbindings.cache import ClusterStatusCache, new_cluster_status_cache
+
+
+class MockClockCache(ClusterStatusCache):
+    mock_now = 0.0
+
+    def now(self) -> float:
+        return self.mock_now
+
+
+def test_ttl_and_stale(tmpdir) -> None:
+    cache = MockClockCache(
+        os.path.join(tmpdir, "a", "cache.json"), ttl=30, max_stale=300
+    )
+    assert cache.get("nodes") is None
+
+    cache.mock_now = 1000
+    cache.put("nodes", {"nodes": [{"Name": "htc-1"}]})
+    cache.mock_now = 1030
+    assert {"nodes": [{"Name": "htc-1"}]} == cache.get("nodes")
+
+    # expired, but can still be served if CycleCloud can not be reached
+    cache.mock_now = 1031
+    assert cache.get("nodes") is None
+    assert cache.get("nodes", stale=True)
+    cache.mock_now = 1301
+    assert cache.get("nodes", stale=True) is None
+
+    # a different process sees the same entries
+    other = MockClockCache(cache.path, ttl=30)
+    other.mock_now = 1010
+    assert other.get("nodes")
+    assert other.get("cluster_status") is None
+
+    cache.invalidate()
+    assert not os.path.exists(cache.path)
+    assert other.get("nodes") is None
+    # and invalidating twice is fine
+    cache.invalidate()
+
+
+def test_corrupt_cache(tmpdir) -> None:
+    path = os.path.join(tmpdir, "cache.json")
+    with open(path, "w") as fw:
+        fw.write("{not json")
+    cache = ClusterStatusCache(path, ttl=30)
+    assert cache.get("nodes") is None
+    cache.put("nodes", {"nodes": []})
+    assert {"nodes": []} == cache.get("nodes")
+
+
+def test_new_cluster_status_cache(tmpdir) -> None:
+    assert new_cluster_status_cache({}) is None
+    assert new_cluster_status_cache({"cluster_status_cache": {"ttl": 0}}) is None
+
+    cache = new_cluster_status_cache(
+        {
+            "cluster_name": "c1",
+            "cluster_status_cache": {
+                "ttl": 30,
+                "path": os.path.join(tmpdir, "{cluster}.json"),
+            },
+        }
+    )
+    assert cache
+    assert os.path.join(tmpdir, "c1.json") == cache.path
+    assert 30 == cache.max_stale
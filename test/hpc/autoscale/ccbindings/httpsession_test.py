@@ -0,0 +1,61 @@
+import requests
+
+from hpc.autoscale.ccbindings.httpsession import (
+    ApiLatency,
+    HTTPConfig,
+    TimedModule,
+    TimeoutHTTPAdapter,
+    configure_session,
+    configure_wrapped_sessions,
+)
+
+
+def test_configure_session() -> None:
+    http_config = HTTPConfig(
+        {
+            "http": {
+                "pool_size": 4,
+                "connect_timeout": 1,
+                "read_timeout": 2,
+                "retries": 5,
+            }
+        }
+    )
+    session = requests.session()
+    configure_session(session, http_config)
+
+    adapter = session.get_adapter("https://localhost:9443/clusters")
+    assert isinstance(adapter, TimeoutHTTPAdapter)
+    assert (1, 2) == adapter.timeout
+    assert 4 == adapter._pool_maxsize
+    assert 5 == adapter.max_retries.total
+    # only idempotent requests are retried
+    assert adapter.max_retries.is_retry("GET", 503)
+    assert not adapter.max_retries.is_retry("POST", 503)
+
+
+def test_configure_wrapped_sessions() -> None:
+    class Wrapper:
+        def __init__(self) -> None:
+            self._session = requests.session()
+
+    wrapper = Wrapper()
+    assert configure_wrapped_sessions(wrapper, HTTPConfig({}))
+    adapter = wrapper._session.get_adapter("http://localhost")
+    assert (10, 120) == adapter.timeout
+    assert not configure_wrapped_sessions(object.__new__(Wrapper), HTTPConfig({}))
+
+
+def test_api_latency() -> None:
+    class FakeClustersModule:
+        def get_nodes(self, session, cluster_name):  # type: ignore
+            return "nodes"
+
+    latency = ApiLatency()
+    module = TimedModule(FakeClustersModule(), latency)
+    assert "nodes" == module.get_nodes(None, "c1")
+    assert "nodes" == module.get_nodes(None, "c1")
+    stats = latency.get("get_nodes")
+    assert stats and 2 == stats["count"]
+    assert latency.get("create_nodes") is None
+    assert 2 == latency.to_dict()["get_nodes"]["count"]
@@ -0,0 +1,49 @@
+from typing import Any, List
+
+from hpc.autoscale import hpclogging as logging
+
+
+class CountingRepr:
+    def __init__(self) -> None:
+        self.repr_calls = 0
+
+    def __repr__(self) -> str:
+        self.repr_calls += 1
+        return "CountingRepr()"
+
+
+class RecordingHandler(logging.logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.TRACE)
+        self.messages: List[str] = []
+
+    def emit(self, record: Any) -> None:
+        self.messages.append(record.getMessage())
+
+
+def test_apitrace() -> None:
+    @logging.apitrace
+    def add(a: Any, b: int = 1) -> int:
+        return b + 1
+
+    root = logging.getLogger()
+    handler = RecordingHandler()
+    original_level = root.level
+    root.addHandler(handler)
+    try:
+        root.setLevel(logging.INFO)
+        arg = CountingRepr()
+        assert 3 == add(arg, b=2)
+        # nothing is formatted unless fine/trace/repro logging is enabled
+        assert 0 == arg.repr_calls
+        assert [] == handler.messages
+
+        root.setLevel(logging.FINE)
+        assert 3 == add(arg, b=2)
+        assert 1 == arg.repr_calls
+        assert 2 == len(handler.messages)
+        assert handler.messages[0].endswith("add(a=CountingRepr(), b=2)")
+        assert handler.messages[1].endswith("add(...) -> 3")
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(original_level)
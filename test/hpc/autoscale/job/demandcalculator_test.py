@@ -220,6 +220,87 @@ def test_bug100(mixedbindings) -> None:
     assert len(demand.new_nodes) == 3
 
 
+def test_add_jobs_same_shape() -> None:
+    def bindings() -> MockClusterBinding:
+        bindings = MockClusterBinding()
+        bindings.add_nodearray("htc", {"ncpus": 4})
+        bindings.add_bucket("htc", "Standard_F2", 3, 3)
+        return bindings
+
+    def jobs() -> List[Job]:
+        ret = []
+        for i in range(10):
+            ret.append(Job("small-{}".format(i), {"ncpus": 1}, iterations=2))
+            ret.append(Job("excl-{}".format(i), {"ncpus": 1, "exclusive": True}))
+            ret.append(Job("big-{}".format(i), {"ncpus": 5}))
+        return ret
+
+    one_at_a_time = _new_dc(bindings())
+    for job in jobs():
+        one_at_a_time.add_job(job)
+
+    batched = _new_dc(bindings())
+    batched.add_jobs(jobs())
+
+    def summarize(dc: DemandCalculator) -> List:
+        return [
+            (n.name, sorted(n.assignments), dict(n.available))
+            for n in dc.get_demand().new_nodes
+        ]
+
+    assert summarize(one_at_a_time) == summarize(batched)
+    assert len(batched.get_demand().new_nodes) == 3
+
+    # every job that is skipped still gets a failed result
+    allocation_results: List[resultslib.AllocationResult] = []
+    resultslib.register_result_handler(
+        allocation_results.append, result_types=[resultslib.AllocationResult]
+    )
+    _new_dc(bindings()).add_jobs(jobs())
+    skipped = [r.reasons[0] for r in allocation_results if not r]
+    for i in range(1, 10):
+        assert 1 == len([x for x in skipped if x.startswith("Skipped big-%d:" % i)])
+
+
+def test_add_jobs_smaller_request_same_shape() -> None:
+    def bindings() -> MockClusterBinding:
+        bindings = MockClusterBinding()
+        bindings.add_nodearray("hpc", {}, max_placement_group_size=2)
+        bindings.add_bucket("hpc", "Standard_F4", 2, 2, placement_groups=["pg0"])
+        return bindings
+
+    def jobs() -> List[Job]:
+        ret = []
+        for name, iterations in [("big", 100), ("small", 4), ("bigger", 200)]:
+            constraints = get_constraints([{"ncpus": 1}])
+            constraints.append(InAPlacementGroup())
+            ret.append(Job(name, constraints, iterations=iterations, colocated=True))
+        # not colocated
+        ret.append(Job("big-pack", {"ncpus": 1}, iterations=100))
+        ret.append(Job("small-pack", {"ncpus": 1}, iterations=2))
+        return ret
+
+    one_at_a_time = _new_dc(bindings())
+    for job in jobs():
+        one_at_a_time.add_job(job)
+
+    batched = _new_dc(bindings())
+    batched.add_jobs(jobs())
+
+    def assignments(dc: DemandCalculator) -> List:
+        return sorted(
+            (n.name, sorted(n.assignments)) for n in dc.get_demand().new_nodes
+        )
+
+    assert assignments(one_at_a_time) == assignments(batched)
+    assigned = set()
+    for _, names in assignments(batched):
+        assigned.update(names)
+    assert "small" in assigned
+    assert "big" not in assigned
+    assert "bigger" not in assigned
+
+
 def _assert_success(result, bucket_names, index_start=1):
     assert result
     assert "success" == result.status
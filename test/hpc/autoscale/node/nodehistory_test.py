@@ -1,10 +1,16 @@
+import os
+import sqlite3
 from hashlib import md5
 from typing import List, Optional
 
 from hpc.autoscale import hpctypes as ht
 from hpc.autoscale.node.delayednodeid import DelayedNodeId
 from hpc.autoscale.node.node import Node
-from hpc.autoscale.node.nodehistory import SQLiteNodeHistory
+from hpc.autoscale.node.nodehistory import (
+    SQLITE_VERSION,
+    MemoryNodeHistory,
+    SQLiteNodeHistory,
+)
 
 
 class EasyNode(Node):
@@ -106,6 +112,15 @@ class SQLiteNodeHistoryMockClock(SQLiteNodeHistory):
         return self.mock_now
 
 
+class MemoryNodeHistoryMockClock(MemoryNodeHistory):
+    def __init__(self, path: str = "nodehistory.db", read_only: bool = False) -> None:
+        self.mock_now = 0.0
+        super().__init__(path, read_only, snapshot_interval=0)
+
+    def now(self) -> float:
+        return self.mock_now
+
+
 def test_ready_time() -> None:
     db = SQLiteNodeHistoryMockClock(":memory:")
     db.mock_now = 1000
@@ -158,3 +173,212 @@ def test_ready_time() -> None:
     actual = len(db.find_booting(for_at_least=1800))
     assert 3 == actual
     
+
+def test_upgrade_database(tmpdir) -> None:
+    path = os.path.join(tmpdir, "nodehistory.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE metadata (version)")
+    conn.execute("INSERT INTO metadata (version) VALUES ('0.0.6')")
+    conn.execute(
+        """CREATE TABLE nodes (node_id TEXT PRIMARY KEY, hostname TEXT,
+                               instance_id TEXT,
+                               create_time REAL, last_match_time REAL,
+                               ready_time REAL, delete_time REAL,
+                               ignore BOOL)"""
+    )
+    conn.execute("INSERT INTO nodes VALUES ('id-1', 'host', 'inst', 1, 1, 0, NULL, 0)")
+    conn.commit()
+    conn.close()
+
+    # read only connections can still read the old schema
+    db = SQLiteNodeHistory(path, read_only=True)
+    assert [("id-1", "host", 1)] == db.find_booting(for_at_least=0)
+
+    db = SQLiteNodeHistory(path)
+    assert [(SQLITE_VERSION,)] == list(db.conn.execute("SELECT version FROM metadata"))
+    indexes = [r[1] for r in db.conn.execute("PRAGMA index_list(nodes)")]
+    for column in ["delete_time", "last_match_time", "create_time", "ready_time"]:
+        assert "nodes_{}".format(column) in indexes
+    # upgraded in place, so the history is kept
+    assert not os.path.exists(path + ".0.0.6")
+    assert [("id-1", "host", 1)] == db.find_booting(for_at_least=0)
+
+
+def test_decorate_and_ignore() -> None:
+    db = SQLiteNodeHistoryMockClock(":memory:")
+    db.mock_now = 1000
+    nodes = [new_booting_node("e-{}".format(i)) for i in range(250)]
+    db.update(nodes)
+
+    db.mock_now = 1100
+    db.update(nodes[:200])
+    db.decorate(nodes)
+    assert all(n.create_time_unix == 1000 for n in nodes)
+    assert nodes[0].delete_time_unix is None
+    assert nodes[-1].delete_time_unix == 1100
+
+    db.mark_ignored(nodes[:3])
+    db.unmark_ignored(nodes[:1])
+    ignored = set([r[0] for r in db.find_ignored()])
+    assert ignored == set([n.delayed_node_id.node_id for n in nodes[1:3]])
+
+
+def test_wal_and_single_transaction(tmpdir) -> None:
+    path = os.path.join(tmpdir, "nodehistory.db")
+    db = SQLiteNodeHistoryMockClock(path)
+    assert [("wal",)] == list(db.conn.execute("PRAGMA journal_mode"))
+
+    db.mock_now = 1000
+    nodes = [new_booting_node("e-{}".format(i)) for i in range(10)]
+    db.update(nodes)
+    assert not db.conn.in_transaction
+
+    reader = SQLiteNodeHistory(path, read_only=True)
+    # a reader in the middle of a read does not block the writer
+    cursor = reader.conn.execute("SELECT node_id FROM nodes")
+    cursor.fetchone()
+    db.mock_now = 2000
+    db.update(nodes[:5])
+    assert not db.conn.in_transaction
+    # the reader sees the new data once its read is done
+    cursor.close()
+    assert 5 == len(list(reader.conn.execute("SELECT * FROM nodes WHERE delete_time > 0")))
+
+    # a failed update is rolled back entirely
+    class Boom(Exception):
+        pass
+
+    def retire_records(*args, **kwargs):
+        raise Boom()
+
+    db.retire_records = retire_records  # type: ignore
+    try:
+        db.update([])
+        assert False
+    except Boom:
+        pass
+    assert not db.conn.in_transaction
+    assert 5 == len(list(db.conn.execute("SELECT * FROM nodes WHERE delete_time > 0")))
+
+
+def test_delta_only_writes() -> None:
+    db = SQLiteNodeHistoryMockClock(":memory:")
+    db.last_match_quantum = 60
+    db.mock_now = 1000
+    nodes = [new_booting_node("e-{}".format(i), state="Ready") for i in range(3)]
+    nodes[0].required = True
+    db.update(nodes)
+
+    def last_match_times() -> List[float]:
+        return [
+            r[0]
+            for r in db.conn.execute(
+                "SELECT last_match_time FROM nodes ORDER BY hostname"
+            )
+        ]
+
+    # rounded up to the quantum, so the idle timeout can only start later
+    assert [1020, 1000, 1000] == last_match_times()
+    changes = db.conn.total_changes
+
+    # nothing changed within the quantum, so nothing is written
+    db.mock_now = 1010
+    db.update(nodes)
+    assert changes == db.conn.total_changes
+
+    db.mock_now = 1030
+    db.update(nodes)
+    assert changes + 1 == db.conn.total_changes
+    assert [1080, 1000, 1000] == last_match_times()
+    assert 2 == len(db.find_unmatched(for_at_least=29))
+
+
+def test_memory_node_history_parity(tmpdir) -> None:
+    sqlite_db = SQLiteNodeHistoryMockClock(":memory:")
+    memory_db = MemoryNodeHistoryMockClock(os.path.join(tmpdir, "nodehistory.db"))
+    # enough nodes that the indexes are rebuilt as well as updated in place
+    nodes = [new_booting_node("e-{}".format(i)) for i in range(300)]
+
+    def check(for_at_least: float) -> None:
+        for query in ["find_unmatched", "find_booting", "find_ignored"]:
+            args = [] if query == "find_ignored" else [for_at_least]
+            expected = sorted(getattr(sqlite_db, query)(*args))
+            actual = sorted(getattr(memory_db, query)(*args))
+            assert expected == actual, query
+
+    def step(now: float, nodes: List[Node]) -> None:
+        sqlite_db.mock_now = memory_db.mock_now = now
+        sqlite_db.update(nodes)
+        memory_db.update(nodes)
+
+    step(1000, nodes)
+    for node in nodes[:4]:
+        node.state = ht.NodeStatus("Ready")
+    nodes[0].required = True
+    step(2000, nodes)
+    # retired, and then a new node with the same name
+    step(3000, nodes[1:])
+    sqlite_db.mark_ignored(nodes[2:4])
+    memory_db.mark_ignored(nodes[2:4])
+    step(4000, nodes)
+    step(4000 + 8 * 24 * 60 * 60, nodes[:5])
+
+    for for_at_least in [0, 300, 1800, 10 ** 6]:
+        check(for_at_least)
+
+    sqlite_db.decorate(nodes)
+    expected = [(n.create_time_unix, n.delete_time_unix) for n in nodes]
+    memory_db.decorate(nodes)
+    assert expected == [(n.create_time_unix, n.delete_time_unix) for n in nodes]
+
+
+def test_memory_node_history_snapshot(tmpdir) -> None:
+    path = os.path.join(tmpdir, "nodehistory.db")
+    db = MemoryNodeHistoryMockClock(path)
+    db.mock_now = 1000
+    nodes = [new_booting_node("e-{}".format(i)) for i in range(5)]
+    db.update(nodes)
+    db.mock_now = 2000
+    db.update(nodes[:3])
+    db.mark_ignored(nodes[:1])
+
+    # nothing is written until a snapshot
+    assert [] == SQLiteNodeHistory(path, read_only=True).find_booting(0)
+    db.snapshot()
+
+    reader = SQLiteNodeHistoryMockClock(path, read_only=True)
+    reader.mock_now = 2000
+    for query in ["find_booting", "find_unmatched"]:
+        assert sorted(getattr(db, query)(0)) == sorted(getattr(reader, query)(0))
+    assert db.find_ignored() == reader.find_ignored()
+
+    # and the history survives a restart
+    db.close()
+    reloaded = MemoryNodeHistoryMockClock(path)
+    reloaded.mock_now = 2000
+    assert sorted(db.find_booting(0)) == sorted(reloaded.find_booting(0))
+    reloaded.decorate(nodes)
+    assert [2000] * 2 == [n.delete_time_unix for n in nodes[3:]]
+    reloaded.close()
+
+
+def test_decorate_timeouts(tmpdir) -> None:
+    config = {
+        "boot_timeout": {"default": 600, "gpu": 3600},
+        "idle_timeout": 100,
+    }
+    memory_db = MemoryNodeHistoryMockClock(os.path.join(tmpdir, "nodehistory.db"))
+    for db in [SQLiteNodeHistoryMockClock(":memory:"), memory_db]:
+        nodes = [
+            new_booting_node("e-1"),
+            new_booting_node("g-1", nodearray="gpu"),
+            new_booting_node("r-1", state="Ready"),
+        ]
+        db.mock_now = 1000
+        db.update(nodes)
+        db.mock_now = 1060
+        db.decorate(nodes, config)
+
+        assert [540, 3540] == [n.create_time_remaining for n in nodes[:2]]
+        assert -1 == nodes[0].idle_time_remaining
+        assert 40 == nodes[2].idle_time_remaining
@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+from hpc.autoscale.node import vm_sizes
+
+VM_SIZES = {
+    "eastus": {
+        "Standard_F4": {
+            "name": "Standard_F4",
+            "family": "standardFFamily",
+            "size": "F4",
+            "tier": "Standard",
+            "location": "eastus",
+            "capabilities": {"vCPUs": 4, "MemoryGB": 8.0, "RdmaEnabled": False},
+        },
+        "Standard_NC6": {
+            "name": "Standard_NC6",
+            "family": "standardNCFamily",
+            "size": "NC6",
+            "tier": "Standard",
+            "location": "eastus",
+            "linux_price": 0.9,
+            "capabilities": {"vCPUs": 6, "MemoryGB": 56.0, "GPUs": 1},
+        },
+    },
+    "westus2": {
+        "Standard_F4": {
+            "name": "Standard_F4",
+            "family": "standardFFamily",
+            "size": "F4",
+            "tier": "Standard",
+            "location": "westus2",
+            "capabilities": {"vCPUs": 4, "MemoryGB": 8.0, "RdmaEnabled": False},
+        },
+    },
+}
+
+
+def test_compact_catalog() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "vm_sizes.catalog")
+        vm_sizes.write_catalog(VM_SIZES, path)
+        catalog = vm_sizes._CompactCatalog(path)
+        try:
+            assert ["eastus", "westus2"] == sorted(catalog.locations())
+            assert ["Standard_F4", "Standard_NC6"] == sorted(catalog.vm_sizes("eastus"))
+            for location, by_name in VM_SIZES.items():
+                for vm_size, record in by_name.items():
+                    assert record == catalog.get(location, vm_size)
+
+            assert catalog.get("eastus", "Standard_X1") is None
+            assert catalog.get("unknown", "Standard_F4") is None
+            assert [] == catalog.vm_sizes("unknown")
+        finally:
+            catalog.close()
+
+
+def test_unknown_vm_sizes_are_cached() -> None:
+    aux = vm_sizes.get_aux_vm_size_info("nowhere", "Standard_Unknown")
+    assert "unknown" == aux.vm_family
+    assert aux is vm_sizes.get_aux_vm_size_info("nowhere", "Standard_Unknown")
+
+
+def test_vm_sizes_compatibility(monkeypatch) -> None:
+    monkeypatch.setattr(vm_sizes, "CATALOG", vm_sizes._JSONCatalog(VM_SIZES))
+    compat = vm_sizes._VMSizesByLocation()
+    assert ["eastus", "westus2"] == sorted(compat)
+    assert 2 == len(compat)
+    assert VM_SIZES["eastus"] == compat["eastus"]
+    assert "nowhere" not in compat
+
+
+def test_get_vm_sizes_by_location(monkeypatch) -> None:
+    monkeypatch.setattr(vm_sizes, "CATALOG", vm_sizes._JSONCatalog(VM_SIZES))
+    assert VM_SIZES["westus2"] == vm_sizes.get_vm_sizes_by_location("westus2")
+    assert {} == vm_sizes.get_vm_sizes_by_location("nowhere")
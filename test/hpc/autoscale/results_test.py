@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import tempfile
+
+import pytest
+
+from hpc.autoscale.job.schedulernode import SchedulerNode
+from hpc.autoscale.results import (
+    AllocationResult,
+    DefaultContextHandler,
+    EarlyBailoutResult,
+    StreamingContextHandler,
+    new_context_handler,
+    register_result_handler,
+    unregister_all_result_handlers,
+    unregister_result_handler,
+)
+
+
+def setup_module() -> None:
+    SchedulerNode.ignore_hostnames = True
+
+
+def teardown_function() -> None:
+    unregister_all_result_handlers()
+
+
+def test_bounded_context_handler() -> None:
+    handler = register_result_handler(DefaultContextHandler("[a]", max_results=2))
+    results = [EarlyBailoutResult("success") for _ in range(3)]
+    EarlyBailoutResult("failed")
+
+    handler.set_context("[b]")
+    node = SchedulerNode("lnx0")
+    AllocationResult("success", nodes=[node], slots_allocated=1)
+
+    assert list(handler.by_context["[a]"])[0] is results[2]
+    assert len(handler.by_context["[a]"]) == 2
+    assert handler.status_counts == {
+        "[a]": {"success": 3, "failed": 1},
+        "[b]": {"success": 1},
+    }
+    assert node.metadata["contexts"] == set(["[b]"])
+    unregister_result_handler(handler)
+
+    summary = register_result_handler(DefaultContextHandler("[c]", 0, False))
+    node = SchedulerNode("lnx1")
+    AllocationResult("success", nodes=[node], slots_allocated=1)
+    assert len(summary.by_context["[c]"]) == 0
+    assert summary.status_counts["[c]"] == {"success": 1}
+    assert "contexts" not in node.metadata
+
+
+def test_streaming_context_handler() -> None:
+    sink = io.StringIO()
+    handler = register_result_handler(StreamingContextHandler("[a]", sink))
+    AllocationResult("success", nodes=[SchedulerNode("lnx0")], slots_allocated=4)
+    handler.set_context("[b]")
+    AllocationResult("NoCandidatesFound", reasons=["no buckets"])
+
+    records = [json.loads(line) for line in sink.getvalue().splitlines()]
+    assert len(records) == 2
+    assert records[0]["context"] == "[a]"
+    assert records[0]["type"] == "AllocationResult"
+    assert records[0]["nodes"] == ["lnx0"]
+    assert records[0]["slots"] == 4
+    assert records[1]["status"] == "NoCandidatesFound"
+    assert records[1]["reasons"] == ["no buckets"]
+    assert len(handler.by_context["[a]"]) == 0
+
+
+def test_new_context_handler() -> None:
+    handler = new_context_handler("[a]", {})
+    assert handler.max_results is None
+    assert isinstance(handler.by_context["[a]"], list)
+
+    handler = new_context_handler(
+        "[a]",
+        {
+            "context_handler": {
+                "mode": "bounded",
+                "max_results": 10,
+                "result_types": ["AllocationResult"],
+            }
+        },
+    )
+    assert handler.max_results == 10
+    register_result_handler(handler)
+    EarlyBailoutResult("success")
+    AllocationResult("failed")
+    assert handler.status_counts["[a]"] == {"failed": 1}
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "results.jsonl")
+        handler = new_context_handler(
+            "[a]",
+            {"context_handler": {"mode": "stream", "path": path, "max_results": "5"}},
+        )
+        assert isinstance(handler, StreamingContextHandler)
+        assert handler.max_results == 5
+        handler(EarlyBailoutResult("success"))
+        handler.close()
+        with open(path) as fr:
+            assert json.loads(fr.read())["status"] == "success"
+
+    with pytest.raises(RuntimeError):
+        new_context_handler("[a]", {"context_handler": {"mode": "stream"}})
+
+    with pytest.raises(RuntimeError):
+        new_context_handler("[a]", {"context_handler": {"mode": "everything"}})
+
+    with pytest.raises(RuntimeError):
+        new_context_handler("[a]", {"context_handler": {"result_types": ["Node"]}})
@@ -1,4 +1,8 @@
+from typing import Any, List
+
 from hpc.autoscale.ccbindings.mock import MockClusterBinding
+from hpc.autoscale.node.bucket import CandidateCache
+from hpc.autoscale.node.constraints import get_constraints
 from hpc.autoscale.node.nodemanager import new_node_manager
 
 
@@ -22,3 +26,116 @@ def test_basic() -> None:
     assert 90 == bucket.available_count
     bucket.rollback()
     assert 95 == bucket.available_count
+
+
+def test_open_nodes() -> None:
+    binding = MockClusterBinding()
+    # ncpus defaults to node.vcpu_count, i.e. 4
+    binding.add_nodearray("hpc", {})
+    binding.add_bucket("hpc", "Standard_F4", max_count=100, available_count=100)
+    for i in range(5):
+        binding.add_node("hpc-{}".format(i + 1), "hpc")
+    node_mgr = new_node_manager({"_mock_bindings": binding})
+    bucket = node_mgr.get_buckets()[0]
+
+    def open_names(constraints: Any) -> List[str]:
+        return [n.name for n in bucket.open_nodes(get_constraints(constraints))]
+
+    assert open_names([]) == ["hpc-1", "hpc-2", "hpc-3", "hpc-4", "hpc-5"]
+    assert open_names({"ncpus": 4}) == ["hpc-1", "hpc-2", "hpc-3", "hpc-4", "hpc-5"]
+
+    bucket.nodes[1].available["ncpus"] = 2
+    bucket.nodes[3].closed = True
+    assert open_names([]) == ["hpc-1", "hpc-2", "hpc-3", "hpc-5"]
+    assert open_names({"ncpus": 2}) == ["hpc-1", "hpc-2", "hpc-3", "hpc-5"]
+    assert open_names({"ncpus": 3}) == ["hpc-1", "hpc-3", "hpc-5"]
+    assert open_names({"and": [{"ncpus": 3}, {"exclusive": True}]}) == [
+        "hpc-1",
+        "hpc-3",
+        "hpc-5",
+    ]
+    assert open_names({"undefined": 1}) == []
+
+    result = node_mgr.allocate({"ncpus": 3}, node_count=6)
+    assert result
+    assert [n.name for n in result.nodes][:3] == ["hpc-1", "hpc-3", "hpc-5"]
+    assert open_names({"ncpus": 1}) == ["hpc-1", "hpc-2", "hpc-3", "hpc-5"] + [
+        n.name for n in result.nodes[3:]
+    ]
+
+    removed = bucket.nodes[0]
+    assert bucket.has_node(removed)
+    bucket.remove_node(removed)
+    assert not bucket.has_node(removed)
+    assert bucket.nodes[0].name == "hpc-2"
+    assert open_names({"ncpus": 1})[0] == "hpc-2"
+
+
+def test_unallocated_count() -> None:
+    binding = MockClusterBinding()
+    binding.add_nodearray("hpc", {})
+    binding.add_bucket("hpc", "Standard_F4", max_count=100, available_count=100)
+    for i in range(3):
+        binding.add_node("hpc-{}".format(i + 1), "hpc")
+    node_mgr = new_node_manager({"_mock_bindings": binding})
+    bucket = node_mgr.get_buckets()[0]
+
+    def recomputed() -> int:
+        return len([n for n in bucket.nodes if not n._allocated])
+
+    assert bucket.unallocated_count == recomputed() == 3
+
+    bucket.nodes[0]._allocated = True
+    assert bucket.unallocated_count == recomputed() == 2
+
+    # all or nothing fails, so nothing should stay allocated
+    assert not node_mgr.allocate({"ncpus": 1}, node_count=1000, all_or_nothing=True)
+    assert bucket.unallocated_count == recomputed() == 2
+
+    result = node_mgr.allocate({"ncpus": 1}, node_count=4)
+    assert result
+    assert bucket.unallocated_count == recomputed() == 0
+    # hpc-1 is already allocated but still has room, so only one new node
+    assert len(bucket.nodes) == 4
+
+    bucket.nodes[1]._allocated = False
+    assert bucket.unallocated_count == recomputed() == 1
+    bucket.remove_node(bucket.nodes[1])
+    assert bucket.unallocated_count == recomputed() == 0
+
+
+def test_candidate_cache() -> None:
+    binding = MockClusterBinding()
+    binding.add_nodearray("htc", {})
+    binding.add_bucket("htc", "Standard_F4", max_count=100, available_count=100)
+    binding.add_bucket("htc", "Standard_F2", max_count=100, available_count=100)
+    node_mgr = new_node_manager({"_mock_bindings": binding})
+    buckets = node_mgr.get_buckets()
+
+    cache = CandidateCache()
+    constraints = get_constraints({"ncpus": 4, "exclusive": True})
+    result = cache.bucket_candidates(buckets, constraints)
+    assert result
+    assert [b.vm_size for b in result.candidates] == ["Standard_F4"]
+
+    # same signature, even though the assignment id differs
+    other = get_constraints({"ncpus": 4, "exclusive": True})
+    assert cache.bucket_candidates(buckets, other) is result
+    assert cache.bucket_candidates(buckets[1:], other) is not result
+
+    assert not cache.bucket_candidates(buckets, get_constraints({"ncpus": 5}))
+
+    # the candidates do not depend on available_count, and a cache hit still
+    # sees the live bucket, so allocation checks the current count.
+    f4 = result.candidates[0]
+    f4.decrement(100)
+    assert f4.available_count == 0
+    hit = cache.bucket_candidates(buckets, other)
+    assert hit is result
+    assert hit.candidates[0].available_count == 0
+    assert not node_mgr.allocate({"ncpus": 4, "exclusive": True}, node_count=1)
+
+    f4.rollback()
+    hit = cache.bucket_candidates(buckets, other)
+    assert hit is result
+    assert hit.candidates[0].available_count == 100
@@ -2,6 +2,7 @@ from typing import Dict
 
 from hpc.autoscale.job.schedulernode import SchedulerNode
 from hpc.autoscale.node.constraints import (
+    And,
     BaseNodeConstraint,
     ExclusiveNode,
     InAPlacementGroup,
@@ -15,9 +16,11 @@ from hpc.autoscale.node.constraints import (
     SharedNonConsumableConstraint,
     SharedNonConsumableResource,
     XOr,
+    constraint_cache,
     get_constraint,
     get_constraints,
     register_parser,
+    satisfied_by_node,
 )
 from hpc.autoscale.node.node import (
     QUERYABLE_PROPERTIES,
@@ -25,7 +28,13 @@ from hpc.autoscale.node.node import (
     UnmanagedNode,
     minimum_space,
 )
-from hpc.autoscale.results import SatisfiedResult
+from hpc.autoscale.results import (
+    MatchResult,
+    Reason,
+    SatisfiedResult,
+    register_result_handler,
+    unregister_all_result_handlers,
+)
 
 
 def setup_module() -> None:
@@ -338,3 +347,84 @@ def test_shared_constraint() -> None:
     assert not qcons.do_decrement(node)
     assert global_qres.current_value == 70
     assert queue_qres.current_value == 20
+
+
+def test_constraint_cache() -> None:
+    calls = []
+
+    class CountingMinResource(MinResourcePerNode):
+        def satisfied_by_node(self, node: Node) -> SatisfiedResult:
+            calls.append(node.name)
+            return MinResourcePerNode.satisfied_by_node(self, node)
+
+    c = CountingMinResource("pcpus", 2)
+    node = SchedulerNode("tux", {"pcpus": 3})
+
+    # no caching outside of a constraint_cache
+    assert satisfied_by_node(c, node)
+    assert satisfied_by_node(c, node)
+    assert len(calls) == 2
+
+    with constraint_cache():
+        assert satisfied_by_node(c, node)
+        assert satisfied_by_node(c, node)
+        # equivalent constraints share results
+        assert satisfied_by_node(CountingMinResource("pcpus", 2), node)
+        assert satisfied_by_node(And(c, {"pcpus": 1}), node)
+        assert len(calls) == 3
+
+        # any change to available invalidates the results for that node
+        assert c.do_decrement(node)
+        assert not satisfied_by_node(c, node)
+        assert len(calls) == 4
+
+        excl = ExclusiveNode(assignment_id="1")
+        assert satisfied_by_node(excl, node)
+        node.assign("2")
+        assert not satisfied_by_node(excl, node)
+
+    # shared constraints are never cached
+    qres = SharedConsumableResource("qres", "queue", 100, 100)
+    cons = SharedConsumableConstraint([qres], 60)
+    assert not cons.cacheable
+    with constraint_cache():
+        assert satisfied_by_node(cons, node)
+        assert cons.do_decrement(node)
+        assert not satisfied_by_node(cons, node)
+
+
+def test_lazy_reasons() -> None:
+    node = SchedulerNode("test", {"pcpus": 2})
+    result = MinResourcePerNode("pcpus", 4).satisfied_by_node(node)
+    assert not result
+    assert isinstance(result.raw_reasons[0], Reason)
+
+    # the values are captured when the result is created, not when it is read
+    node.available["pcpus"] = 1
+    assert result.reasons == ["Resource[name=pcpus value=4] > Node[name=test value=2]"]
+    assert result.reasons is result.reasons
+
+    result = Or({"pcpus": 4}, {"blah": "A"}).satisfied_by_node(node)
+    assert result.reasons == [
+        "Resource[name=pcpus value=4] > Node[name=test value=1]",
+        "Resource[name=blah] not defined for Node[name=test hostname=test]",
+    ]
+
+    assert result.result_id == result.result_id
+
+
+def test_result_handler_types() -> None:
+    all_results = []
+    match_results = []
+    try:
+        register_result_handler(all_results.append)
+        register_result_handler(match_results.append, result_types=[MatchResult])
+        node = SchedulerNode("test", {"pcpus": 2})
+        assert node.decrement(get_constraints([{"pcpus": 1}]))
+        assert [type(r) for r in all_results] == [SatisfiedResult, MatchResult]
+        assert [type(r) for r in match_results] == [MatchResult]
+    finally:
+        unregister_all_result_handlers()
+
+    assert not node.decrement(get_constraints([{"pcpus": 4}]))
+    assert len(all_results) == 2
@@ -1,6 +1,9 @@
+from hpc.autoscale import hpctypes as ht
 from hpc.autoscale.ccbindings.mock import MockClusterBinding
 from hpc.autoscale.job.job import Job
 from hpc.autoscale.job.schedulernode import SchedulerNode
+from hpc.autoscale.node.bucket import node_from_bucket
+from hpc.autoscale.node.node import Node
 from hpc.autoscale.node.nodemanager import new_node_manager
 
 
@@ -114,3 +117,57 @@ def test_clone() -> None:
     assert new.metadata["exists_in_both"] is True
     assert new.metadata["exists_in_new"] is True
     assert "exists_in_orig" not in new.metadata
+
+
+def test_revert_changes() -> None:
+    node = SchedulerNode("lnx0", {"ncpus": 4, "mem": 8})
+    version = node._resource_version
+
+    node._record_changes()
+    job = Job("1", {"ncpus": 3})
+    assert node.decrement(job._constraints, assignment_id=job.name)
+    node.available["scratch"] = 1
+    undo_log = node._stop_recording()
+
+    # only the keys that changed are recorded
+    assert set(undo_log.keys()) == set(["ncpus", "scratch"])
+    assert node.available["ncpus"] == 1
+
+    node._revert_changes(undo_log)
+    assert node.available == {"ncpus": 4, "mem": 8}
+    assert node._resource_version > version
+
+    # nothing is recorded once stopped
+    node.available["ncpus"] = 2
+    assert node._stop_recording() == {}
+
+
+def test_available_copied_from_resources() -> None:
+    node = SchedulerNode("lnx0", {"ncpus": 4, "slots": [1, 2]})
+    node.available["ncpus"] -= 1
+    node.available["slots"].append(3)
+    assert node.available == {"ncpus": 3, "slots": [1, 2, 3]}
+    assert node.resources == {"ncpus": 4, "slots": [1, 2]}
+
+    # transient ids are generated on first use, but are stable afterwards
+    assert node.delayed_node_id.transient_id == node.delayed_node_id.transient_id
+    assert (
+        node.delayed_node_id.transient_id != node.clone().delayed_node_id.transient_id
+    )
+
+
+def test_node_slots() -> None:
+    bindings = MockClusterBinding()
+    bindings.add_nodearray("htc", {})
+    bindings.add_bucket("htc", "Standard_F4", max_count=10, available_count=10)
+    bucket = new_node_manager({"_mock_bindings": bindings}).get_buckets()[0]
+    node = node_from_bucket(
+        bucket,
+        new_node_name=ht.NodeName("htc-1"),
+        state=ht.NodeStatus("Off"),
+        target_state=ht.NodeStatus("Off"),
+        power_state=ht.NodeStatus("Off"),
+    )
+    assert type(node) is Node
+    assert not hasattr(node, "__dict__")
+    assert not hasattr(node.delayed_node_id, "__dict__")
@@ -1,3 +1,4 @@
+import threading
 from typing import Any, List
 
 import pytest
@@ -460,6 +461,60 @@ def test_default_resources() -> None:
     assert by_nodetype.get("B")[0].resources["divide_floor_vcpus"] == 5
 
 
+def test_default_resources_existing_nodes(bindings: MockClusterBinding) -> None:
+    bindings.add_node("htc-1", "htc")
+    bindings.add_node("hpc-1", "hpc")
+    node_mgr = _node_mgr(bindings)
+
+    node_mgr.add_default_resource({"node.nodearray": "htc"}, "nodetype2", "A")
+    # selection on a per-node property is still evaluated per node
+    node_mgr.add_default_resource({"node.exists": True}, "existing", True)
+    node_mgr.add_default_resource({"nodetype2": "A"}, "chained", "node.nodearray")
+
+    by_name = partition_single(node_mgr.get_nodes(), lambda n: n.name)
+    assert by_name["htc-1"].resources["nodetype2"] == "A"
+    assert by_name["htc-1"].available["nodetype2"] == "A"
+    assert by_name["htc-1"].resources["chained"] == "htc"
+    assert "nodetype2" not in by_name["hpc-1"].resources
+    assert "chained" not in by_name["hpc-1"].resources
+    assert by_name["hpc-1"].resources["existing"] is True
+
+    by_nodearray = partition_single(node_mgr.get_buckets(), lambda b: b.nodearray)
+    assert by_nodearray["htc"].resources["nodetype2"] == "A"
+    assert "existing" not in by_nodearray["htc"].resources
+
+    result = node_mgr.allocate({"nodetype2": "A"}, node_count=2)
+    assert result
+    assert all(n.nodearray == "htc" for n in result.nodes)
+
+    # nodes the caller already holds get new defaults immediately
+    htc_1 = by_name["htc-1"]
+    node_mgr.add_default_resource({"node.nodearray": "htc"}, "late", 1)
+    assert htc_1.resources["late"] == 1
+    assert htc_1.available["late"] == 1
+
+
+def test_default_resources_expression(bindings: MockClusterBinding) -> None:
+    bindings.add_node("htc-1", "htc")
+    node_mgr = _node_mgr(bindings)
+    node_mgr.add_default_resource({}, "double_pcpus", "`node.pcpu_count * 2`")
+    node_mgr.add_default_resource(
+        {}, "node_name", "`node.resources['nodetype'] + '-' + node.name`"
+    )
+
+    node = node_mgr.get_nodes()[0]
+    assert node.resources["double_pcpus"] == node.pcpu_count * 2
+    assert node.resources["node_name"] == "A-htc-1"
+
+    # expressions can not modify the node
+    with pytest.raises(AttributeError):
+        node_mgr.add_default_resource({}, "sneaky", "`node.available.clear()`")
+    assert node.available["double_pcpus"] == node.pcpu_count * 2
+
+    with pytest.raises(RuntimeError):
+        node_mgr.add_default_resource({}, "invalid", "`node.(`")
+
+
 def vmindices() -> SearchStrategy[ht.VMSize]:
     class VMIndexStrategy(SearchStrategy):
         """A strategy for providing integers in some interval with inclusive
@@ -743,6 +798,160 @@ def test_delete_internally(bindings: MockClusterBinding) -> None:
     assert len(node_mgr.get_nodes()) == 0
 
 
+def test_node_names(bindings: MockClusterBinding) -> None:
+    bindings.add_node("htc-2", "htc")
+    bindings.add_node("htc-4", "htc")
+    node_mgr = _node_mgr(bindings)
+
+    # only new, exclusive nodes, so neither htc-2, htc-4 nor the nodes
+    # allocated below can be reused
+    constraints = [{"node.nodearray": "htc", "exclusive": True}]
+
+    result = node_mgr.allocate(constraints, node_count=3, allow_existing=False)
+    assert result
+    assert [n.name for n in result.nodes] == ["htc-1", "htc-3", "htc-5"]
+
+    # names from a failed all_or_nothing allocation are handed out again
+    assert not node_mgr.allocate(
+        constraints, node_count=100, all_or_nothing=True, allow_existing=False
+    )
+    result = node_mgr.allocate(constraints, node_count=2, allow_existing=False)
+    assert result
+    assert [n.name for n in result.nodes] == ["htc-6", "htc-7"]
+
+
+def test_single_cluster_status_request(bindings: MockClusterBinding) -> None:
+    bindings.add_node("htc-1", "htc")
+    get_nodes_calls = []
+    get_nodes = bindings.get_nodes
+
+    def counting_get_nodes(*args: Any, **kwargs: Any) -> Any:
+        get_nodes_calls.append(args)
+        return get_nodes(*args, **kwargs)
+
+    bindings.get_nodes = counting_get_nodes  # type: ignore
+    node_mgr = _node_mgr(bindings)
+    # only the one made by the mock's get_cluster_status(nodes=True)
+    assert 1 == len(get_nodes_calls)
+    assert ["htc-1"] == [n.name for n in node_mgr.get_nodes()]
+    assert ["fetch", "parse", "buckets"] == list(node_mgr.timings)
+
+
+def test_nodes_partitioned_by_bucket(bindings: MockClusterBinding) -> None:
+    bindings.add_node("htc-1", "htc")
+    bindings.add_node("htc-2", "htc", placement_group="pg0")
+    bindings.add_node("hpc-1", "hpc", placement_group="pg0")
+    bindings.add_node("hpc-2", "hpc", state="Off", target_state="Off")
+    node_mgr = new_node_manager(
+        {
+            "_mock_bindings": bindings,
+            "nodearrays": {"default": {"placement_groups": ["pg0"]}},
+        }
+    )
+
+    actual = {}
+    for bucket in node_mgr.get_buckets():
+        actual[(bucket.nodearray, bucket.placement_group)] = [
+            n.name for n in bucket.nodes
+        ]
+
+    # the old per bucket filter over the raw cluster status records
+    records = bindings.get_cluster_status(nodes=True).nodes
+    expected = {}
+    for bucket in node_mgr.get_buckets():
+        expected[(bucket.nodearray, bucket.placement_group)] = [
+            n["Name"]
+            for n in records
+            if n["Template"] == bucket.nodearray
+            and n["MachineType"] == bucket.vm_size
+            and (n["TargetState"] == "Started" or n["Status"] == "Deallocated")
+            and n.get("PlacementGroupId") == bucket.placement_group
+        ]
+
+    assert actual == expected
+    # the mock always reports TargetState=Started, so hpc-2 is kept even
+    # though it is Off.
+    assert actual == {
+        ("htc", None): ["htc-1"],
+        ("htc", "pg0"): ["htc-2"],
+        ("hpc", None): ["hpc-2"],
+        ("hpc", "pg0"): ["hpc-1"],
+    }
+
+
+def test_chunked_bootup(bindings: MockClusterBinding) -> None:
+    node_mgr = _node_mgr(bindings)
+    node_mgr.max_batch_size = 2
+    node_mgr.max_workers = 1
+    assert node_mgr.allocate({"node.nodearray": "htc"}, node_count=5)
+
+    create_calls = []
+    create_nodes = bindings.create_nodes
+
+    def failing_create_nodes(nodes: List[Node], request_id: Any = None) -> Any:
+        create_calls.append((len(nodes), request_id))
+        if len(create_calls) == 2:
+            raise RuntimeError("boom")
+        return create_nodes(nodes, request_id=request_id)
+
+    bindings.create_nodes = failing_create_nodes  # type: ignore
+    result = node_mgr.bootup(request_id_create="req")
+
+    assert [(2, "req"), (2, "req-1"), (1, "req-2")] == create_calls
+    assert ["req", "req-1", "req-2"] == result.request_ids
+    # the failed chunk is reported, the rest still boot
+    assert result
+    assert 3 == len(result.nodes)
+    assert 2 == len(result.operation_id.split(","))
+    assert 1 == len(result.reasons) and "boom" in result.reasons[0]
+
+    # if every chunk fails, so does bootup
+    def always_failing_create_nodes(nodes: List[Node], request_id: Any = None) -> Any:
+        raise RuntimeError("boom")
+
+    bindings.create_nodes = always_failing_create_nodes  # type: ignore
+    with pytest.raises(RuntimeError):
+        node_mgr.bootup()
+
+
+def test_bootup_default_config(bindings: MockClusterBinding) -> None:
+    # no max_batch_size, so start and then create, and errors are raised
+    node_mgr = _node_mgr(bindings)
+    result = node_mgr.allocate({"node.nodearray": "htc"}, node_count=3)
+    assert result
+    nodes = result.nodes
+    nodes[0].target_state = ht.NodeStatus("Deallocated")
+
+    calls = []
+
+    def start_nodes(nodes: List[Node], request_id: Any = None) -> Any:
+        calls.append(("start_nodes", len(nodes), threading.current_thread()))
+        # never read, as bootup raises once create_nodes fails
+        return None
+
+    def failing_create_nodes(nodes: List[Node], request_id: Any = None) -> Any:
+        calls.append(("create_nodes", len(nodes), threading.current_thread()))
+        raise RuntimeError("boom")
+
+    bindings.start_nodes = start_nodes  # type: ignore
+    bindings.create_nodes = failing_create_nodes  # type: ignore
+
+    with pytest.raises(RuntimeError):
+        node_mgr.bootup(nodes)
+
+    main_thread = threading.current_thread()
+    assert [
+        ("start_nodes", 1, main_thread),
+        ("create_nodes", 2, main_thread),
+    ] == calls
+
+    # when split into chunks, every create_nodes chunk failing still fails,
+    # even though start_nodes succeeded.
+    node_mgr.max_batch_size = 1
+    with pytest.raises(RuntimeError):
+        node_mgr.bootup(nodes)
+
+
 def test_node_resources_alias(node_mgr: NodeManager) -> None:
     node_mgr.add_default_resource({}, "memgb_alias", "node.resources.memgb")
     b = node_mgr.get_buckets()[0]
@@ -762,16 +971,16 @@ def test_unmanaged_nodes(node_mgr: NodeManager) -> None:
     tux = SchedulerNode("tux", bucket_id=ht.BucketId("tuxid"))
     node_mgr.add_unmanaged_nodes([tux])
     assert len(node_mgr.get_buckets()) == 3
-    assert node_mgr.get_buckets_by_id()[tux.bucket_id].nodes == [tux]
+    assert node_mgr.get_buckets_by_id()[tux.bucket_id].nodes == (tux,)
 
     tux2 = SchedulerNode("tux2", bucket_id=tux.bucket_id)
     node_mgr.add_unmanaged_nodes([tux2])
     assert len(node_mgr.get_buckets()) == 3
-    assert node_mgr.get_buckets_by_id()[tux.bucket_id].nodes == [tux, tux2]
+    assert node_mgr.get_buckets_by_id()[tux.bucket_id].nodes == (tux, tux2)
 
     node_mgr.add_unmanaged_nodes([tux, tux2])
     assert len(node_mgr.get_buckets()) == 3
-    assert node_mgr.get_buckets_by_id()[tux.bucket_id].nodes == [tux, tux2]
+    assert node_mgr.get_buckets_by_id()[tux.bucket_id].nodes == (tux, tux2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,311 @@
+"""
+Micro-benchmarks for the hot paths of scalelib.
+
+    python util/benchmark.py allocate --sizes 1000 2000 4000 8000 --jobs 2000
+    python util/benchmark.py defaults --nodes 10000
+    python util/benchmark.py nodehistory --rows 100000 --backend sqlite memory
+    python util/benchmark.py vmsizes --format json catalog
+    python util/benchmark.py memory --nodes 1000 10000 100000
+
+Each subcommand prints one line per measurement so results can be compared
+between revisions.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from immutabledict import ImmutableOrderedDict
+
+from hpc.autoscale import hpctypes as ht
+from hpc.autoscale.ccbindings.mock import MockClusterBinding
+from hpc.autoscale.node.nodehistory import (
+    MemoryNodeHistory,
+    NodeHistory,
+    SQLiteNodeHistory,
+)
+from hpc.autoscale.node import vm_sizes
+from hpc.autoscale.node.delayednodeid import DelayedNodeId
+from hpc.autoscale.node.node import Node
+from hpc.autoscale.node.nodemanager import NodeManager, new_node_manager
+
+
+def _timed(func: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _mock_node_manager(
+    existing_nodes: int, vm_size: str = "Standard_F4"
+) -> NodeManager:
+    bindings = MockClusterBinding()
+    # ncpus defaults to node.vcpu_count
+    bindings.add_nodearray("hpc", {}, max_count=10 ** 7)
+    total = existing_nodes * 2
+    bindings.add_bucket(
+        "hpc",
+        vm_size,
+        max_count=total,
+        available_count=total,
+        family_quota_count=total,
+        family_quota_core_count=total * 64,
+        regional_quota_count=total,
+        regional_quota_core_count=total * 64,
+    )
+    for i in range(existing_nodes):
+        bindings.add_node(
+            ht.NodeName("hpc-{}".format(i + 1)), "hpc", state=ht.NodeStatus("Ready")
+        )
+    bindings.max_count = total
+    bindings.max_core_count = total * 64
+    return new_node_manager({"_mock_bindings": bindings})
+
+
+def bench_allocate(args: argparse.Namespace) -> None:
+    """
+    Allocation cost per job as the number of existing nodes in a bucket grows.
+    With the per-bucket free-capacity index this should stay roughly flat.
+    """
+    print("{:>10} {:>10} {:>14}".format("nodes", "jobs", "usec/job"))
+    for size in args.sizes:
+        node_mgr = _mock_node_manager(size)
+
+        def run() -> None:
+            for _ in range(args.jobs):
+                result = node_mgr.allocate({"ncpus": 1}, slot_count=1)
+                assert result, str(result)
+
+        elapsed = _timed(run)
+        print(
+            "{:>10} {:>10} {:>14.1f}".format(
+                size, args.jobs, elapsed / args.jobs * 1_000_000
+            )
+        )
+
+
+def bench_defaults(args: argparse.Namespace) -> None:
+    """
+    Cost of applying a `backtick` default resource expression to every node.
+    """
+    print("{:>10} {:>14} {:>14}".format("nodes", "total sec", "usec/node"))
+    node_mgr = _mock_node_manager(args.nodes)
+    node_mgr.get_nodes()
+
+    # applied to every node that already exists as soon as it is added
+    elapsed = _timed(
+        lambda: node_mgr.add_default_resource(
+            {}, "double_vcpus", "`node.vcpu_count * 2 + node.resources['ncpus']`"
+        )
+    )
+    assert node_mgr.get_nodes()[0].resources["double_vcpus"]
+    print(
+        "{:>10} {:>14.3f} {:>14.1f}".format(
+            args.nodes, elapsed, elapsed / args.nodes * 1_000_000
+        )
+    )
+
+
+def bench_nodehistory(args: argparse.Namespace) -> None:
+    """
+    Cost of the NodeHistory calls made on every autoscale iteration with
+    a large history table.
+    """
+    nodes = _mock_node_manager(args.rows).get_nodes()
+    print("{:>10} {:>16} {:>10} {:>10}".format("backend", "call", "rows", "sec"))
+    for backend in args.backend:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "nodehistory.db")
+            history: NodeHistory
+            if backend == "memory":
+                history = MemoryNodeHistory(path, snapshot_interval=0)
+            else:
+                history = SQLiteNodeHistory(path)
+            history.update(nodes)
+            # retire half of the nodes, so that there are deleted rows as well.
+            history.update(nodes[: len(nodes) // 2])
+            live_nodes = nodes[: len(nodes) // 2]
+
+            measurements = [
+                ("update", lambda: history.update(live_nodes)),
+                ("find_unmatched", lambda: history.find_unmatched()),
+                ("find_booting", lambda: history.find_booting()),
+                ("decorate", lambda: history.decorate(live_nodes)),
+            ]
+            if isinstance(history, MemoryNodeHistory):
+                measurements.append(("snapshot", history.close))
+
+            for name, func in measurements:
+                print(
+                    "{:>10} {:>16} {:>10} {:>10.3f}".format(
+                        backend, name, args.rows, _timed(func)
+                    )
+                )
+            if isinstance(history, SQLiteNodeHistory):
+                history.conn.close()
+
+
+def _new_node(index: int) -> Node:
+    name = ht.NodeName("hpc-{}".format(index))
+    return Node(
+        node_id=DelayedNodeId(name, node_id=ht.NodeId("node-id-{}".format(index))),
+        name=name,
+        nodearray=ht.NodeArrayName("hpc"),
+        bucket_id=ht.BucketId("hpc-bucket"),
+        hostname=ht.Hostname("ip-{:08x}".format(index)),
+        private_ip=None,
+        instance_id=None,
+        vm_size=ht.VMSize("Standard_F4"),
+        location=ht.Location("eastus"),
+        spot=False,
+        vcpu_count=4,
+        memory=ht.Memory(8, "g"),
+        infiniband=False,
+        state=ht.NodeStatus("Ready"),
+        target_state=ht.NodeStatus("Started"),
+        power_state=ht.NodeStatus("on"),
+        exists=True,
+        placement_group=None,
+        managed=True,
+        resources=ht.ResourceDict(
+            {"ncpus": 4, "mem": ht.Memory(8, "g"), "slot_type": "hpc"}
+        ),
+        software_configuration=ImmutableOrderedDict({}),
+        keep_alive=False,
+    )
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    """
+    Memory used per Node, before and after their available resources are
+    first modified.
+    """
+    print(
+        "{:>10} {:>12} {:>14} {:>16}".format(
+            "nodes", "MB", "bytes/node", "bytes/node used"
+        )
+    )
+    for count in args.nodes:
+        tracemalloc.start()
+        try:
+            nodes = [_new_node(i) for i in range(count)]
+            created = tracemalloc.get_traced_memory()[0]
+            for node in nodes:
+                node.available["ncpus"] -= 1
+            used = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        print(
+            "{:>10} {:>12.1f} {:>14} {:>16}".format(
+                count, created / 1024 ** 2, created // count, used // count
+            )
+        )
+        del nodes
+
+
+_VM_SIZES_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from hpc.autoscale.node import vm_sizes
+from hpc.autoscale.node.delayednodeid import DelayedNodeId
+from hpc.autoscale.node.node import Node
+imported = time.perf_counter()
+vm_sizes.RESOURCE_FILE, vm_sizes.CATALOG_FILE = sys.argv[1], sys.argv[2]
+vm_sizes.get_aux_vm_size_info(sys.argv[3], sys.argv[4])
+first = time.perf_counter()
+vm_sizes.get_aux_vm_size_info(sys.argv[3], sys.argv[4] + "_unknown")
+vm_sizes.get_aux_vm_size_info(sys.argv[3], sys.argv[4] + "_unknown")
+unknown = time.perf_counter()
+print(json.dumps([imported - start, first - imported, unknown - first]))
+"""
+
+
+def bench_vmsizes(args: argparse.Namespace) -> None:
+    """
+    Import and first lookup latency of vm_sizes, each in a fresh interpreter,
+    for the json resource file and the compact catalog.
+    """
+    if not os.path.exists(args.vm_sizes_json):
+        print("{} does not exist".format(args.vm_sizes_json), file=sys.stderr)
+        sys.exit(1)
+
+    print(
+        "{:>10} {:>12} {:>14} {:>16}".format(
+            "format", "import ms", "first get ms", "2x unknown ms"
+        )
+    )
+    with tempfile.TemporaryDirectory() as tempdir:
+        catalog_path = os.path.join(tempdir, "vm_sizes.catalog")
+        with open(args.vm_sizes_json) as fr:
+            vm_sizes.write_catalog(json.load(fr), catalog_path)
+
+        for fmt in args.format:
+            # a missing catalog falls back to the json file
+            paths = [args.vm_sizes_json, catalog_path]
+            if fmt == "json":
+                paths[1] = os.path.join(tempdir, "missing.catalog")
+            output = subprocess.check_output(
+                [sys.executable, "-c", _VM_SIZES_SCRIPT]
+                + paths
+                + [args.location, args.vm_size],
+            )
+            timings = json.loads(output.decode().splitlines()[-1])
+            print(
+                "{:>10} {:>12.2f} {:>14.2f} {:>16.3f}".format(
+                    fmt, *[t * 1000 for t in timings]
+                )
+            )
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="cmd")
+    subparsers.required = True
+    benchmarks: Dict[str, Callable[[argparse.Namespace], None]] = {}
+
+    allocate_parser = subparsers.add_parser("allocate", help=bench_allocate.__doc__)
+    allocate_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000]
+    )
+    allocate_parser.add_argument("--jobs", type=int, default=2000)
+    benchmarks["allocate"] = bench_allocate
+
+    defaults_parser = subparsers.add_parser("defaults", help=bench_defaults.__doc__)
+    defaults_parser.add_argument("--nodes", type=int, default=10000)
+    benchmarks["defaults"] = bench_defaults
+
+    history_parser = subparsers.add_parser(
+        "nodehistory", help=bench_nodehistory.__doc__
+    )
+    history_parser.add_argument("--rows", type=int, default=100000)
+    history_parser.add_argument(
+        "--backend", nargs="+", choices=["sqlite", "memory"], default=["sqlite"]
+    )
+    benchmarks["nodehistory"] = bench_nodehistory
+
+    vmsizes_parser = subparsers.add_parser("vmsizes", help=bench_vmsizes.__doc__)
+    vmsizes_parser.add_argument(
+        "--format", nargs="+", choices=["json", "catalog"], default=["json", "catalog"]
+    )
+    vmsizes_parser.add_argument("--vm-sizes-json", default=vm_sizes.RESOURCE_FILE)
+    vmsizes_parser.add_argument("--location", default="eastus")
+    vmsizes_parser.add_argument("--vm-size", default="Standard_F4")
+    benchmarks["vmsizes"] = bench_vmsizes
+
+    memory_parser = subparsers.add_parser("memory", help=bench_memory.__doc__)
+    memory_parser.add_argument(
+        "--nodes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    benchmarks["memory"] = bench_memory
+
+    args = parser.parse_args(argv)
+    benchmarks[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
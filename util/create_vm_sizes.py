@@ -5,7 +5,7 @@ from shutil import which
 from subprocess import check_output
 from typing import Dict, Optional
 
-from hpc.autoscale.node.vm_sizes import AuxVMSizeInfo
+from hpc.autoscale.node.vm_sizes import AuxVMSizeInfo, write_catalog
 from hpc.autoscale.util import partition, partition_single
 
 
@@ -146,6 +146,8 @@ def create_vm_sizes(cache_path: Optional[str] = None) -> None:
     with open("new_vm_sizes.json", "w") as fw:
         json.dump(final_vm_sizes, fw, indent=2)
 
+    write_catalog(final_vm_sizes, "new_vm_sizes.catalog")
+
     with open("../src/hpc/autoscale/node/vm_sizes.json") as fr:
         old_data = json.load(fr)
 
@@ -174,11 +176,28 @@ def create_vm_sizes(cache_path: Optional[str] = None) -> None:
             print("INFO: New SKUs for location", location, ":", ",".join(new_skus))
 
     print(
-        "Copy ./new_vm_sizes.json to ./src/hpc/autoscale/node/vm_sizes.json to complete the creation."
+        "Copy ./new_vm_sizes.json and ./new_vm_sizes.catalog to ./src/hpc/autoscale/node/vm_sizes.json"
+        + " and ./src/hpc/autoscale/node/vm_sizes.catalog to complete the creation."
+    )
+
+
+def create_catalog(vm_sizes_path: str) -> None:
+    """
+    Only regenerate the compact catalog from an existing vm_sizes.json
+    """
+    with open(vm_sizes_path) as fr:
+        vm_sizes = json.load(fr)
+    write_catalog(vm_sizes, "new_vm_sizes.catalog")
+    print(
+        "Copy ./new_vm_sizes.catalog to ./src/hpc/autoscale/node/vm_sizes.catalog to complete the creation."
     )
 
 
 if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--catalog-only":
+        create_catalog(sys.argv[2])
+        sys.exit(0)
+
     cache_path = None
     if len(sys.argv) == 2:
         cache_path = sys.argv[1]